@@ -0,0 +1,98 @@
+"""
+レスポンスヘッダーの生成にかかる時間を、1レスポンスあたりで計測する
+従来の文字列連結による生成と、HeaderSerializerによる生成を比較する
+
+python benchmarks/headers_bench.py [-n 回数]
+"""
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+
+from common.http.cookie import Cookie
+from common.http.headers import HeaderSerializer, reason_phrase
+from common.http.response import HTTPResponse
+
+
+def legacy_build_header(response: HTTPResponse, keep_alive: bool) -> bytes:
+    """
+    レスポンスごとに日時を整形し、ヘッダーを文字列連結で組み立てる従来の方式
+    """
+    reason = reason_phrase(response.status_code)
+    header = (
+        f"HTTP/1.1 {response.status_code} {reason}\r\n"
+        f"Date: {datetime.utcnow().strftime('%a, %d %b %Y %H:%M:%S GMT')}\r\n"
+        "Server: DemoServer\r\n"
+    )
+    header += (
+        f"Content-Length: {response.content_length}\r\n"
+        f"Content-Type: {response.content_type}\r\n"
+    )
+    if keep_alive:
+        header += (
+            "Connection: keep-alive\r\n"
+            "Keep-Alive: timeout=5\r\n"
+        )
+    else:
+        header += "Connection: close\r\n"
+    for header_name, header_value in response.headers.items():
+        header += f"{header_name}: {header_value}\r\n"
+    for cookie in response.cookies:
+        base_cookie_header = f"Set-Cookie: {cookie.name}={cookie.value}"
+        if cookie.max_age is not None:
+            base_cookie_header += f"; Max-Age={cookie.max_age}"
+        if cookie.path:
+            base_cookie_header += f"; Path={cookie.path}"
+        if cookie.http_only:
+            base_cookie_header += "; HttpOnly"
+        header += base_cookie_header + "\r\n"
+    return (header + "\r\n").encode()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--number", type=int, default=200000, help="計測する回数")
+    args = parser.parse_args()
+
+    serializer = HeaderSerializer(keep_alive_timeout=5)
+    cases = {
+        "plain": HTTPResponse(content_type="text/html; charset=utf-8", body=b"x" * 512),
+        "headers+cookies": HTTPResponse(
+            headers={"Vary": "Accept-Encoding", "Cache-Control": "no-cache"},
+            cookies=[
+                Cookie(name="username", value="TARO", max_age=30, path="/", http_only=True),
+                Cookie(name="email", value="taro@example.com", max_age=30),
+            ],
+            content_type="text/html; charset=utf-8",
+            body=b"x" * 512,
+        ),
+    }
+
+    print(f"{'case':<18}{'legacy':>12}{'serializer':>14}{'speedup':>10}")
+    for name, response in cases.items():
+        legacy = timeit.timeit(lambda: legacy_build_header(response, True), number=args.number)
+        current = timeit.timeit(
+            lambda: serializer.serialize(
+                response.status_code,
+                response.headers,
+                response.cookies,
+                content_length=response.content_length,
+                content_type=response.content_type,
+                keep_alive=True,
+            ),
+            number=args.number,
+        )
+        print(
+            f"{name:<18}"
+            f"{legacy / args.number * 1e9:>9.0f} ns"
+            f"{current / args.number * 1e9:>11.0f} ns"
+            f"{legacy / current:>9.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+"""
+HTTPサーバへリクエストを繰り返し送信し、スループットとレイテンシを計測する
+
+python benchmarks/loadgen.py --path /now -c 16 -d 10
+python benchmarks/loadgen.py --file client_send.txt --close -n 1000
+python benchmarks/loadgen.py --jsonl logs/access.log --rate 500
+
+--jsonlには、1行に{"method", "path", "headers", "body"}を持つJSONを書いたファイルを渡す
+ACCESS_LOG_FORMAT = "jsonl"で記録したアクセスログもそのまま再生できる (ACCESS_LOG_CAPTURE_HEADで記録したヘッダーがあれば、それを送る)
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tcpclient import TCPClient
+
+
+class BenchClient(TCPClient):
+    """
+    1本の接続でリクエストを送り、レスポンスを最後まで読み込むクライアント
+    keep-aliveの場合は接続を使い回し、サーバが閉じた場合は接続し直す
+    """
+    timeout: float
+
+    def __init__(self, host: str, port: int, timeout: float):
+        super().__init__(host, port)
+        self.timeout = timeout
+        self.client_socket: Optional[socket.socket] = None
+        self._buffer = bytearray()
+
+    def round_trip(self, raw: bytes) -> Tuple[int, int]:
+        """
+        リクエストを送り、(ステータスコード, 受信したバイト数)を返却する
+        """
+        reused = self.client_socket is not None
+        try:
+            return self._round_trip(raw)
+        except ConnectionError:
+            if not reused:
+                raise
+        # keep-aliveを宣言しないまま接続を閉じるサーバもあるため、使い回した接続で失敗した場合は1回だけ接続し直す
+        self.close()
+        return self._round_trip(raw)
+
+    def _round_trip(self, raw: bytes) -> Tuple[int, int]:
+        if self.client_socket is None:
+            self.client_socket = self.connect(self.timeout)
+            self._buffer.clear()
+        self.client_socket.sendall(raw)
+        status_code, received, keep_open = self._read_response(raw.startswith(b"HEAD "))
+        if not keep_open:
+            self.close()
+        return status_code, received
+
+    def close(self):
+        """
+        接続を閉じる
+        """
+        if self.client_socket is not None:
+            self.client_socket.close()
+            self.client_socket = None
+
+    def _read_response(self, head_only: bool) -> Tuple[int, int, bool]:
+        """
+        レスポンスを1つ読み込み、(ステータスコード, バイト数, 接続を使い続けられるか)を返却する
+        """
+        header_end = self._read_until(b"\r\n\r\n")
+        head = bytes(self._buffer[:header_end])
+        del self._buffer[:header_end + 4]
+
+        status_line, _, header_lines = head.partition(b"\r\n")
+        version, status_code = status_line.split(b" ", 2)[:2]
+        status_code = int(status_code)
+        headers = {}
+        for line in header_lines.split(b"\r\n"):
+            name, _, value = line.partition(b":")
+            headers[name.strip().lower()] = value.strip().lower()
+
+        keep_open = headers.get(b"connection") != b"close" and version == b"HTTP/1.1"
+        received = header_end + 4
+        if head_only or status_code == 304 or 100 <= status_code < 200 or status_code == 204:
+            return status_code, received, keep_open
+
+        if b"content-length" in headers:
+            length = int(headers[b"content-length"])
+            self._read_exactly(length)
+            del self._buffer[:length]
+            received += length
+        elif headers.get(b"transfer-encoding") == b"chunked":
+            while True:
+                line_end = self._read_until(b"\r\n")
+                size = int(bytes(self._buffer[:line_end]).split(b";")[0], 16)
+                del self._buffer[:line_end + 2]
+                self._read_exactly(size + 2)
+                del self._buffer[:size + 2]
+                received += size
+                if size == 0:
+                    break
+        else:
+            # 長さの指定がない場合は、サーバが接続を閉じるまでがボディ
+            while self._recv():
+                pass
+            received += len(self._buffer)
+            self._buffer.clear()
+            keep_open = False
+        return status_code, received, keep_open
+
+    def _read_until(self, delimiter: bytes) -> int:
+        """
+        区切り文字が届くまで受信し、その位置を返却する
+        """
+        start = 0
+        while True:
+            index = self._buffer.find(delimiter, start)
+            if index >= 0:
+                return index
+            start = max(0, len(self._buffer) - len(delimiter) + 1)
+            if not self._recv():
+                raise ConnectionError("connection closed before the response was complete")
+
+    def _read_exactly(self, size: int):
+        """
+        バッファにsizeバイト以上たまるまで受信する
+        """
+        while len(self._buffer) < size:
+            if not self._recv():
+                raise ConnectionError("connection closed before the response was complete")
+
+    def _recv(self) -> int:
+        data = self.client_socket.recv(65536)
+        self._buffer += data
+        return len(data)
+
+
+class BenchResult:
+    """
+    計測結果
+    errorsは、接続や受信に失敗したリクエストと、2xx以外のレスポンスの数
+    """
+
+    def __init__(self, latencies: List[float], errors: int, elapsed: float, received: int, status_codes: Counter):
+        self.latencies = sorted(latencies)
+        self.errors = errors
+        self.elapsed = elapsed
+        self.received = received
+        self.status_codes = status_codes
+
+    def percentile(self, p: float) -> float:
+        """
+        レイテンシのpパーセンタイル (秒)
+        """
+        if not self.latencies:
+            return 0.0
+        index = min(len(self.latencies) - 1, max(0, int(round(p / 100 * len(self.latencies))) - 1))
+        return self.latencies[index]
+
+    def to_dict(self) -> dict:
+        """
+        JSONに書き出せる形式にする
+        """
+        completed = len(self.latencies)
+        return {
+            "requests": completed,
+            "errors": self.errors,
+            "elapsed": round(self.elapsed, 3),
+            "rps": round(completed / self.elapsed, 1) if self.elapsed else 0.0,
+            "bytes_per_sec": round(self.received / self.elapsed) if self.elapsed else 0,
+            "latency_ms": {
+                "mean": round(sum(self.latencies) / completed * 1000, 3) if completed else 0.0,
+                "p50": round(self.percentile(50) * 1000, 3),
+                "p95": round(self.percentile(95) * 1000, 3),
+                "p99": round(self.percentile(99) * 1000, 3),
+                "max": round(self.latencies[-1] * 1000, 3) if completed else 0.0,
+            },
+            "status_codes": {str(code): count for code, count in sorted(self.status_codes.items())},
+        }
+
+    def report(self) -> str:
+        """
+        人が読む形式の計測結果
+        """
+        result = self.to_dict()
+        latency = result["latency_ms"]
+        return (
+            f"requests      {result['requests']} ({result['errors']} errors) in {result['elapsed']}s\n"
+            f"throughput    {result['rps']} req/s, {result['bytes_per_sec'] / 1024:.1f} KiB/s\n"
+            f"latency (ms)  mean {latency['mean']}  p50 {latency['p50']}  p95 {latency['p95']}"
+            f"  p99 {latency['p99']}  max {latency['max']}\n"
+            f"status codes  {result['status_codes']}"
+        )
+
+
+class LoadGenerator:
+    """
+    concurrency本の接続から、並行してリクエストを送り続ける
+    rateを指定した場合は、各接続が決まった時刻にリクエストを送り、遅れた分も待ち時間としてレイテンシに含める
+    """
+
+    def __init__(
+            self,
+            host: str,
+            port: int,
+            requests: List[bytes],
+            concurrency: int = 8,
+            duration: Optional[float] = 10.0,
+            total: Optional[int] = None,
+            rate: Optional[float] = None,
+            timeout: float = 10.0,
+    ):
+        self.host = host
+        self.port = port
+        self.requests = requests
+        self.concurrency = concurrency
+        self.duration = duration
+        self.total = total
+        self.rate = rate
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._issued = 0
+        self._latencies: List[float] = []
+        self._errors = 0
+        self._received = 0
+        self._status_codes: Counter = Counter()
+
+    def run(self) -> BenchResult:
+        """
+        計測を実行して結果を返却する
+        """
+        started = time.perf_counter()
+        deadline = started + self.duration if self.duration else None
+        threads = [
+            threading.Thread(target=self._worker, args=(index, started, deadline), daemon=True)
+            for index in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return BenchResult(self._latencies, self._errors, elapsed, self._received, self._status_codes)
+
+    def _next(self) -> Optional[int]:
+        """
+        次に送るリクエストの通し番号を返却する。totalに達したらNone
+        """
+        with self._lock:
+            if self.total is not None and self._issued >= self.total:
+                return None
+            number = self._issued
+            self._issued += 1
+            return number
+
+    def _worker(self, index: int, started: float, deadline: Optional[float]):
+        client = BenchClient(self.host, self.port, self.timeout)
+        interval = self.concurrency / self.rate if self.rate else 0.0
+        scheduled = started + interval * index / self.concurrency
+        latencies = []
+        errors = 0
+        received = 0
+        status_codes = Counter()
+        try:
+            while True:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+                number = self._next()
+                if number is None:
+                    break
+
+                if interval:
+                    wait = scheduled - time.perf_counter()
+                    if wait > 0:
+                        time.sleep(wait)
+                    request_started = scheduled
+                    scheduled += interval
+                else:
+                    request_started = time.perf_counter()
+
+                try:
+                    status_code, size = client.round_trip(self.requests[number % len(self.requests)])
+                except (OSError, ValueError):
+                    errors += 1
+                    client.close()
+                    continue
+                latencies.append(time.perf_counter() - request_started)
+                received += size
+                status_codes[status_code] += 1
+                if not 200 <= status_code < 300:
+                    # 429や503で断られたリクエストも、成功として数えない
+                    errors += 1
+        finally:
+            client.close()
+            with self._lock:
+                self._latencies.extend(latencies)
+                self._errors += errors
+                self._received += received
+                self._status_codes.update(status_codes)
+
+
+def build_request(
+        method: str,
+        path: str,
+        host: str,
+        keep_alive: bool,
+        headers: dict = None,
+        body: bytes = b"",
+) -> bytes:
+    """
+    リクエストのバイト列を組み立てる
+    """
+    lines = [f"{method} {path} HTTP/1.1", f"Host: {host}"]
+    for name, value in (headers or {}).items():
+        if name.lower() not in ("host", "connection", "content-length"):
+            lines.append(f"{name}: {value}")
+    lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+    if body:
+        lines.append(f"Content-Length: {len(body)}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode() + body
+
+
+def set_connection(raw: bytes, keep_alive: bool) -> bytes:
+    """
+    ファイルから読み込んだリクエストのConnectionヘッダーを、計測の設定に合わせて書き換える
+    """
+    head, separator, body = raw.partition(b"\r\n\r\n")
+    if not separator:
+        # 改行がLFだけのファイルも受け付ける
+        head, _, body = raw.partition(b"\n\n")
+        head = head.replace(b"\n", b"\r\n")
+    lines = [line for line in head.split(b"\r\n") if not line.lower().startswith(b"connection:")]
+    lines.append(b"Connection: keep-alive" if keep_alive else b"Connection: close")
+    return b"\r\n".join(lines) + b"\r\n\r\n" + body
+
+
+def load_requests(args: argparse.Namespace) -> List[bytes]:
+    """
+    コマンドライン引数から、送信するリクエストの一覧を作る
+    """
+    keep_alive = not args.close
+    host = f"{args.host}:{args.port}"
+    requests = [build_request(args.method, path, host, keep_alive) for path in args.path]
+
+    for file in args.file:
+        with open(file, "rb") as f:
+            requests.append(set_connection(f.read(), keep_alive))
+
+    for file in args.jsonl:
+        with open(file, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                if entry.get("head"):
+                    raw = entry["head"].encode("latin-1") + entry.get("body", "").encode()
+                    requests.append(set_connection(raw, keep_alive))
+                    continue
+                requests.append(build_request(
+                    entry.get("method", "GET"),
+                    entry["path"],
+                    host,
+                    keep_alive,
+                    headers=entry.get("headers"),
+                    body=entry.get("body", "").encode(),
+                ))
+
+    if not requests:
+        requests.append(build_request(args.method, "/", host, keep_alive))
+    return requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTPサーバの負荷試験")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--path", action="append", default=[], help="リクエストするpath (複数指定可)")
+    parser.add_argument("--method", default="GET")
+    parser.add_argument("--file", action="append", default=[], help="そのまま送るリクエストのファイル (client_send.txtなど)")
+    parser.add_argument("--jsonl", action="append", default=[], help="1行に1リクエストを書いたJSONLファイル")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="同時に張る接続の数")
+    parser.add_argument("-d", "--duration", type=float, default=10.0, help="計測する秒数")
+    parser.add_argument("-n", "--requests", type=int, default=None, help="送るリクエストの総数 (指定した場合は--durationより優先)")
+    parser.add_argument("--rate", type=float, default=None, help="全体で1秒あたりに送るリクエストの数 (省略時は応答が返り次第送る)")
+    parser.add_argument("--close", action="store_true", help="keep-aliveを使わず、リクエストごとに接続する")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--json", help="結果をJSONで書き出すファイル")
+    args = parser.parse_args()
+
+    generator = LoadGenerator(
+        args.host,
+        args.port,
+        load_requests(args),
+        concurrency=args.concurrency,
+        duration=None if args.requests else args.duration,
+        total=args.requests,
+        rate=args.rate,
+        timeout=args.timeout,
+    )
+    result = generator.run()
+    print(result.report())
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result.to_dict(), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+リクエストのパースにかかる時間を、実際のリクエストに近いヘッダーで計測する
+従来の文字列分割によるパーサーと、バイト列の位置だけを記録するparse_requestを比較する
+どちらもパースの後、ボディの長さの判定と、サーバが参照するヘッダーの取得までを1リクエストとする
+
+python benchmarks/parser_bench.py [-n 回数]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+
+from common.server.parser import parse_request
+from common.server.reader import RequestReader
+
+# 1リクエストの処理中に、サーバが参照するヘッダー
+# (keep-aliveの判定, 圧縮の選択, アクセスログ)
+SERVER_HEADERS = ("Connection", "Accept-Encoding", "Referer", "User-Agent")
+
+CASES = {
+    # ブラウザからのページ遷移 (Cookieを含む)
+    "browser": (
+        b"GET /user/1/profile?tab=posts&page=2 HTTP/1.1\r\n"
+        b"Host: localhost:8080\r\n"
+        b"Connection: keep-alive\r\n"
+        b"Cache-Control: max-age=0\r\n"
+        b'sec-ch-ua: "Chromium";v="118", "Google Chrome";v="118", "Not=A?Brand";v="99"\r\n'
+        b"sec-ch-ua-mobile: ?0\r\n"
+        b'sec-ch-ua-platform: "macOS"\r\n'
+        b"Upgrade-Insecure-Requests: 1\r\n"
+        b"User-Agent: Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 "
+        b"(KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36\r\n"
+        b"Accept: text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,"
+        b"image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7\r\n"
+        b"Sec-Fetch-Site: same-origin\r\n"
+        b"Sec-Fetch-Mode: navigate\r\n"
+        b"Sec-Fetch-User: ?1\r\n"
+        b"Sec-Fetch-Dest: document\r\n"
+        b"Referer: http://localhost:8080/welcome\r\n"
+        b"Accept-Encoding: gzip, deflate, br\r\n"
+        b"Accept-Language: ja,en-US;q=0.9,en;q=0.8\r\n"
+        b"Cookie: username=TARO; email=taro@example.com; _ga=GA1.1.123456789.1697000000; theme=dark\r\n"
+        b"\r\n"
+    ),
+    # curlなどのコマンドラインからのリクエスト
+    "curl": (
+        b"GET /now HTTP/1.1\r\n"
+        b"Host: localhost:8080\r\n"
+        b"User-Agent: curl/8.4.0\r\n"
+        b"Accept: */*\r\n"
+        b"\r\n"
+    ),
+    # フォームの送信
+    "form": (
+        b"POST /parameters HTTP/1.1\r\n"
+        b"Host: localhost:8080\r\n"
+        b"Connection: keep-alive\r\n"
+        b"Content-Length: 43\r\n"
+        b"Cache-Control: max-age=0\r\n"
+        b"Origin: http://localhost:8080\r\n"
+        b"Content-Type: application/x-www-form-urlencoded\r\n"
+        b"User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/119.0\r\n"
+        b"Accept: text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8\r\n"
+        b"Referer: http://localhost:8080/form\r\n"
+        b"Accept-Encoding: gzip, deflate\r\n"
+        b"Accept-Language: ja,en-US;q=0.7,en;q=0.3\r\n"
+        b"Cookie: username=TARO; email=taro@example.com\r\n"
+        b"\r\n"
+    ),
+}
+
+
+class LegacyRequest:
+    """
+    従来のHTTPRequest (ヘッダーは文字列の辞書)
+    """
+
+    def __init__(self, path, method, http_version, headers, cookies, body, params=None):
+        self.path = path
+        self.method = method
+        self.http_version = http_version
+        self.headers = headers
+        self.cookies = cookies
+        self.body = body
+        self.params = {} if params is None else params
+        self.route = ""
+
+    def get_header(self, name: str, default: str = None) -> str:
+        name = name.lower()
+        for key, value in self.headers.items():
+            if key.lower() == name:
+                return value
+        return default
+
+
+def legacy_parse(request: bytes) -> LegacyRequest:
+    """
+    リクエストを行ごとに分割し、すべてのヘッダーを文字列の辞書にする従来の方式
+    """
+    req_lines, remain = request.split(b"\r\n", 1)
+    req_header, req_body = remain.split(b"\r\n\r\n", 1)
+    method, path, http_version = req_lines.decode().split(" ")
+
+    headers = {}
+    for header_row in req_header.decode().split("\r\n"):
+        if ": " in header_row:
+            key, value = header_row.split(": ", 1)
+            headers[key] = value
+
+    cookies = {}
+    if "Cookie" in headers:
+        cookie_strings = headers["Cookie"].split("; ")
+        for cookie_string in cookie_strings:
+            key, value = cookie_string.split("=", 1)
+            cookies[key] = value
+    return LegacyRequest(path, method, http_version, headers, cookies, req_body)
+
+
+def legacy_find_header(head: bytes, name: bytes):
+    """
+    従来のRequestReaderが、ボディの長さを知るためにヘッダーを探していた方式
+    """
+    for header_row in bytes(head).split(b"\r\n")[1:]:
+        key, _, value = header_row.partition(b":")
+        if key.strip().lower() == name:
+            return value.strip()
+    return None
+
+
+def legacy_request(head: bytes):
+    request = legacy_parse(head)
+    legacy_find_header(head, b"transfer-encoding")
+    legacy_find_header(head, b"content-length")
+    for name in SERVER_HEADERS:
+        request.get_header(name)
+
+
+def current_request(head: bytes):
+    request = parse_request(head)
+    RequestReader.is_chunked(request.headers)
+    RequestReader.parse_content_length(request.headers)
+    for name in SERVER_HEADERS:
+        request.get_header(name)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--number", type=int, default=100000, help="計測する回数")
+    args = parser.parse_args()
+
+    print(f"{'case':<10}{'headers':>8}{'legacy':>16}{'parser':>16}{'speedup':>10}")
+    for name, head in CASES.items():
+        legacy = timeit.timeit(lambda: legacy_request(head), number=args.number)
+        current = timeit.timeit(lambda: current_request(head), number=args.number)
+        # リクエストラインと終端の空行を除いた行数
+        header_count = head.count(b"\r\n") - 2
+        print(
+            f"{name:<10}"
+            f"{header_count:>8}"
+            f"{args.number / legacy:>12.0f} r/s"
+            f"{args.number / current:>12.0f} r/s"
+            f"{legacy / current:>9.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
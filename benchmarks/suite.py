@@ -0,0 +1,187 @@
+"""
+各サーバ実装を順に起動して同じ負荷をかけ、結果をJSONに記録する
+以前の結果を--baselineに渡すと、スループットとp99レイテンシの変化を表示する
+
+python benchmarks/suite.py [-d 5] [-c 8] [--servers server,multithread] [--baseline benchmarks/results/xxx.json]
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+
+from benchmarks.loadgen import LoadGenerator, build_request
+
+HOST = "localhost"
+PORT = 8080
+RESULTS_DIR = os.path.join(BASE_DIR, "benchmarks", "results")
+
+# 負荷はすべて1つのIPアドレス(localhost)から送るため、接続の受け付け制御を止めてから起動する
+# (有効なままでは、ほとんどのリクエストが429になり、その処理を計測することになる)
+BOOT_WITHOUT_ADMISSION = (
+    "import settings; settings.ADMISSION_ENABLED = False; "
+    "from common.server.boot import boot; boot({engine!r})().serve()"
+)
+
+# 計測するサーバと、その起動コマンド
+SERVERS = {
+    "server": [sys.executable, "-c", BOOT_WITHOUT_ADMISSION.format(engine="threaded")],
+    "async": [sys.executable, "-c", BOOT_WITHOUT_ADMISSION.format(engine="asyncio")],
+    "multithread": [
+        sys.executable, "-c",
+        "from multithreadwebserver import MultiThreadWebServer; MultiThreadWebServer().serve()",
+    ],
+    "singlethread": [sys.executable, "singlethreadwebserver.py"],
+}
+
+# 計測するpath
+TARGETS = {
+    "now": "/now",
+    "profile": "/user/1/profile",
+    "cat.png": "/cat.png",
+}
+
+
+def start_server(name: str) -> subprocess.Popen:
+    """
+    サーバを起動し、接続を受け付けるようになるまで待つ
+    """
+    env = dict(os.environ)
+    # settingsを読み込めるよう、commonもモジュールの検索パスに入れる
+    env["PYTHONPATH"] = os.pathsep.join([BASE_DIR, os.path.join(BASE_DIR, "common"), env.get("PYTHONPATH", "")])
+    process = subprocess.Popen(
+        SERVERS[name],
+        cwd=BASE_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{name} exited with status {process.returncode}")
+        try:
+            socket.create_connection((HOST, PORT), timeout=0.5).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{name} did not start listening on {HOST}:{PORT}")
+
+
+def stop_server(process: subprocess.Popen):
+    """
+    サーバを止め、ポートが空くまで待つ
+    """
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def git_revision() -> str:
+    """
+    計測したコードのコミット
+    """
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(results: dict, baseline: dict):
+    """
+    以前の結果と比べた、スループットとp99レイテンシの変化を表示する
+    """
+    print(f"\n{'server':<14}{'target':<10}{'rps':>22}{'p99 (ms)':>26}")
+    for server, targets in results.items():
+        if "error" in targets or "error" in baseline.get(server, {}):
+            continue
+        for target, result in targets.items():
+            previous = baseline.get(server, {}).get(target)
+            if previous is None:
+                continue
+            rps_change = (result["rps"] / previous["rps"] - 1) * 100 if previous["rps"] else 0.0
+            p99, previous_p99 = result["latency_ms"]["p99"], previous["latency_ms"]["p99"]
+            p99_change = (p99 / previous_p99 - 1) * 100 if previous_p99 else 0.0
+            print(
+                f"{server:<14}{target:<10}"
+                f"{previous['rps']:>9} -> {result['rps']:<9}{rps_change:+6.1f}%"
+                f"{previous_p99:>9} -> {p99:<9}{p99_change:+6.1f}%"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="サーバ実装ごとの負荷試験")
+    parser.add_argument("-d", "--duration", type=float, default=5.0, help="1つのpathを計測する秒数")
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("--close", action="store_true", help="keep-aliveを使わず、リクエストごとに接続する")
+    parser.add_argument("--servers", default=",".join(SERVERS), help="計測するサーバ (カンマ区切り)")
+    parser.add_argument("--output", help="結果を書き出すファイル (省略時はbenchmarks/results/日時.json)")
+    parser.add_argument("--baseline", help="比較する以前の結果のファイル")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.servers.split(","):
+        print(f"=== {name} ===")
+        try:
+            process = start_server(name)
+        except RuntimeError as e:
+            print(f"  skipped: {e}")
+            results[name] = {"error": str(e)}
+            continue
+        try:
+            results[name] = {}
+            for target, path in TARGETS.items():
+                request = build_request("GET", path, f"{HOST}:{PORT}", keep_alive=not args.close)
+                generator = LoadGenerator(
+                    HOST, PORT, [request],
+                    concurrency=args.concurrency,
+                    duration=args.duration,
+                )
+                result = generator.run().to_dict()
+                results[name][target] = result
+                print(
+                    f"  {target:<10}{result['rps']:>10} req/s"
+                    f"  p50 {result['latency_ms']['p50']}ms  p99 {result['latency_ms']['p99']}ms"
+                    f"  errors {result['errors']}  status {result['status_codes']}"
+                )
+        finally:
+            stop_server(process)
+
+    record = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "duration": args.duration,
+        "concurrency": args.concurrency,
+        "keep_alive": not args.close,
+        "results": results,
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, "w") as f:
+        json.dump(record, f, indent=2)
+    print(f"\nresults written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f)["results"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+import io
+import re
+import tempfile
+import urllib.parse
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import settings
+
+
+class RequestError(Exception):
+    """
+    リクエストを正しく読み込めなかった場合に送出する
+    status_codeは、そのままクライアントへ返すエラーレスポンスに使う
+    """
+    status_code: int
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class RequestBody:
+    """
+    リクエストボディを少しずつ読み出すためのファイルライクオブジェクト
+    read_chunkは最大size bytesを返し、ボディを読み終えた後は空のバイト列を返す
+    """
+
+    def __init__(self, read_chunk: Callable[[int], bytes], close: Optional[Callable[[], None]] = None):
+        self._read_chunk = read_chunk
+        self._close = close
+        self._eof = False
+
+    @classmethod
+    def from_bytes(cls, body: bytes) -> "RequestBody":
+        """
+        読み込み済みのボディから生成
+        """
+        return cls(io.BytesIO(body).read)
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        最大size bytesを読み込む。sizeが負の場合は残りをすべて読み込む
+        """
+        chunks = []
+        remaining = size
+        while not self._eof and remaining != 0:
+            want = settings.BODY_CHUNK_SIZE if remaining < 0 else remaining
+            data = self._read_chunk(want)
+            if not data:
+                self._eof = True
+                break
+            chunks.append(data)
+            if remaining > 0:
+                remaining -= len(data)
+        return b"".join(chunks)
+
+    def __iter__(self) -> Iterator[bytes]:
+        """
+        ボディをBODY_CHUNK_SIZEごとに返す
+        """
+        while True:
+            data = self.read(settings.BODY_CHUNK_SIZE)
+            if not data:
+                return
+            yield data
+
+    def drain(self):
+        """
+        読まれなかった残りのボディを読み捨てる
+        """
+        for _ in self:
+            pass
+
+    def close(self):
+        """
+        読み出し元(一時ファイルなど)を閉じる
+        """
+        if self._close is not None:
+            self._close()
+
+    def spool(self) -> tempfile.SpooledTemporaryFile:
+        """
+        残りのボディを一時ファイルへ書き出し、先頭にシークした状態で返却する
+        REQUEST_BODY_SPOOL_SIZEまではメモリ上に保持し、超えた分はディスクに退避する
+        """
+        spooled = tempfile.SpooledTemporaryFile(max_size=settings.REQUEST_BODY_SPOOL_SIZE)
+        for data in self:
+            spooled.write(data)
+        spooled.seek(0)
+        return spooled
+
+
+def streaming_body(view: Callable) -> Callable:
+    """
+    Viewがリクエストボディをrequest.streamから少しずつ読み込むことを宣言するデコレータ
+    指定したViewにはボディを読み込む前のリクエストが渡され、request.bodyは空のままになる
+    """
+    view.streaming_body = True
+    return view
+
+
+def is_streaming_body(view: Callable) -> bool:
+    """
+    Viewがstreaming_bodyで宣言されているかを判定
+    """
+    return getattr(view, "streaming_body", False)
+
+
+def parse_urlencoded(stream: RequestBody, encoding: str = "utf-8") -> Dict[str, List[str]]:
+    """
+    application/x-www-form-urlencodedのボディを少しずつ読みながらパースする
+    結果はurllib.parse.parse_qsと同じ形式で返却する
+    ボディ全体がMAX_BODY_SIZE、1組の "name=value" がFORM_MAX_FIELD_SIZE、組の数がFORM_MAX_FIELDSを超えた場合は413とする
+    """
+    params: Dict[str, List[str]] = {}
+    fields = 0
+
+    def add(pair: bytes):
+        nonlocal fields
+        if len(pair) > settings.FORM_MAX_FIELD_SIZE:
+            raise RequestError(413, "form field too large")
+        for key, value in urllib.parse.parse_qsl(pair.decode(encoding), encoding=encoding):
+            fields += 1
+            if fields > settings.FORM_MAX_FIELDS:
+                raise RequestError(413, "too many form fields")
+            params.setdefault(key, []).append(value)
+
+    # 最後の "&" より後ろの部分は、次のチャンクへ続いている可能性があるため残しておく
+    pending = bytearray()
+    total = 0
+    for data in stream:
+        total += len(data)
+        if total > settings.MAX_BODY_SIZE:
+            raise RequestError(413, "form too large")
+        pending += data
+        end = pending.rfind(b"&")
+        if end >= 0:
+            for pair in bytes(pending[:end]).split(b"&"):
+                add(pair)
+            del pending[:end + 1]
+        if len(pending) > settings.FORM_MAX_FIELD_SIZE:
+            raise RequestError(413, "form field too large")
+    add(bytes(pending))
+    return params
+
+
+# Content-TypeやContent-Dispositionの "; key=value" 形式のパラメータ (値は引用符で囲まれていてもよい)
+HEADER_OPTION = re.compile(r'\s*([^\s=;]+)\s*=\s*(?:"((?:[^"\\]|\\.)*)"|([^;]*))')
+
+
+def parse_header_options(value: str) -> Tuple[str, Dict[str, str]]:
+    """
+    "text/html; charset=utf-8" のようなヘッダーの値を、本体(小文字)とパラメータに分ける
+    """
+    main, _, rest = value.partition(";")
+    options = {}
+    for match in HEADER_OPTION.finditer(rest):
+        key, quoted, token = match.groups()
+        if quoted is not None:
+            options[key.lower()] = re.sub(r"\\(.)", r"\1", quoted)
+        else:
+            options[key.lower()] = token.strip()
+    return main.strip().lower(), options
+
+
+class UploadedFile:
+    """
+    multipart/form-dataで送られたファイル
+    MULTIPART_SPOOL_SIZEまではメモリ上に保持し、超えた分は一時ファイルに書き出す
+    """
+    name: str
+    filename: str
+    content_type: str
+    size: int
+
+    def __init__(self, name: str, filename: str, content_type: str):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.size = 0
+        self.file = tempfile.SpooledTemporaryFile(max_size=settings.MULTIPART_SPOOL_SIZE)
+
+    def write(self, data: bytes):
+        self.file.write(data)
+        self.size += len(data)
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        ファイルの内容を読み込む
+        """
+        return self.file.read(size)
+
+    def close(self):
+        self.file.close()
+
+    def __repr__(self) -> str:
+        return f"UploadedFile({self.filename!r}, {self.content_type!r}, size={self.size})"
+
+
+def parse_multipart(
+        stream: RequestBody,
+        boundary: bytes,
+        encoding: str = "utf-8",
+) -> Tuple[Dict[str, List[str]], Dict[str, List[UploadedFile]]]:
+    """
+    multipart/form-dataのボディを少しずつ読みながらパースし、(フィールド, ファイル)を返却する
+    ファイルのパートはUploadedFileへ書き出し、ボディ全体をメモリに持たない
+    ファイル以外のフィールドは、1つがFORM_MAX_FIELD_SIZE、合計がMAX_BODY_SIZE、パートの数がFORM_MAX_FIELDSを超えた場合は413とする
+    形式が崩れている場合は、それまでに読めたパートだけを返す
+    """
+    fields: Dict[str, List[str]] = {}
+    files: Dict[str, List[UploadedFile]] = {}
+    try:
+        _parse_parts(stream, boundary, encoding, fields, files)
+    except RequestError:
+        for uploads in files.values():
+            for upload in uploads:
+                upload.close()
+        raise
+    return fields, files
+
+
+def _parse_parts(
+        stream: RequestBody,
+        boundary: bytes,
+        encoding: str,
+        fields: Dict[str, List[str]],
+        files: Dict[str, List[UploadedFile]],
+):
+    chunks = iter(stream)
+    # 最初の区切りがボディの先頭にある場合も、"\r\n--boundary" で探せるようにする
+    buffer = bytearray(b"\r\n")
+    delimiter = b"\r\n--" + boundary
+
+    def fill() -> bool:
+        data = next(chunks, b"")
+        buffer.extend(data)
+        return bool(data)
+
+    # パートの数と、メモリに持つフィールドの値の合計サイズ
+    parts = 0
+    fields_size = 0
+
+    # プリアンブルを読み捨て、最初の区切りまで進める
+    found = _copy_until(buffer, delimiter, fill, None)
+    while found:
+        del buffer[:len(delimiter)]
+        while len(buffer) < 2 and fill():
+            pass
+        if buffer[:2] != b"\r\n":
+            # "--boundary--" で終端。エピローグは読み捨てる
+            break
+        parts += 1
+        if parts > settings.FORM_MAX_FIELDS:
+            raise RequestError(413, "too many form fields")
+
+        header_end = buffer.find(b"\r\n\r\n")
+        while header_end < 0 and len(buffer) <= settings.MULTIPART_MAX_HEADER_SIZE and fill():
+            header_end = buffer.find(b"\r\n\r\n")
+        if header_end < 0 or header_end > settings.MULTIPART_MAX_HEADER_SIZE:
+            break
+        disposition, content_type = _parse_part_header(bytes(buffer[2:header_end]))
+        del buffer[:header_end + 4]
+        _, options = parse_header_options(disposition)
+        name = options.get("name", "")
+        filename = options.get("filename")
+
+        if filename is None:
+            value = bytearray()
+            limit = min(settings.FORM_MAX_FIELD_SIZE, settings.MAX_BODY_SIZE - fields_size)
+            found = _copy_until(buffer, delimiter, fill, value, limit)
+            fields_size += len(value)
+            if found:
+                fields.setdefault(name, []).append(value.decode(encoding, "replace"))
+        else:
+            upload = UploadedFile(name, filename, content_type or "application/octet-stream")
+            try:
+                found = _copy_until(buffer, delimiter, fill, upload)
+            except RequestError:
+                upload.close()
+                raise
+            if found:
+                upload.file.seek(0)
+                files.setdefault(name, []).append(upload)
+            else:
+                upload.close()
+
+    # 読まれなかった残りのボディを読み捨てる
+    for _ in chunks:
+        pass
+
+
+def _parse_part_header(header: bytes) -> Tuple[str, Optional[str]]:
+    """
+    パートのヘッダーから、Content-DispositionとContent-Typeの値を取り出す
+    """
+    disposition, content_type = "", None
+    for line in header.split(b"\r\n"):
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"content-disposition":
+            disposition = value.strip().decode("utf-8", "replace")
+        elif name == b"content-type":
+            content_type = value.strip().decode("latin-1")
+    return disposition, content_type
+
+
+def _copy_until(
+        buffer: bytearray,
+        delimiter: bytes,
+        fill: Callable[[], bool],
+        target,
+        limit: Optional[int] = None,
+) -> bool:
+    """
+    bufferの先頭が区切りになるまで、その手前の内容をtargetへ書き出す (targetがNoneの場合は読み捨てる)
+    区切りが見つからないままボディが終わった場合はFalse
+    limitを指定した場合は、書き出す内容がlimitを超えた時点で413とする
+    """
+    # 区切りの途中までがbufferの末尾にある可能性があるため、その分は残して書き出す
+    keep = len(delimiter) - 1
+    written = 0
+    while True:
+        position = buffer.find(delimiter)
+        size = position if position >= 0 else len(buffer) - keep
+        if size > 0:
+            written += size
+            if limit is not None and written > limit:
+                raise RequestError(413, "form field too large")
+            _write(target, buffer[:size])
+            del buffer[:size]
+        if position >= 0:
+            return True
+        if not fill():
+            return False
+
+
+def _write(target, data: bytearray):
+    if target is None:
+        return
+    if isinstance(target, bytearray):
+        target += data
+    else:
+        target.write(bytes(data))
@@ -0,0 +1,97 @@
+import gzip
+import zlib
+from typing import Callable, Dict, Iterable, Optional
+
+import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _gzip(data: bytes) -> bytes:
+    # mtimeを固定し、同じ内容からは常に同じバイト列(=同じETag)を生成する
+    return gzip.compress(data, compresslevel=settings.COMPRESSION_LEVEL, mtime=0)
+
+
+def _deflate(data: bytes) -> bytes:
+    # HTTPのdeflateは、zlib形式(RFC 1950)を指す
+    return zlib.compress(data, settings.COMPRESSION_LEVEL)
+
+
+# 対応する圧縮方式。クライアントの優先度が同じ場合は、先にあるものを選ぶ
+COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {}
+if brotli is not None:
+    COMPRESSORS["br"] = brotli.compress
+COMPRESSORS["gzip"] = _gzip
+COMPRESSORS["deflate"] = _deflate
+
+# 圧縮の効果があるMIMEタイプ
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+def negotiate_encoding(accept_encoding: Optional[str], available: Iterable[str] = None) -> Optional[str]:
+    """
+    Accept-Encodingヘッダーから、使用する圧縮方式を選ぶ
+    圧縮しない場合はNoneを返す
+    """
+    if not accept_encoding:
+        return None
+    if available is None:
+        available = COMPRESSORS.keys()
+
+    qualities = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip().lower()] = quality
+
+    best_encoding = None
+    best_quality = 0.0
+    for encoding in available:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best_encoding = encoding
+            best_quality = quality
+    return best_encoding
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    """
+    MIMEタイプが圧縮の対象かを判定
+    image/pngなど、既に圧縮されている形式は対象外
+    """
+    if not content_type:
+        return False
+    return content_type.lower().startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """
+    指定した圧縮方式でデータを圧縮する
+    """
+    return COMPRESSORS[encoding](data)
+
+
+def add_vary(headers: dict, value: str = "Accept-Encoding"):
+    """
+    Varyヘッダーに値を追加する
+    """
+    vary = headers.get("Vary")
+    if vary is None:
+        headers["Vary"] = value
+    elif value.lower() not in [item.strip().lower() for item in vary.split(",")]:
+        headers["Vary"] = f"{vary}, {value}"
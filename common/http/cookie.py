@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Optional
 
 
 class Cookie:
@@ -30,4 +30,18 @@ class Cookie:
         self.domain = domain
         self.path = path
         self.secure = secure
-        self.http_only = http_only
\ No newline at end of file
+        self.http_only = http_only
+
+
+def parse_cookies(cookie: str) -> Dict[str, str]:
+    """
+    Cookieヘッダーをパースする。"="を含まない項目は無視する
+    同じ名前が複数ある場合は最初の値を使う
+    """
+    cookies: Dict[str, str] = {}
+    for item in cookie.split(";"):
+        key, sep, value = item.partition("=")
+        key = key.strip()
+        if sep and key:
+            cookies.setdefault(key, value.strip())
+    return cookies
@@ -0,0 +1,258 @@
+import time
+from collections.abc import Mapping
+from email.utils import formatdate
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from common.http.cookie import Cookie
+
+# ステータスコードと理由句の対応
+STATUS_REASONS = {
+    200: "OK",
+    206: "Partial Content",
+    302: "Found",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    408: "Request Timeout",
+    413: "Payload Too Large",
+    416: "Range Not Satisfiable",
+    414: "URI Too Long",
+    429: "Too Many Requests",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    501: "Not Implemented",
+    503: "Service Unavailable",
+    505: "HTTP Version Not Supported",
+}
+
+# 送信するヘッダーのうち、レスポンスごとに変わらない部分はエンコード済みのバイト列で持つ
+STATUS_LINES = {
+    status_code: f"HTTP/1.1 {status_code} {reason}\r\n".encode()
+    for status_code, reason in STATUS_REASONS.items()
+}
+SERVER_HEADER = b"Server: DemoServer\r\n"
+CONNECTION_CLOSE = b"Connection: close\r\n"
+TRANSFER_ENCODING_CHUNKED = b"Transfer-Encoding: chunked\r\n"
+CRLF = b"\r\n"
+
+HTTP_DATE_FORMAT = "%a, %d %b %Y %H:%M:%S GMT"
+
+
+def reason_phrase(status_code: int) -> str:
+    """
+    ステータスコードに対応する理由句を返却
+    """
+    return STATUS_REASONS.get(status_code, "OK")
+
+
+def status_line(status_code: int) -> bytes:
+    """
+    エンコード済みのステータスラインを返却
+    一覧にないステータスコードは、初回に作成して保持する
+    """
+    line = STATUS_LINES.get(status_code)
+    if line is None:
+        line = f"HTTP/1.1 {status_code} {reason_phrase(status_code)}\r\n".encode()
+        STATUS_LINES[status_code] = line
+    return line
+
+
+class HTTPDate:
+    """
+    Dateヘッダーの値を1秒ごとに作り直し、同じ秒のレスポンスでは使い回す
+    値の差し替えはタプルの代入1回で行うため、スレッド間で共有してもロックは不要
+    """
+    _cached: tuple
+
+    def __init__(self):
+        self._cached = (None, b"")
+
+    def header(self) -> bytes:
+        """
+        エンコード済みのDateヘッダーを返却
+        """
+        now = int(time.time())
+        second, header = self._cached
+        if second != now:
+            header = f"Date: {formatdate(now, usegmt=True)}\r\n".encode()
+            self._cached = (now, header)
+        return header
+
+
+http_date = HTTPDate()
+
+
+def format_cookie(cookie: Cookie) -> str:
+    """
+    Set-Cookieヘッダーの値を生成
+    """
+    parts = [f"{cookie.name}={cookie.value}"]
+    if cookie.expires is not None:
+        parts.append(f"Expires={cookie.expires.strftime(HTTP_DATE_FORMAT)}")
+    if cookie.max_age is not None:
+        parts.append(f"Max-Age={cookie.max_age}")
+    if cookie.domain:
+        parts.append(f"Domain={cookie.domain}")
+    if cookie.path:
+        parts.append(f"Path={cookie.path}")
+    if cookie.secure:
+        parts.append("Secure")
+    if cookie.http_only:
+        parts.append("HttpOnly")
+    return "; ".join(parts)
+
+
+class HeaderSerializer:
+    """
+    レスポンスヘッダーを1回の走査でbytearrayに書き出す
+    keep-aliveのヘッダーは設定値から作るため、インスタンスの作成時にエンコードしておく
+    """
+    keep_alive_header: bytes
+
+    def __init__(self, keep_alive_timeout: int):
+        self.keep_alive_header = (
+            "Connection: keep-alive\r\n"
+            f"Keep-Alive: timeout={keep_alive_timeout}\r\n"
+        ).encode()
+
+    def serialize(
+            self,
+            status_code: int,
+            headers: Dict[str, str],
+            cookies: List[Cookie],
+            content_length: Optional[int] = None,
+            content_type: Optional[str] = None,
+            chunked: bool = False,
+            keep_alive: bool = False,
+    ) -> bytearray:
+        """
+        ステータスラインから終端の空行までをまとめたバイト列を返却
+        """
+        buffer = bytearray(status_line(status_code))
+        buffer += http_date.header()
+        buffer += SERVER_HEADER
+
+        # 304はボディを持たないため、Content-LengthとContent-Typeを付けない
+        if status_code != 304:
+            if content_length is not None:
+                buffer += b"Content-Length: %d\r\n" % content_length
+            elif chunked:
+                buffer += TRANSFER_ENCODING_CHUNKED
+            if content_type is not None:
+                buffer += f"Content-Type: {content_type}\r\n".encode()
+
+        buffer += self.keep_alive_header if keep_alive else CONNECTION_CLOSE
+
+        if headers or cookies:
+            # 可変のヘッダーは1つの文字列にまとめてから、1回だけエンコードする
+            lines = [f"{name}: {value}\r\n" for name, value in headers.items()]
+            lines.extend(f"Set-Cookie: {format_cookie(cookie)}\r\n" for cookie in cookies)
+            buffer += "".join(lines).encode()
+
+        buffer += CRLF
+        return buffer
+
+
+def decode_header_value(value: bytes) -> str:
+    """
+    ヘッダーの値を文字列にする
+    UTF-8として読めない値は、1バイトを1文字として(latin-1で)読む
+    """
+    try:
+        return value.decode()
+    except UnicodeDecodeError:
+        return value.decode("latin-1")
+
+
+class Headers(Mapping):
+    """
+    リクエストヘッダーを、名前の大文字・小文字を区別せずに引ける多値の辞書
+    受信したヘッダーの行と、小文字の名前から最初の値を引く索引をバイト列のまま持ち、文字列への変換は参照したときに行う
+    同じ名前のフィールドが複数ある場合、getやheaders[name]は最初の値を、get_allはすべての値を返す
+    """
+    __slots__ = ("_lines", "_index")
+
+    def __init__(self, lines: List[bytes] = None, index: Dict[bytes, bytes] = None):
+        # "名前: 値" の行を受信した順に持つ
+        self._lines = [] if lines is None else lines
+        # 小文字の名前から、最初の値(コロンより後ろ。前後の空白は参照するときに取り除く)を引く索引
+        self._index = {} if index is None else index
+
+    @classmethod
+    def from_dict(cls, headers: dict) -> "Headers":
+        """
+        辞書からHeadersを作る
+        """
+        lines = []
+        index = {}
+        for name, value in headers.items():
+            name, value = str(name).encode(), str(value).encode()
+            lines.append(name + b": " + value)
+            index.setdefault(name.lower(), value)
+        return cls(lines, index)
+
+    def get(self, name: str, default: str = None) -> Optional[str]:
+        """
+        最初の値を返却する。存在しない場合はdefault
+        """
+        value = self._index.get(name.lower().encode())
+        if value is None:
+            return default
+        return decode_header_value(value.strip(b" \t"))
+
+    def get_raw(self, name: str) -> Optional[bytes]:
+        """
+        最初の値を、文字列に変換せずに返却する。存在しない場合はNone
+        """
+        value = self._index.get(name.lower().encode())
+        if value is None:
+            return None
+        return value.strip(b" \t")
+
+    def get_all(self, name: str) -> List[str]:
+        """
+        同じ名前のフィールドの値を、受信した順にすべて返却する
+        """
+        key = name.lower().encode()
+        if key not in self._index:
+            return []
+        values = []
+        for line in self._lines:
+            field, _, value = line.partition(b":")
+            if field.lower() == key:
+                values.append(decode_header_value(value.strip(b" \t")))
+        return values
+
+    def items(self) -> List[Tuple[str, str]]:
+        """
+        すべてのフィールドを、(名前, 値)の組で受信した順に返却する
+        """
+        result = []
+        for line in self._lines:
+            name, _, value = line.partition(b":")
+            result.append((name.decode("latin-1"), decode_header_value(value.strip(b" \t"))))
+        return result
+
+    def __getitem__(self, name: str) -> str:
+        value = self.get(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and name.lower().encode() in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        seen = set()
+        for line in self._lines:
+            name = line.partition(b":")[0]
+            if name.lower() not in seen:
+                seen.add(name.lower())
+                yield name.decode("latin-1")
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __repr__(self) -> str:
+        return f"Headers({self.items()!r})"
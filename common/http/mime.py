@@ -0,0 +1,24 @@
+# 拡張子とMIMEタイプのマッピング
+MIME_TYPES = {
+    "html": "text/html; charset=utf-8",
+    "css": "text/css",
+    "js": "application/javascript",
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "gif": "image/gif",
+}
+
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+
+
+def guess_content_type(path: str) -> str:
+    """
+    pathの拡張子からMIMEタイプを推測する
+    pathに拡張子がない場合は、html扱いとする
+    """
+    if "." not in path:
+        return "text/html; charset=utf-8"
+
+    extension = path.rsplit(".", maxsplit=1)[-1]
+    # 対応していない拡張子の場合、デフォルトのMIMEタイプを設定
+    return MIME_TYPES.get(extension, DEFAULT_CONTENT_TYPE)
@@ -1,33 +1,162 @@
+import codecs
+import urllib.parse
+from typing import Dict, List, Optional, Union
+
+import settings
+from common.http.body import RequestBody, UploadedFile, parse_header_options, parse_multipart, parse_urlencoded
+from common.http.cookie import parse_cookies
+from common.http.headers import Headers
+from common.http.session import Session, open_session
+
+
 class HTTPRequest:
     path: str
     method: str
     http_version: str
-    headers: dict
-    cookies: dict
+    headers: Headers
     body: bytes
-    params: dict
+    query_string: str
+    route: str
 
     def __init__(
             self,
             path: str = "",
             method: str = "",
             http_version: str = "",
-            headers: dict = None,
+            headers: Union[Headers, dict] = None,
             cookies: dict = None,
             body: bytes = b"",
             params: dict = None,
+            stream: Optional[RequestBody] = None,
+            query_string: str = "",
     ):
         if headers is None:
-            headers = {}
-        if cookies is None:
-            cookies = {}
-        if params is None:
-            params = {}
+            headers = Headers()
+        elif not isinstance(headers, Headers):
+            headers = Headers.from_dict(headers)
 
         self.path = path
         self.method = method
         self.http_version = http_version
         self.headers = headers
-        self.cookies = cookies
         self.body = body
-        self.params = params
\ No newline at end of file
+        # pathの後ろの"?"以降 ("?"は含まない)
+        self.query_string = query_string
+        # 一致したURLパターン (メトリクスの集計に使う)
+        self.route = ""
+        # 一致したURLパターンのレスポンスキャッシュ (ResponseCache, 指定されていない場合はNone)
+        self.response_cache = None
+        self._stream = stream
+        # 以下は初めて参照したときにパースする
+        self._cookies: Optional[Dict[str, str]] = cookies
+        self._params: Optional[dict] = params
+        self._query: Optional[Dict[str, List[str]]] = None
+        self._form: Optional[Dict[str, List[str]]] = None
+        self._files: Optional[Dict[str, List[UploadedFile]]] = None
+        # Viewが参照した場合のみ、レスポンスの送信前に保存する
+        self.loaded_session: Optional[Session] = None
+
+    @property
+    def stream(self) -> RequestBody:
+        """
+        ボディを少しずつ読み出すためのファイルライクオブジェクト
+        streaming_bodyを指定したViewでは、socketから直接読み込む
+        """
+        if self._stream is None:
+            self._stream = RequestBody.from_bytes(self.body)
+        return self._stream
+
+    @stream.setter
+    def stream(self, stream: RequestBody):
+        self._stream = stream
+
+    @property
+    def cookies(self) -> Dict[str, str]:
+        """
+        Cookieヘッダーの名前と値
+        """
+        if self._cookies is None:
+            cookie = self.headers.get("Cookie")
+            self._cookies = parse_cookies(cookie) if cookie else {}
+        return self._cookies
+
+    @cookies.setter
+    def cookies(self, cookies: Dict[str, str]):
+        self._cookies = cookies
+
+    @property
+    def query(self) -> Dict[str, List[str]]:
+        """
+        クエリ文字列のパラメータ (urllib.parse.parse_qsと同じ形式)
+        """
+        if self._query is None:
+            if self.query_string:
+                self._query = urllib.parse.parse_qs(self.query_string, keep_blank_values=True)
+            else:
+                self._query = {}
+        return self._query
+
+    @property
+    def params(self) -> dict:
+        """
+        URLパターンのパラメータと、クエリ文字列のパラメータ(同じ名前が複数ある場合は最初の値)
+        名前が重なる場合は、URLパターンのパラメータを優先する
+        """
+        if self._params is None:
+            self._params = {key: values[0] for key, values in self.query.items()}
+        return self._params
+
+    @params.setter
+    def params(self, params: dict):
+        self._params = params
+
+    @property
+    def form(self) -> Dict[str, List[str]]:
+        """
+        フォームのフィールド (urllib.parse.parse_qsと同じ形式)
+        application/x-www-form-urlencodedとmultipart/form-dataのボディをrequest.streamから読み込んでパースする
+        """
+        if self._form is None:
+            self._parse_form()
+        return self._form
+
+    @property
+    def files(self) -> Dict[str, List[UploadedFile]]:
+        """
+        multipart/form-dataで送られたファイル
+        """
+        if self._files is None:
+            self._parse_form()
+        return self._files
+
+    @property
+    def session(self) -> Session:
+        """
+        CookieのセッションIDに対応するセッション
+        変更した場合はレスポンスの送信前にストアへ保存し、新しいセッションであればIDをCookieで送る
+        """
+        if self.loaded_session is None:
+            self.loaded_session = open_session(self.cookies.get(settings.SESSION_COOKIE_NAME))
+        return self.loaded_session
+
+    def get_header(self, name: str, default: str = None) -> str:
+        """
+        ヘッダー名の大文字・小文字を区別せずにヘッダーの値を取得
+        """
+        return self.headers.get(name, default)
+
+    def _parse_form(self):
+        """
+        Content-Typeに従ってボディをパースし、formとfilesに格納する
+        """
+        content_type, options = parse_header_options(self.headers.get("Content-Type", ""))
+        encoding = options.get("charset", "utf-8")
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            encoding = "utf-8"
+        self._form, self._files = {}, {}
+        if content_type == "application/x-www-form-urlencoded":
+            self._form = parse_urlencoded(self.stream, encoding)
+        elif content_type == "multipart/form-data" and options.get("boundary"):
+            self._form, self._files = parse_multipart(self.stream, options["boundary"].encode("latin-1"), encoding)
@@ -1,13 +1,19 @@
-from typing import Optional, List
+import os
+from typing import AsyncIterable, Iterable, Optional, List, Union
 
 from common.http.cookie import Cookie
 
+# レスポンスボディとして受け付ける型
+# bytes/strと、そのリスト・タプルはContent-Lengthを付けて送信する
+# それ以外のイテラブル(ジェネレータなど)と非同期イテラブルは、Transfer-Encoding: chunkedで少しずつ送信する
+ResponseBody = Union[bytes, str, List[Union[bytes, str]], Iterable[Union[bytes, str]], AsyncIterable[Union[bytes, str]]]
+
 class HTTPResponse:
     status_code: int
     headers: dict
     cookies: List[Cookie]
     content_type: Optional[str]
-    body: bytes
+    body: ResponseBody
 
     def __init__(
             self,
@@ -15,7 +21,7 @@ class HTTPResponse:
             headers: dict = None,
             cookies: List[Cookie] = None,
             content_type: Optional[str] = None,
-            body: bytes = b""
+            body: ResponseBody = b""
     ):
         if headers is None:
             headers = {}
@@ -26,4 +32,65 @@ class HTTPResponse:
         self.headers = headers
         self.cookies = cookies
         self.content_type = content_type
-        self.body = body
\ No newline at end of file
+        self.body = body
+
+    @property
+    def content_length(self) -> Optional[int]:
+        """
+        Content-Lengthとして送信するボディのサイズ
+        ボディがジェネレータなどで、送信し終えるまでサイズが分からない場合はNone
+        """
+        if isinstance(self.body, (bytes, bytearray, memoryview)):
+            return len(self.body)
+        if isinstance(self.body, str):
+            return len(self.body.encode())
+        if isinstance(self.body, (list, tuple)):
+            return sum(
+                len(chunk.encode()) if isinstance(chunk, str) else len(chunk)
+                for chunk in self.body
+            )
+        return None
+
+    @property
+    def is_streaming(self) -> bool:
+        """
+        ボディを少しずつ送信するレスポンスかを判定
+        """
+        return self.content_length is None
+
+
+class FileResponse(HTTPResponse):
+    """
+    ファイルの内容をボディとして送信するレスポンス
+    ボディをメモリに読み込まず、送信時にsendfileでファイルからsocketへ直接書き出す
+    """
+    path: str
+    offset: int
+    length: int
+
+    def __init__(
+            self,
+            path: str,
+            offset: int = 0,
+            length: Optional[int] = None,
+            status_code: int = 200,
+            headers: dict = None,
+            cookies: List[Cookie] = None,
+            content_type: Optional[str] = None,
+    ):
+        super().__init__(
+            status_code=status_code,
+            headers=headers,
+            cookies=cookies,
+            content_type=content_type,
+        )
+        if length is None:
+            length = os.path.getsize(path) - offset
+
+        self.path = path
+        self.offset = offset
+        self.length = length
+
+    @property
+    def content_length(self) -> int:
+        return self.length
@@ -0,0 +1,493 @@
+import atexit
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import settings
+from common.http.cookie import Cookie
+
+# セッションIDとして受け付ける文字列 (secrets.token_urlsafeで生成した形式)
+SESSION_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{32,64}")
+
+
+class Session(MutableMapping):
+    """
+    1クライアントのセッションのデータ
+    値はJSONに変換できるものに限る。変更した場合だけ、レスポンスの送信前にストアへ保存する
+    """
+    session_id: str
+    new: bool
+    modified: bool
+    deleted: bool
+
+    def __init__(self, session_id: str, data: dict = None, new: bool = False):
+        self.session_id = session_id
+        self.data = {} if data is None else data
+        # クライアントがまだこのセッションIDを持っていない
+        self.new = new
+        self.modified = False
+        self.deleted = False
+        # cycle_idで破棄した以前のセッションID
+        self.previous_id: Optional[str] = None
+
+    def __getitem__(self, key: str):
+        return self.data[key]
+
+    def __setitem__(self, key: str, value):
+        self.data[key] = value
+        self.modified = True
+
+    def __delitem__(self, key: str):
+        del self.data[key]
+        self.modified = True
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def cycle_id(self):
+        """
+        データはそのままで、セッションIDを新しく発行し直す
+        ログインのように権限が変わる場面で呼び、以前のIDを使い回されないようにする (セッション固定攻撃の対策)
+        """
+        if not self.new and self.previous_id is None:
+            self.previous_id = self.session_id
+        self.session_id = new_session_id()
+        self.new = True
+        self.modified = True
+
+    def flush(self):
+        """
+        データを消去し、セッションを破棄する (ログアウト)
+        """
+        self.data = {}
+        self.deleted = True
+
+
+class MemorySessionStore:
+    """
+    セッションのデータをメモリ上に保持する
+    セッションIDのハッシュでシャードに分け、シャードごとのロックで保護することで、スレッド間の競合を減らす
+    各シャードは最後に参照した順に並べ、有効期限(TTL)を過ぎたものと、合計サイズの上限を超えた分を古いものから捨てる
+    """
+    ttl: float
+    max_bytes: int
+
+    def __init__(self, ttl: float, max_bytes: int, shards: int = 16):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._shards = [MemoryShard(max_bytes // shards) for _ in range(shards)]
+
+    def load(self, session_id: str) -> Optional[dict]:
+        """
+        セッションのデータを返却する。存在しないか、有効期限を過ぎている場合はNone
+        参照したセッションは有効期限を延長する
+        """
+        value = self._shard(session_id).get(session_id, time.monotonic(), self.ttl)
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def save(self, session_id: str, data: dict, new: bool = False):
+        self.put(session_id, json.dumps(data, ensure_ascii=False).encode())
+
+    def put(self, session_id: str, value: bytes):
+        """
+        JSONに変換済みのデータを保存する
+        """
+        self._shard(session_id).put(session_id, value, time.monotonic() + self.ttl)
+
+    def delete(self, session_id: str):
+        self._shard(session_id).delete(session_id)
+
+    def close(self):
+        pass
+
+    def stats(self) -> dict:
+        """
+        セッションの数、保持しているデータの合計サイズ、上限を超えて捨てた数を返却する
+        """
+        stats = {"sessions": 0, "bytes": 0, "evicted": 0, "expired": 0}
+        for shard in self._shards:
+            with shard.lock:
+                stats["sessions"] += len(shard.entries)
+                stats["bytes"] += shard.size
+                stats["evicted"] += shard.evicted
+                stats["expired"] += shard.expired
+        return stats
+
+    def _shard(self, session_id: str) -> "MemoryShard":
+        return self._shards[hash(session_id) % len(self._shards)]
+
+
+class MemoryShard:
+    """
+    MemorySessionStoreの1シャード
+    エントリはすべて同じTTLで延長されるため、最後に参照した順に並べると有効期限の順にもなる
+    そのため、期限切れのエントリは先頭から順に捨てるだけでよい
+    """
+    # キーとデータ以外に、1エントリが使うおおよそのメモリ (bytes)
+    ENTRY_OVERHEAD = 200
+
+    def __init__(self, max_bytes: int):
+        self.lock = threading.Lock()
+        # セッションID -> (有効期限, JSONに変換したデータ)
+        self.entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def get(self, session_id: str, now: float, ttl: float) -> Optional[bytes]:
+        with self.lock:
+            entry = self.entries.get(session_id)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                self._remove(session_id)
+                self.expired += 1
+                return None
+            self.entries[session_id] = (now + ttl, value)
+            self.entries.move_to_end(session_id)
+            return value
+
+    def put(self, session_id: str, value: bytes, expires_at: float):
+        with self.lock:
+            if session_id in self.entries:
+                self._remove(session_id)
+            self.entries[session_id] = (expires_at, value)
+            self.size += self._entry_size(session_id, value)
+            self._purge(time.monotonic())
+
+    def delete(self, session_id: str):
+        with self.lock:
+            if session_id in self.entries:
+                self._remove(session_id)
+
+    def _purge(self, now: float):
+        """
+        期限切れのエントリと、合計サイズの上限を超えた分を古いものから捨てる
+        """
+        while self.entries:
+            session_id, (expires_at, _) = next(iter(self.entries.items()))
+            if expires_at <= now:
+                self.expired += 1
+            elif self.size > self.max_bytes:
+                self.evicted += 1
+            else:
+                break
+            self._remove(session_id)
+
+    def _remove(self, session_id: str):
+        _, value = self.entries.pop(session_id)
+        self.size -= self._entry_size(session_id, value)
+
+    def _entry_size(self, session_id: str, value: bytes) -> int:
+        return len(session_id) + len(value) + self.ENTRY_OVERHEAD
+
+
+class SQLiteSessionStore:
+    """
+    セッションのデータをSQLiteのファイルに保存し、サーバを再起動しても引き継ぐ
+    読み込みはMemorySessionStoreをキャッシュとして使い、見つからない場合だけファイルを読む
+    既存のセッションの変更と参照による有効期限の延長は、バックグラウンドのスレッドが一定間隔でまとめて1つのトランザクションでファイルへ書き出す
+    新しいセッションの作成と削除は、すぐにファイルへ書き込む
+    複数のプロセスで同じファイルを使う場合(prefork)はsharedをTrueにし、キャッシュを使わずに毎回ファイルから読む
+    (ログイン直後のリダイレクトが別のワーカーに届いても、セッションを読める)
+    """
+    path: str
+    ttl: float
+    shared: bool
+
+    def __init__(
+            self,
+            path: str,
+            ttl: float,
+            cache: MemorySessionStore,
+            flush_interval: float = 1.0,
+            shared: bool = False,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.cache = cache
+        self.flush_interval = flush_interval
+        self.shared = shared
+
+        # ファイルへの書き込みを待つ変更 (セッションID -> JSONに変換したデータ)
+        self._pending: Dict[str, bytes] = {}
+        # 参照されたため、ファイル上の有効期限を延長するセッションID
+        self._touched: Set[str] = set()
+        self._pending_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._connection_pid: Optional[int] = None
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._atexit_registered = False
+        self.written = 0
+
+    def load(self, session_id: str) -> Optional[dict]:
+        if not self.shared:
+            data = self.cache.load(session_id)
+            if data is not None:
+                self._touch(session_id)
+                return data
+
+        with self._pending_lock:
+            value = self._pending.get(session_id)
+        if value is not None:
+            # まだファイルへ書き出していない、このプロセスでの変更
+            self._touch(session_id)
+            return json.loads(value)
+
+        with self._db_lock:
+            row = self._connect().execute(
+                "SELECT data FROM sessions WHERE session_id = ? AND expires_at > ?",
+                (session_id, time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        self._touch(session_id)
+        if not self.shared:
+            # 次からはメモリ上のキャッシュから返す
+            self.cache.put(session_id, row[0])
+        return json.loads(row[0])
+
+    def save(self, session_id: str, data: dict, new: bool = False):
+        """
+        セッションを保存する。新しいセッション(newがTrue)は、他のプロセスからもすぐに読めるようファイルへ書き込む
+        """
+        value = json.dumps(data, ensure_ascii=False).encode()
+        if not self.shared:
+            self.cache.put(session_id, value)
+        if new:
+            with self._db_lock:
+                with self._pending_lock:
+                    self._pending.pop(session_id, None)
+                self._write([(session_id, value, time.time() + self.ttl)], [], [])
+        else:
+            self._enqueue(session_id, value)
+
+    def delete(self, session_id: str):
+        """
+        セッションを削除する。他のプロセスで使われ続けないよう、すぐにファイルから削除する
+        """
+        self.cache.delete(session_id)
+        with self._db_lock:
+            with self._pending_lock:
+                self._pending.pop(session_id, None)
+                self._touched.discard(session_id)
+            self._write([], [(session_id,)], [])
+
+    def stats(self) -> dict:
+        stats = self.cache.stats()
+        stats["pending"] = len(self._pending)
+        stats["written"] = self.written
+        return stats
+
+    def close(self):
+        """
+        書き込みを待つ変更をファイルへ書き出してからスレッドを止める
+        """
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._stopping = True
+        self._wakeup.set()
+        thread.join(timeout=5)
+
+    def _enqueue(self, session_id: str, value: bytes):
+        self.ensure_started()
+        with self._pending_lock:
+            # 同じセッションへの変更は、最後のものだけを書き込む
+            self._pending[session_id] = value
+
+    def _touch(self, session_id: str):
+        self.ensure_started()
+        with self._pending_lock:
+            self._touched.add(session_id)
+
+    def ensure_started(self):
+        """
+        書き込み用のスレッドを起動する
+        fork後の子プロセスでは、スレッドとSQLiteの接続を作り直す
+        """
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                # fork前の変更は親プロセスが書き込む
+                self._pid = os.getpid()
+                self._pending = {}
+                self._touched = set()
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="SessionWriter", daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.close)
+                self._atexit_registered = True
+
+    def _run(self):
+        """
+        一定間隔で変更をファイルへ書き出し、期限切れのセッションを削除する
+        """
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self._flush()
+            except sqlite3.Error:
+                # 書き込めなかった変更は捨てる。メモリ上のキャッシュには残っている
+                pass
+            if self._stopping:
+                break
+
+    def _flush(self):
+        # 取り出してから書き込むまでの間に、同じセッションをすぐに書き込む変更(作成や削除)が割り込まないよう、
+        # 取り出す前からファイルのロックを取る
+        with self._db_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+                touched, self._touched = self._touched, set()
+
+            expires_at = time.time() + self.ttl
+            upserts = [(session_id, value, expires_at) for session_id, value in pending.items()]
+            touches = [(expires_at, session_id) for session_id in touched if session_id not in pending]
+            self._write(upserts, [], touches)
+
+    def _write(
+            self,
+            upserts: List[Tuple[str, bytes, float]],
+            deletes: List[Tuple[str]],
+            touches: List[Tuple[float, str]],
+    ):
+        """
+        1つのトランザクションで変更を書き込み、期限切れのセッションを削除する (_db_lockを取って呼ぶ)
+        """
+        connection = self._connect()
+        with connection:
+            # 自動コミットの接続のため、明示的にトランザクションを始める (書き込みのロックは最初に取る)
+            connection.execute("BEGIN IMMEDIATE")
+            if upserts:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO sessions (session_id, data, expires_at) VALUES (?, ?, ?)",
+                    upserts,
+                )
+            if deletes:
+                connection.executemany("DELETE FROM sessions WHERE session_id = ?", deletes)
+            if touches:
+                connection.executemany("UPDATE sessions SET expires_at = ? WHERE session_id = ?", touches)
+            connection.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),))
+        self.written += len(upserts) + len(deletes)
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        SQLiteのファイルを開き、テーブルがなければ作る
+        """
+        if self._connection is None or self._connection_pid != os.getpid():
+            # fork前に開いた接続は子プロセスでは使わない
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # WALでは、コミットごとのfsyncを省いてもファイルは壊れない
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, data BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(32)
+
+
+def open_session(session_id: Optional[str]) -> Session:
+    """
+    CookieのセッションIDに対応するセッションを読み込む
+    IDがない場合や、ストアに見つからない場合は、新しいIDで空のセッションを作る
+    """
+    if session_id and SESSION_ID_PATTERN.fullmatch(session_id):
+        data = session_store.load(session_id)
+        if data is not None:
+            return Session(session_id, data)
+    return Session(new_session_id(), new=True)
+
+
+def save_session(session: Session) -> Optional[Cookie]:
+    """
+    変更されたセッションをストアに保存し、クライアントに送るCookieを返却する (送る必要がない場合はNone)
+    """
+    if session.deleted:
+        for session_id in (session.session_id, session.previous_id):
+            if session_id is not None:
+                session_store.delete(session_id)
+        if session.new:
+            return None
+        # Cookieを削除させる
+        return session_cookie("", max_age=0)
+
+    if not session.modified:
+        return None
+    if session.previous_id is not None:
+        session_store.delete(session.previous_id)
+    session_store.save(session.session_id, session.data, new=session.new)
+    if session.new:
+        return session_cookie(session.session_id)
+    return None
+
+
+def session_cookie(value: str, max_age: Optional[int] = None) -> Cookie:
+    """
+    セッションIDを送るCookie
+    有効期限は付けず、ブラウザを閉じるまで保持させる (サーバ側ではSESSION_TTLで期限切れになる)
+    """
+    return Cookie(
+        name=settings.SESSION_COOKIE_NAME,
+        value=value,
+        max_age=max_age,
+        path="/",
+        secure=settings.SESSION_COOKIE_SECURE,
+        http_only=True,
+    )
+
+
+def create_session_store():
+    """
+    設定に従ってセッションのストアを生成する
+    """
+    memory = MemorySessionStore(settings.SESSION_TTL, settings.SESSION_MAX_BYTES, settings.SESSION_SHARDS)
+    if settings.SESSION_BACKEND == "memory":
+        return memory
+    if settings.SESSION_BACKEND == "sqlite":
+        return SQLiteSessionStore(
+            settings.SESSION_DB_PATH,
+            settings.SESSION_TTL,
+            cache=memory,
+            flush_interval=settings.SESSION_FLUSH_INTERVAL,
+        )
+    raise ValueError(f"unknown session backend: {settings.SESSION_BACKEND}")
+
+
+session_store = create_session_store()
@@ -1,13 +1,13 @@
+import asyncio
 import textwrap
-import urllib.parse
 from datetime import datetime
 from pprint import pformat
-from typing import Tuple, Optional
+from typing import AsyncIterator
 
-from common.http.cookie import Cookie
+from common.http.body import streaming_body
 from common.http.request import HTTPRequest
 from common.http.response import HTTPResponse
-from common.templates.renderer import render
+from common.templates.renderer import render_chunks
 
 
 def now(
@@ -17,9 +17,9 @@ def now(
     現在時刻を表示するHTMLを生成
     """
     context = {"now": datetime.now()}
-    html = render("now.html", context)
-    response_body = textwrap.dedent(html)
-    
+    # 描画結果はチャンクのリストのまま渡し、連結せずに送信する
+    response_body = render_chunks("now.html", context)
+
     return HTTPResponse(
         body=response_body
     )
@@ -52,27 +52,25 @@ def show_request(
         body=response_body
     )
 
+@streaming_body
 def parameters(
         request: HTTPRequest
     ) -> HTTPResponse:
     """
     POSTパラメータを表示するHTMLを生成
+    ボディはrequest.formがrequest.streamから少しずつ読み込み、パース済みのパラメータだけを保持する
     """
-    if request.method == "GET":
-        status_code = 405
-        response_body = b"<html><body><h1>405 Method Not Allowed</h1></body></html>"
-        content_type = "html"
-    if request.method == "POST":
-        post_params = urllib.parse.parse_qs(request.body.decode())
-        html = f"""\
-            <html>
-            <body>
-                <h1>Parameters:</h1>
-                <pre>{pformat(post_params)}</pre>                        
-            </body>
-            </html>
-        """
-        response_body = textwrap.dedent(html)
+    html = f"""\
+        <html>
+        <body>
+            <h1>Parameters:</h1>
+            <pre>{pformat(request.form)}</pre>
+            <h1>Files:</h1>
+            <pre>{pformat(request.files)}</pre>
+        </body>
+        </html>
+    """
+    response_body = textwrap.dedent(html)
 
     return HTTPResponse(
         body=response_body
@@ -112,24 +110,23 @@ def login(
     ログイン画面を表示する
     """
     if request.method == "GET":
-        response_body = render("login.html", {})
+        response_body = render_chunks("login.html", {})
         return HTTPResponse(
             body=response_body
         )
     if request.method == "POST":
-        post_params = urllib.parse.parse_qs(request.body.decode())
-        username = post_params.get("username", [""])[0]
-        email = post_params.get("email", [""])[0]
+        username = request.form.get("username", [""])[0]
+        email = request.form.get("email", [""])[0]
+
+        # ログインしたらセッションIDを発行し直し、ユーザー情報はサーバ側のセッションに保持する
+        request.session.cycle_id()
+        request.session["username"] = username
+        request.session["email"] = email
 
         headers = {"Location": "/welcome"}
-        cookies = [
-            Cookie(name="username", value=username, max_age=30),
-            Cookie(name="email", value=email, max_age=30)
-        ]
         return HTTPResponse(
             status_code=302,
             headers=headers,
-            cookies=cookies
         )
     
 def welcome(
@@ -138,16 +135,35 @@ def welcome(
     """
     ログイン後、ようこそ画面表示
     """
-    # Cookieが存在しない場合、ログイン画面にリダイレクト
-    if "username" not in request.cookies:
+    # ログインしていない場合、ログイン画面にリダイレクト
+    if "username" not in request.session:
         return HTTPResponse(
             status_code=302,
             headers={"Location": "/login"}
         )
     
-    username = request.cookies.get("username", "")
-    email = request.cookies.get("email", "")
-    body = render("welcome.html", context={"username": username, "email": email})
+    username = request.session.get("username", "")
+    email = request.session.get("email", "")
+    body = render_chunks("welcome.html", context={"username": username, "email": email})
     return HTTPResponse(
         body=body
     )
+
+
+async def events(
+        request: HTTPRequest
+) -> HTTPResponse:
+    """
+    現在時刻をServer-Sent Eventsの形式で1秒ごとに送信する
+    ボディは非同期ジェネレータで、生成したイベントから順にクライアントへ届く
+    """
+    async def stream() -> AsyncIterator[str]:
+        for i in range(5):
+            yield f"id: {i}\ndata: {datetime.now().isoformat()}\n\n"
+            await asyncio.sleep(1)
+
+    return HTTPResponse(
+        headers={"Cache-Control": "no-cache"},
+        content_type="text/event-stream",
+        body=stream()
+    )
@@ -0,0 +1,264 @@
+import atexit
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+import settings
+from common.http.request import HTTPRequest
+from common.http.response import HTTPResponse
+from common.server.logger import logger
+from common.server.rotation import rotate
+
+CLF_TIME_FORMAT = "%d/%b/%Y:%H:%M:%S +0000"
+
+# 1件のアクセスログ
+# (時刻, クライアントのアドレス, メソッド, パス, HTTPバージョン, ステータスコード, ボディのサイズ,
+#  Referer, User-Agent, 処理時間(秒), リクエストヘッダー)
+AccessRecord = Tuple[float, str, str, str, str, int, Optional[int], str, str, float, Optional[bytes]]
+
+
+class AccessLog:
+    """
+    アクセスログを記録する
+    リクエストを処理するスレッドはレコードをキューに積むだけで、整形と書き込みはバックグラウンドのスレッドがまとめて行う
+    キューにはcollections.dequeを使い、appendとpopleftがロックなしでスレッド間で安全に呼べることを利用する
+    複数のプロセスが同じファイルに書き込む場合(prefork)はrotate_by_sizeをFalseにし、ローテーションはマスターだけが行う
+    """
+    path: str
+    log_format: str
+    sample_rate: float
+    capture_head: bool
+
+    def __init__(
+            self,
+            path: str,
+            log_format: str = "combined",
+            enabled: bool = True,
+            sample_rate: float = 1.0,
+            capture_head: bool = False,
+            batch_size: int = 256,
+            flush_interval: float = 1.0,
+            max_pending: int = 10000,
+            max_bytes: int = 10 * 1024 * 1024,
+            backup_count: int = 5,
+            rotate_by_size: bool = True,
+    ):
+        if log_format not in ("common", "combined", "jsonl"):
+            raise ValueError(f"unknown access log format: {log_format}")
+        self.path = path
+        self.log_format = log_format
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.capture_head = capture_head
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        # Falseの場合は自分ではローテーションせず、他のプロセスが名前を付け替えたファイルを開き直すだけにする
+        self.rotate_by_size = rotate_by_size
+
+        self._records: Deque[AccessRecord] = deque()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._file = None
+        self._atexit_registered = False
+        # 書き込んだレコードの数と、キューが溢れて捨てたレコードの数
+        self.written = 0
+        self.dropped = 0
+
+    def log(
+            self,
+            address: Tuple[str, int],
+            request: Optional[HTTPRequest],
+            response: HTTPResponse,
+            started: Optional[float],
+            head: Optional[bytes] = None,
+    ):
+        """
+        1件のレコードをキューに積む
+        startedはtime.monotonic()で計ったリクエストヘッダーの受信完了時刻 (ヘッダーを読めなかった場合はNone)
+        """
+        if not self.enabled:
+            return
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        if len(self._records) >= self.max_pending:
+            # 書き込みが追いつかない場合は、リクエストの処理を待たせずにレコードを捨てる
+            self.dropped += 1
+            return
+
+        if request is None:
+            request = HTTPRequest()
+        self._records.append((
+            time.time(),
+            address[0] if address else "-",
+            request.method,
+            f"{request.path}?{request.query_string}" if request.query_string else request.path,
+            request.http_version,
+            response.status_code,
+            response.content_length,
+            request.get_header("Referer", ""),
+            request.get_header("User-Agent", ""),
+            0.0 if started is None else time.monotonic() - started,
+            head if self.capture_head else None,
+        ))
+
+        self.ensure_started()
+        if len(self._records) >= self.batch_size:
+            self._wakeup.set()
+
+    def ensure_started(self):
+        """
+        書き込み用のスレッドを起動する
+        fork後の子プロセスにはスレッドが引き継がれないため、動いていなければ起動し直す
+        """
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._file = None
+            self._thread = threading.Thread(target=self._run, name="AccessLogWriter", daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                # 終了時にキューに残ったレコードを書き込む
+                atexit.register(self.close)
+                self._atexit_registered = True
+
+    def close(self):
+        """
+        キューに残ったレコードを書き込んでからスレッドを止める
+        """
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._stopping = True
+        self._wakeup.set()
+        thread.join(timeout=5)
+
+    def stats(self) -> dict:
+        """
+        アクセスログの状態を返却
+        """
+        return {
+            "pending": len(self._records),
+            "written": self.written,
+            "dropped": self.dropped,
+        }
+
+    def _run(self):
+        """
+        一定間隔、またはレコードがbatch_size件たまるごとに、まとめてファイルへ書き込む
+        """
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self._flush()
+            except OSError as e:
+                logger.error("access_log", "Failed to write access log", error=e)
+            if self._stopping:
+                break
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _flush(self):
+        """
+        キューのレコードを取り出し、1回の書き込みでファイルへ追記する
+        """
+        lines: List[str] = []
+        while True:
+            try:
+                record = self._records.popleft()
+            except IndexError:
+                break
+            lines.append(self.format(record))
+        if not lines:
+            return
+
+        data = "".join(lines).encode()
+        file = self._open()
+        file.write(data)
+        file.flush()
+        self.written += len(lines)
+        if self.rotate_by_size and self.max_bytes and file.tell() >= self.max_bytes:
+            self._file.close()
+            self._file = None
+            rotate(self.path, self.backup_count)
+
+    def format(self, record: AccessRecord) -> str:
+        """
+        レコードを設定された形式の1行にする
+        """
+        (timestamp, host, method, path, http_version, status_code, size,
+         referer, user_agent, duration, head) = record
+        if self.log_format == "jsonl":
+            entry = {
+                "time": timestamp,
+                "remote_addr": host,
+                "method": method,
+                "path": path,
+                "http_version": http_version,
+                "status": status_code,
+                "bytes": size,
+                "referer": referer,
+                "user_agent": user_agent,
+                "duration_ms": round(duration * 1000, 3),
+            }
+            if head is not None:
+                entry["head"] = head.decode("latin-1")
+            return json.dumps(entry, ensure_ascii=False) + "\n"
+
+        request_line = f"{method} {path} {http_version}" if method else "-"
+        line = (
+            f'{host} - - [{time.strftime(CLF_TIME_FORMAT, time.gmtime(timestamp))}] '
+            f'"{request_line}" {status_code} {"-" if size is None else size}'
+        )
+        if self.log_format == "combined":
+            line += f' "{referer or "-"}" "{user_agent or "-"}"'
+        return line + "\n"
+
+    def _open(self):
+        """
+        ログファイルを追記モードで開く
+        開いているファイルが他のプロセスのローテーションで名前を付け替えられていた場合は、新しいファイルを開き直す
+        """
+        if self._file is not None and self._is_rotated():
+            self._file.close()
+            self._file = None
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, "ab")
+        return self._file
+
+    def _is_rotated(self) -> bool:
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+
+access_log = AccessLog(
+    settings.ACCESS_LOG_PATH,
+    log_format=settings.ACCESS_LOG_FORMAT,
+    enabled=settings.ACCESS_LOG_ENABLED,
+    sample_rate=settings.ACCESS_LOG_SAMPLE_RATE,
+    capture_head=settings.ACCESS_LOG_CAPTURE_HEAD,
+    batch_size=settings.ACCESS_LOG_BATCH_SIZE,
+    flush_interval=settings.ACCESS_LOG_FLUSH_INTERVAL,
+    max_pending=settings.ACCESS_LOG_MAX_PENDING,
+    max_bytes=settings.ACCESS_LOG_MAX_BYTES,
+    backup_count=settings.ACCESS_LOG_BACKUP_COUNT,
+)
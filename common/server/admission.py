@@ -0,0 +1,173 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import settings
+
+# 拒否する場合のステータスコードとRetry-Afterの秒数
+Rejection = Tuple[int, int]
+
+# 1回の受け付けで、使われなくなったクライアントを調べる数
+EVICT_BATCH = 2
+
+
+class ClientState:
+    """
+    1つのクライアント(IPアドレス)のトークンバケットと、接続中の数
+    """
+    __slots__ = ("tokens", "updated", "connections")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+        self.connections = 0
+
+
+class AdmissionControl:
+    """
+    接続を受け付けた直後に、リクエストを読む前にクライアントごとの流量を制限する
+    - クライアントごとに、トークンバケットでリクエストの頻度を制限する (429)
+    - クライアントごとの同時接続数を制限する (429)
+    - サーバ全体の同時接続数を制限する (503)
+    クライアントは最後に使われた順に並べ、接続がなくバケットが満杯に戻ったものから捨てる
+    """
+    enabled: bool
+    rate: float
+    burst: int
+    max_connections_per_client: int
+    max_connections: int
+    max_clients: int
+
+    def __init__(
+            self,
+            enabled: bool,
+            rate: float,
+            burst: int,
+            max_connections_per_client: int,
+            max_connections: int,
+            max_clients: int,
+    ):
+        self.enabled = enabled
+        self.rate = rate
+        self.burst = burst
+        self.max_connections_per_client = max_connections_per_client
+        self.max_connections = max_connections
+        self.max_clients = max_clients
+        # 空のバケットが満杯に戻るまでの時間。これだけ使われなかったクライアントは新規と同じ状態になる
+        self.idle_time = burst / rate
+
+        self._clients: "OrderedDict[str, ClientState]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.active_connections = 0
+        self.rejected_rate = 0
+        self.rejected_client_connections = 0
+        self.rejected_connections = 0
+
+    def admit(self, host: str) -> Optional[Rejection]:
+        """
+        新しい接続を受け付けるかを判定し、最初のリクエストの分のトークンを使う
+        受け付ける場合はNoneを返し、接続を閉じるときにreleaseを呼ぶ必要がある
+        拒否する場合は、返すべきステータスコードとRetry-Afterの秒数を返す
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            if self.active_connections >= self.max_connections:
+                self.rejected_connections += 1
+                return 503, 1
+
+            now = time.monotonic()
+            state = self._touch_locked(host, now)
+            if state.connections >= self.max_connections_per_client:
+                self.rejected_client_connections += 1
+                return 429, 1
+            rejection = self._take_locked(state)
+            if rejection is not None:
+                return rejection
+
+            state.connections += 1
+            self.active_connections += 1
+            self._evict_locked(now)
+        return None
+
+    def take(self, host: str) -> Optional[Rejection]:
+        """
+        keep-aliveの接続で続くリクエストの分のトークンを使う
+        トークンが足りない場合は、429とRetry-Afterの秒数を返す
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            return self._take_locked(self._touch_locked(host, time.monotonic()))
+
+    def release(self, host: str):
+        """
+        admitで受け付けた接続が閉じられたことを記録する
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            state = self._clients.get(host)
+            if state is not None and state.connections > 0:
+                state.connections -= 1
+                self.active_connections -= 1
+
+    def stats(self) -> dict:
+        """
+        受け付けの状態を返却
+        """
+        with self._lock:
+            return {
+                "tracked_clients": len(self._clients),
+                "admitted_connections": self.active_connections,
+                "rejected_rate": self.rejected_rate,
+                "rejected_client_connections": self.rejected_client_connections,
+                "rejected_connections": self.rejected_connections,
+            }
+
+    def _touch_locked(self, host: str, now: float) -> ClientState:
+        """
+        クライアントの状態を取得し、経過時間の分だけトークンを補充する
+        """
+        state = self._clients.get(host)
+        if state is None:
+            state = self._clients[host] = ClientState(self.burst, now)
+            return state
+        state.tokens = min(self.burst, state.tokens + (now - state.updated) * self.rate)
+        state.updated = now
+        self._clients.move_to_end(host)
+        return state
+
+    def _take_locked(self, state: ClientState) -> Optional[Rejection]:
+        if state.tokens < 1:
+            self.rejected_rate += 1
+            # 1リクエスト分のトークンがたまるまでの秒数
+            return 429, max(1, math.ceil((1 - state.tokens) / self.rate))
+        state.tokens -= 1
+        return None
+
+    def _evict_locked(self, now: float):
+        # 最も長く使われていないクライアントから順に調べ、接続がなく使われなくなったものを捨てる
+        # 上限を超えている場合は、バケットが満杯に戻る前でも捨てる
+        for _ in range(EVICT_BATCH):
+            if not self._clients:
+                return
+            host, state = next(iter(self._clients.items()))
+            if state.connections > 0:
+                self._clients.move_to_end(host)
+                continue
+            if len(self._clients) <= self.max_clients and now - state.updated < self.idle_time:
+                return
+            del self._clients[host]
+
+
+admission = AdmissionControl(
+    enabled=settings.ADMISSION_ENABLED,
+    rate=settings.ADMISSION_RATE,
+    burst=settings.ADMISSION_BURST,
+    max_connections_per_client=settings.ADMISSION_MAX_CONNECTIONS_PER_CLIENT,
+    max_connections=settings.ADMISSION_MAX_CONNECTIONS,
+    max_clients=settings.ADMISSION_MAX_CLIENTS,
+)
@@ -0,0 +1,441 @@
+import asyncio
+import signal
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Awaitable, Optional
+
+import settings
+from common.http.body import RequestBody, is_streaming_body
+from common.http.headers import Headers
+from common.http.request import HTTPRequest
+from common.http.response import FileResponse, HTTPResponse
+from common.server.access_log import access_log
+from common.server.admission import admission
+from common.server.deadline import deadlines
+from common.server.handler import ConnectionHandler
+from common.server.logger import logger
+from common.server.metrics import NULL_TIMER, metrics
+from common.server.reader import RequestError, RequestReader
+
+# 拒否した接続を閉じる前に、クライアントから届くデータを読み捨てる時間 (秒)
+REJECT_LINGER_TIMEOUT = 1.0
+
+
+class AsyncServer:
+    """
+    asyncioのイベントループで接続を処理するWebサーバ
+    待機中の接続はスレッドを占有せず、同期Viewのみをスレッドプールで実行する
+    """
+
+    def __init__(self):
+        self.handler = ConnectionHandler()
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.ASYNC_EXECUTOR_WORKERS,
+            thread_name_prefix="AsyncView",
+        )
+        self.server = None
+        self.active_connections = 0
+        self._stopped = None
+
+    def serve(self, server_socket: socket.socket = None):
+        """
+        サーバを起動
+        server_socketを渡した場合は、新たにsocketを作らずにそれで待ち受ける
+        """
+        logger.info("async_server", "Starting Async Web Server")
+        try:
+            asyncio.run(self.main(server_socket))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.executor.shutdown(wait=False)
+            logger.info("async_server", "Stopping Web Server")
+
+    async def main(self, server_socket: socket.socket = None):
+        """
+        通信を待ち受け、接続ごとにhandle_clientを実行する
+        SIGTERMを受け取ったら新しい接続の受け付けを止め、処理中の接続が終わるのを待ってから終了する
+        """
+        if server_socket is not None:
+            self.server = await asyncio.start_server(
+                self.handle_client,
+                sock=server_socket,
+                backlog=settings.ASYNC_BACKLOG,
+                limit=settings.ASYNC_STREAM_LIMIT,
+            )
+        else:
+            self.server = await asyncio.start_server(
+                self.handle_client,
+                host=settings.HOST,
+                port=settings.PORT,
+                backlog=settings.ASYNC_BACKLOG,
+                limit=settings.ASYNC_STREAM_LIMIT,
+                reuse_address=True,
+            )
+
+        self._stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        if threading.current_thread() is threading.main_thread():
+            # シグナルハンドラはメインスレッドでしか登録できない
+            loop.add_signal_handler(signal.SIGTERM, self.shutdown)
+
+        async with self.server:
+            await self._stopped.wait()
+            # 処理中の接続が終わるのを、SHUTDOWN_TIMEOUT秒まで待つ
+            deadline = loop.time() + settings.SHUTDOWN_TIMEOUT
+            while self.active_connections > 0 and loop.time() < deadline:
+                await asyncio.sleep(0.1)
+
+    def shutdown(self):
+        """
+        新しい接続の受け付けを止める。受け付け済みの接続は最後まで処理する
+        """
+        if self.server is not None:
+            self.server.close()
+        if self._stopped is not None:
+            self._stopped.set()
+
+    def stats(self) -> dict:
+        """
+        サーバの状態を返却
+        """
+        return dict(
+            admission.stats(),
+            **deadlines.stats(),
+            requests=self.handler.requests_handled,
+            active_connections=self.active_connections,
+        )
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        1つの接続を処理し、最後にsocketを閉じる
+        """
+        address = writer.get_extra_info("peername")
+        host = address[0] if address else ""
+        # クライアントごとの頻度や接続数の上限を超えていれば、リクエストを読まずに断る
+        rejection = admission.admit(host)
+        if rejection is not None:
+            await self.reject(reader, writer, *rejection)
+            return
+
+        self.active_connections += 1
+        # streaming_bodyのViewに渡す、一時ファイルに退避したボディ (レスポンスを送り終えたら閉じる)
+        spooled = None
+        try:
+            loop = asyncio.get_running_loop()
+            for served in range(1, settings.KEEP_ALIVE_MAX_REQUESTS + 1):
+                head, request, started, timer = b"", None, None, NULL_TIMER
+                # 読み込み中の区間 (タイムアウトした接続を区間ごとに数える)
+                phase = "header"
+                try:
+                    head = await self.read_head(reader, first=served == 1)
+                    if not head:
+                        # クライアントが接続を閉じたか、keep-aliveの待機時間を過ぎた
+                        break
+                    if served > 1:
+                        # 最初のリクエストの分は、接続を受け付けたときに数えている
+                        rejection = admission.take(host)
+                        if rejection is not None:
+                            await self.reject(reader, writer, *rejection)
+                            break
+                    started = time.monotonic()
+                    # StreamReaderからは受信を始めた時刻が分からないため、ヘッダーを読み終えた時点から計る
+                    timer = metrics.timer()
+
+                    request = self.handler.parse_http_request(head)
+                    timer.mark("parse")
+                    view = self.handler.resolve(request)
+                    timer.mark("resolve")
+
+                    phase = "body"
+                    if is_streaming_body(view):
+                        # イベントループ上でボディを一時ファイルへ退避し、Viewにはファイルから読ませる
+                        request.stream = spooled = await self.spool_body(reader, request.headers)
+                    else:
+                        request.body = await self.read_body(reader, request.headers)
+                    timer.mark("read")
+
+                    if self.handler.is_async_view(view):
+                        # async defのViewはイベントループ上で直接実行する
+                        response = await view(request)
+                        # 圧縮やセッションの保存(SQLiteへの書き込み)はイベントループを止めないよう、スレッドプールで行う
+                        await loop.run_in_executor(self.executor, self.handler.prepare_response, response, request)
+                    else:
+                        # 同期Viewはイベントループを止めないよう、スレッドプールで実行する
+                        response = await loop.run_in_executor(self.executor, self.handler.call_view, view, request)
+                    timer.mark("view")
+                except RequestError as e:
+                    # サイズ超過やタイムアウトなど、読み込めなかった理由をエラーレスポンスで返す
+                    if e.status_code == 408:
+                        deadlines.record_timeout(phase)
+                    response = self.handler.error_response(e.status_code)
+                    response_header = self.handler.build_header(response, HTTPRequest())
+                    timer.mark("header")
+                    writer.write(response_header)
+                    writer.write(response.body)
+                    await self.drain(writer)
+                    timer.mark("send")
+                    timer.finish(request, response.status_code)
+                    access_log.log(address, request, response, started, head)
+                    break
+
+                keep_alive = self.handler.should_keep_alive(request, response) and served < settings.KEEP_ALIVE_MAX_REQUESTS
+                response_header = self.handler.build_header(response, request, keep_alive)
+                timer.mark("header")
+
+                writer.write(response_header)
+                if response.is_streaming and request.method != "HEAD":
+                    # 生成しながら送るボディは、send_streamがチャンクごとの送信に期限を設ける
+                    await self.send_body(writer, response, request)
+                else:
+                    # 長さの決まったボディは、送信の全体にRESPONSE_TIMEOUT秒の期限を設ける (期限はイベントループのタイマーで管理される)
+                    await asyncio.wait_for(self.send_body(writer, response, request), settings.RESPONSE_TIMEOUT)
+                timer.mark("send")
+                if spooled is not None:
+                    spooled.close()
+                    spooled = None
+                timer.finish(request, response.status_code)
+                self.handler.count_request()
+                access_log.log(address, request, response, started, head)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # クライアントが途中で切断した
+            pass
+        except asyncio.TimeoutError:
+            # 送信が進まないまま時間を過ぎたか、送信の期限を過ぎた。送り残しを捨てて接続を切る
+            deadlines.record_timeout("write")
+            writer.transport.abort()
+        except Exception:
+            logger.exception(
+                "async_server", "Error while handling connection", remote_addr=writer.get_extra_info("peername")
+            )
+        finally:
+            if spooled is not None:
+                spooled.close()
+            self.active_connections -= 1
+            admission.release(host)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def reject(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, status_code: int, retry_after: int):
+        """
+        流量の制限のため、リクエストをパースせずにエラーを返して接続を閉じる
+        未読のリクエストを残したまま閉じるとRSTが送られ、クライアントがレスポンスを読めないことがあるため、
+        レスポンスの後にFINを送り、REJECT_LINGER_TIMEOUT秒まで届いたデータを読み捨ててから閉じる
+        """
+        response = self.handler.error_response(status_code, headers={"Retry-After": str(retry_after)})
+        writer.write(self.handler.build_header(response, HTTPRequest()))
+        writer.write(response.body)
+        try:
+            if writer.can_write_eof():
+                writer.write_eof()
+            await asyncio.wait_for(reader.read(settings.ASYNC_STREAM_LIMIT), REJECT_LINGER_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def send_body(self, writer: asyncio.StreamWriter, response: HTTPResponse, request: HTTPRequest):
+        """
+        レスポンスボディを書き込み、送信し終えるまで待つ
+        HEADの場合はボディを送らず、ヘッダーだけを送信する
+        """
+        if request.method == "HEAD":
+            body = response.body
+            if hasattr(body, "aclose"):
+                await body.aclose()
+            elif hasattr(body, "close"):
+                body.close()
+        elif isinstance(response, FileResponse):
+            await self.send_file(writer, response)
+        elif response.is_streaming:
+            await self.send_stream(writer, response, self.handler.use_chunked(request))
+        elif isinstance(response.body, list):
+            writer.writelines(response.body)
+        else:
+            writer.write(response.body)
+        await self.drain(writer)
+
+    async def drain(self, writer: asyncio.StreamWriter):
+        """
+        送信バッファが空くのを待つ
+        部分的な書き込みと送り直しはトランスポートが行い、WRITE_TIMEOUT秒の間まったく送信が進まなかった場合のみ打ち切る
+        """
+        while True:
+            pending = writer.transport.get_write_buffer_size()
+            try:
+                await asyncio.wait_for(writer.drain(), settings.WRITE_TIMEOUT)
+                return
+            except asyncio.TimeoutError:
+                if writer.transport.get_write_buffer_size() >= pending:
+                    raise
+
+    async def send_file(self, writer: asyncio.StreamWriter, response: FileResponse):
+        """
+        ファイルの内容をsendfileでsocketへ直接書き出す
+        sendfileが使えないトランスポートでは、loop.sendfileが読み込みと送信の繰り返しに切り替える
+        """
+        await self.drain(writer)
+        loop = asyncio.get_running_loop()
+        with open(response.path, "rb") as f:
+            await loop.sendfile(writer.transport, f, response.offset, response.length)
+
+    async def send_stream(self, writer: asyncio.StreamWriter, response: HTTPResponse, chunked: bool):
+        """
+        ボディを生成されたものから順に送信する
+        チャンクごとにdrainし、クライアントの受信が遅い場合はボディの生成を待たせる
+        1チャンクを送り終えるまでにRESPONSE_TIMEOUT秒の期限を設ける (ボディを生成している間は含めない)
+        """
+        async for data in self.iter_response(response):
+            if not data:
+                continue
+            writer.write(self.handler.encode_chunk(data) if chunked else data)
+            await asyncio.wait_for(self.drain(writer), settings.RESPONSE_TIMEOUT)
+        if chunked:
+            writer.write(b"0\r\n\r\n")
+
+    async def iter_response(self, response: HTTPResponse) -> AsyncIterator[bytes]:
+        """
+        ボディをバイト列のチャンクとして順に取り出す
+        同期ジェネレータは、イベントループを止めないようスレッドプールで1チャンクずつ進める
+        """
+        body = response.body
+        if hasattr(body, "__aiter__"):
+            async for data in body:
+                yield self.handler.to_bytes(data)
+            return
+
+        loop = asyncio.get_running_loop()
+        iterator = iter(body)
+        done = object()
+        try:
+            while True:
+                data = await loop.run_in_executor(self.executor, next, iterator, done)
+                if data is done:
+                    break
+                yield self.handler.to_bytes(data)
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    async def read_head(self, reader: asyncio.StreamReader, first: bool = False) -> bytes:
+        """
+        リクエストラインとヘッダーを、終端の空行まで含めて読み込む
+        1バイト目は、接続直後であればFIRST_BYTE_TIMEOUT、keep-aliveの待機中であればKEEP_ALIVE_TIMEOUT秒まで待ち、
+        そこからHEADER_TIMEOUT秒以内にヘッダーを送り終えない場合は408とする
+        """
+        try:
+            first_byte = await asyncio.wait_for(
+                reader.readexactly(1), settings.FIRST_BYTE_TIMEOUT if first else settings.KEEP_ALIVE_TIMEOUT
+            )
+        except asyncio.IncompleteReadError:
+            # 次のリクエストを送らずに切断された
+            return b""
+        except asyncio.TimeoutError:
+            deadlines.record_timeout("first_byte" if first else "idle")
+            return b""
+
+        try:
+            head = first_byte + await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), settings.HEADER_TIMEOUT)
+        except asyncio.IncompleteReadError:
+            # ヘッダーを送り終える前に切断された
+            return b""
+        except asyncio.TimeoutError:
+            raise RequestError(408, "header deadline exceeded")
+        except asyncio.LimitOverrunError:
+            raise RequestError(431, "request header too large")
+        if len(head) > settings.MAX_HEADER_SIZE:
+            raise RequestError(431, "request header too large")
+        return head
+
+    async def read_body(self, reader: asyncio.StreamReader, headers: Headers) -> bytes:
+        """
+        ヘッダーの内容に従ってボディをすべて読み込む
+        """
+        body = bytearray()
+        deadline = asyncio.get_running_loop().time() + settings.BODY_TIMEOUT
+        async for data in self.iter_body(reader, headers, settings.MAX_BODY_SIZE, deadline):
+            body += data
+        return bytes(body)
+
+    async def spool_body(self, reader: asyncio.StreamReader, headers: Headers) -> RequestBody:
+        """
+        ボディを一時ファイルへ書き出し、そこから読み出すRequestBodyを返却する
+        REQUEST_BODY_SPOOL_SIZEを超えた分はディスクに退避する
+        BODY_TIMEOUT秒以内に読み終えない場合は408とする。一時ファイルは、返却したRequestBodyを閉じると削除される
+        """
+        deadline = asyncio.get_running_loop().time() + settings.BODY_TIMEOUT
+        spooled = tempfile.SpooledTemporaryFile(max_size=settings.REQUEST_BODY_SPOOL_SIZE)
+        try:
+            async for data in self.iter_body(reader, headers, settings.MAX_STREAMING_BODY_SIZE, deadline):
+                spooled.write(data)
+        except BaseException:
+            spooled.close()
+            raise
+        spooled.seek(0)
+        return RequestBody(spooled.read, spooled.close)
+
+    async def iter_body(
+            self,
+            reader: asyncio.StreamReader,
+            headers: Headers,
+            limit: int,
+            deadline: Optional[float] = None,
+    ) -> AsyncIterator[bytes]:
+        """
+        ヘッダーの内容に従ってボディを少しずつ読み込む
+        Content-Lengthの分だけ、chunkedの場合は終端のチャンクまで読み込み、limitを超えるボディは413とする
+        deadline(loop.time()の値)を指定した場合は、その時刻までに読み終えない場合も408とする
+        """
+        if not RequestReader.is_chunked(headers):
+            remaining = RequestReader.parse_content_length(headers)
+            if remaining > limit:
+                raise RequestError(413, "request body too large")
+            while remaining > 0:
+                data = await self._read(reader.read(min(remaining, settings.BODY_CHUNK_SIZE)), deadline)
+                if not data:
+                    raise asyncio.IncompleteReadError(b"", remaining)
+                remaining -= len(data)
+                yield data
+            return
+
+        total = 0
+        while True:
+            size_line = await self._read(reader.readuntil(b"\r\n"), deadline)
+            try:
+                size = int(size_line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                raise RequestError(400, "invalid chunk size")
+            if size == 0:
+                break
+            total += size
+            if total > limit:
+                raise RequestError(413, "request body too large")
+
+            chunk = await self._read(reader.readexactly(size + 2), deadline)
+            if chunk[-2:] != b"\r\n":
+                raise RequestError(400, "chunk is not terminated by CRLF")
+            yield chunk[:-2]
+
+        # トレーラーは読み飛ばす
+        while await self._read(reader.readuntil(b"\r\n"), deadline) != b"\r\n":
+            pass
+
+    async def _read(self, read: Awaitable[bytes], deadline: Optional[float] = None) -> bytes:
+        """
+        リクエストの途中で、次のデータがREAD_TIMEOUT秒以内に届かない場合や、deadlineを過ぎた場合は408とする
+        """
+        timeout = settings.READ_TIMEOUT
+        if deadline is not None:
+            timeout = min(timeout, deadline - asyncio.get_running_loop().time())
+        try:
+            return await asyncio.wait_for(read, timeout)
+        except asyncio.TimeoutError:
+            raise RequestError(408, "timed out while reading request")
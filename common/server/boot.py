@@ -0,0 +1,58 @@
+import time
+from typing import Callable, Dict, Type, Union
+
+import settings
+from common.server.logger import logger
+
+
+def boot(engine: str) -> Type:
+    """
+    サーバの起動前に、これまで最初のリクエストで行っていた準備をまとめて済ませ、起動するサーバのクラスを返却する
+    - 選んだエンジンが使うモジュールだけを読み込む (URLパターンのコンパイルもここで行われる)
+    - パスパラメータを含まないURLパターンの解決結果をキャッシュする
+    - TEMPLATES_DIRのすべてのテンプレートをコンパイルする
+    - STATIC_ROOTの静的ファイルのメタデータと内容(圧縮済みの内容を含む)をキャッシュする
+    区間ごとにかかった時間をログに記録する
+    """
+    started = time.perf_counter()
+    timings: Dict[str, float] = {}
+    counts: Dict[str, Union[int, str]] = {}
+
+    def measure(name: str, step: Callable):
+        step_started = time.perf_counter()
+        result = step()
+        timings[name] = time.perf_counter() - step_started
+        return result
+
+    server_class = measure("import", lambda: import_engine(engine))
+
+    from common.templates.renderer import loader
+    from common.urls.resolver import router
+    from common.views.static_cache import static_file_cache
+
+    counts["routes"] = measure("routes", router.preload)
+    counts["templates"] = len(measure("templates", loader.preload))
+    counts["static_files"], counts["static_bytes"] = measure(
+        "static", lambda: static_file_cache.preload(settings.STATIC_ROOT)
+    )
+
+    logger.info(
+        "boot",
+        "Boot completed",
+        engine=engine,
+        seconds=f"{time.perf_counter() - started:.3f}",
+        **{f"{name}_seconds": f"{seconds:.3f}" for name, seconds in timings.items()},
+        **counts,
+    )
+    return server_class
+
+
+def import_engine(engine: str) -> Type:
+    """
+    エンジンのサーバのクラスを読み込む
+    """
+    if engine == "asyncio":
+        from common.server.async_server import AsyncServer
+        return AsyncServer
+    from common.server.server import Server
+    return Server
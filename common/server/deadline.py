@@ -0,0 +1,182 @@
+import heapq
+import itertools
+import os
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# 期限を設ける区間
+# first_byte: 接続してから最初のリクエストの1バイト目が届くまで
+# idle: keep-aliveの接続で、次のリクエストの1バイト目が届くまで
+# header: リクエストの1バイト目から、ヘッダーの終端まで
+# body: ボディを読み終えるまで
+# write: 1つのレスポンスを送り終えるまで (生成しながら送るボディの場合は、1チャンクを送り終えるまで)
+PHASES = ("first_byte", "idle", "header", "body", "write")
+
+# 解除した登録がこの数を超え、かつ全体の半分を超えたらヒープを作り直す
+COMPACT_THRESHOLD = 1024
+
+
+class Deadline:
+    """
+    1つの接続に設定した、現在の区間の期限
+    armで区間を切り替えるたびに新しい期限になり、以前の期限は無効になる
+    """
+    __slots__ = ("scheduler", "client_socket", "phase", "expires_at", "expired", "generation")
+
+    def __init__(self, scheduler: "DeadlineScheduler", client_socket: socket.socket):
+        self.scheduler = scheduler
+        self.client_socket = client_socket
+        self.phase: Optional[str] = None
+        self.expires_at = 0.0
+        # 期限を過ぎた区間 (期限内であればNone)
+        self.expired: Optional[str] = None
+        self.generation = 0
+
+    def arm(self, phase: str, seconds: float):
+        """
+        phaseの期限を、今からseconds秒後に設定する
+        """
+        self.scheduler.schedule(self, phase, time.monotonic() + seconds)
+
+    def cancel(self):
+        """
+        期限を解除する
+        """
+        if self.phase is not None:
+            self.scheduler.cancel(self)
+
+
+# (期限の時刻, 登録順, Deadline, 登録時の世代)
+HeapEntry = Tuple[float, int, Deadline, int]
+
+
+class DeadlineScheduler:
+    """
+    すべての接続の期限を1つのヒープで管理し、1つのスレッドで期限切れを処理する
+    接続ごとにタイマーを作らず、登録と解除はヒープへの追加と世代の更新だけで済ませる (解除した登録は後で読み捨てる)
+    読み込み中の区間が期限を過ぎたら受信側だけを閉じ、recvを空で返させる
+    受け取った側はDeadline.expiredを見て408を返し、送信中の区間の場合は送受信ともに閉じて送信を打ち切らせる
+    """
+
+    def __init__(self):
+        self._heap: List[HeapEntry] = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        # スレッドを起動したプロセス (fork後の子プロセスでは起動し直す)
+        self._pid: Optional[int] = None
+        # ヒープに残っている、解除済みの登録の数
+        self._stale = 0
+        self._timeouts: Dict[str, int] = dict.fromkeys(PHASES, 0)
+        self._timeouts_lock = threading.Lock()
+
+    def create(self, client_socket: socket.socket) -> Deadline:
+        """
+        接続の期限を作成する。期限はarmで設定するまで無効
+        """
+        return Deadline(self, client_socket)
+
+    def schedule(self, deadline: Deadline, phase: str, expires_at: float):
+        self.ensure_started()
+        with self._condition:
+            if deadline.phase is not None:
+                self._stale += 1
+            deadline.generation += 1
+            deadline.phase = phase
+            deadline.expires_at = expires_at
+            heapq.heappush(self._heap, (expires_at, next(self._counter), deadline, deadline.generation))
+            if self._heap[0][2] is deadline:
+                # 最も早い期限が変わった場合のみ、待機中のスレッドを起こす
+                self._condition.notify()
+
+    def cancel(self, deadline: Deadline):
+        with self._condition:
+            if deadline.phase is not None:
+                deadline.generation += 1
+                deadline.phase = None
+                self._stale += 1
+                self._compact_locked()
+
+    def record_timeout(self, phase: str):
+        """
+        期限や待機時間を過ぎて打ち切った接続を数える
+        """
+        with self._timeouts_lock:
+            self._timeouts[phase] = self._timeouts.get(phase, 0) + 1
+
+    def stats(self) -> dict:
+        """
+        区間ごとの、期限を過ぎて打ち切った接続の数を返却
+        """
+        with self._timeouts_lock:
+            stats = {f"timeouts_{phase}": count for phase, count in self._timeouts.items()}
+        with self._condition:
+            stats["pending_deadlines"] = len(self._heap) - self._stale
+        return stats
+
+    def ensure_started(self):
+        """
+        期限切れを処理するスレッドを起動する
+        """
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                # fork前に登録された期限は親プロセスの接続のもの
+                self._heap.clear()
+                self._stale = 0
+                self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="DeadlineScheduler", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                expired = self._pop_expired_locked()
+                if not expired:
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._condition.wait(timeout)
+                    continue
+            for deadline, phase in expired:
+                self._expire(deadline, phase)
+
+    def _pop_expired_locked(self) -> List[Tuple[Deadline, str]]:
+        now = time.monotonic()
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, deadline, generation = heapq.heappop(self._heap)
+            if generation != deadline.generation:
+                self._stale -= 1
+                continue
+            expired.append((deadline, deadline.phase))
+            deadline.expired = deadline.phase
+            deadline.phase = None
+        # 先頭に残った解除済みの登録は、期限を待たずに読み捨てる
+        while self._heap and self._heap[0][3] != self._heap[0][2].generation:
+            heapq.heappop(self._heap)
+            self._stale -= 1
+        return expired
+
+    @staticmethod
+    def _expire(deadline: Deadline, phase: str):
+        how = socket.SHUT_RDWR if phase == "write" else socket.SHUT_RD
+        try:
+            deadline.client_socket.shutdown(how)
+        except OSError:
+            # 既に閉じられている
+            pass
+
+    def _compact_locked(self):
+        # 解除済みの登録が多くなったら、有効な登録だけでヒープを作り直す
+        if self._stale > COMPACT_THRESHOLD and self._stale * 2 > len(self._heap):
+            self._heap = [entry for entry in self._heap if entry[3] == entry[2].generation]
+            heapq.heapify(self._heap)
+            self._stale = 0
+
+
+deadlines = DeadlineScheduler()
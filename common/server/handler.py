@@ -0,0 +1,427 @@
+import asyncio
+import inspect
+import socket
+import threading
+import time
+from typing import Callable, Iterator, Optional, Tuple, Union
+
+import settings
+from common.http.body import is_streaming_body
+from common.http.compression import add_vary, compress, is_compressible, negotiate_encoding
+from common.http.headers import HeaderSerializer, reason_phrase
+from common.http.mime import guess_content_type
+from common.http.request import HTTPRequest
+from common.http.session import save_session
+from common.http.response import FileResponse, HTTPResponse
+from common.server.access_log import access_log
+from common.server.admission import admission
+from common.server.deadline import Deadline, deadlines
+from common.server.logger import logger
+from common.server.metrics import NULL_TIMER, RequestTimer, metrics
+from common.server.parser import parse_request
+from common.server.reader import RequestError, RequestReader
+from common.server.writer import ResponseWriter
+from common.urls.resolver import URLResolver
+
+
+class ConnectionHandler:
+    """
+    クライアントと接続済みのsocketを受け取り、リクエストを処理してレスポンスを送信する
+    インスタンスは接続ごとの状態を持たないため、スレッド間で共有して使い回せる
+    """
+    def __init__(self):
+        self.header_serializer = HeaderSerializer(settings.KEEP_ALIVE_TIMEOUT)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # これまでに送信したレスポンスの数
+        self.requests_handled = 0
+
+    def handle(self, client_socket: socket, address: Tuple[str, int], accepted_at: float = None):
+        """
+        1つの接続を処理し、最後にsocketを閉じる
+        keep-aliveの場合は、同じsocketで続けてリクエストを処理する
+        accepted_atはtime.perf_counter()で計った接続の受け付け時刻
+        """
+        # ヘッダー、ボディ、レスポンスの送信のそれぞれに期限を設け、少しずつ送受信するクライアントに占有されないようにする
+        deadline = deadlines.create(client_socket)
+        try:
+            if accepted_at is not None:
+                metrics.observe_accept(time.perf_counter() - accepted_at)
+            reader = RequestReader(client_socket, self.get_read_chunk(), deadline)
+
+            for served in range(1, settings.KEEP_ALIVE_MAX_REQUESTS + 1):
+                head, request, started, timer = b"", None, None, NULL_TIMER
+                try:
+                    head = reader.read_head(first=served == 1)
+                    if not head:
+                        # クライアントが接続を閉じたか、keep-aliveの待機時間を過ぎた
+                        break
+                    if served > 1:
+                        # 最初のリクエストの分は、接続を受け付けたときに数えている
+                        rejection = admission.take(address[0])
+                        if rejection is not None:
+                            self.send_error(client_socket, rejection[0], headers={"Retry-After": str(rejection[1])})
+                            break
+                    started = time.monotonic()
+                    timer = metrics.timer(reader.head_started)
+                    timer.mark("read")
+
+                    request = self.parse_http_request(head)
+                    timer.mark("parse")
+                    view = self.resolve(request)
+                    timer.mark("resolve")
+
+                    if is_streaming_body(view):
+                        # ボディはViewがrequest.streamから必要な分だけ読み込む
+                        deadline.cancel()
+                        request.stream = reader.open_body(request.headers, settings.MAX_STREAMING_BODY_SIZE)
+                    else:
+                        deadline.arm("body", settings.BODY_TIMEOUT)
+                        request.body = reader.read_body(request.headers)
+                        deadline.cancel()
+                        timer.mark("read")
+
+                    # レスポンスを生成
+                    response = self.call_view(view, request)
+
+                    if is_streaming_body(view):
+                        # 次のリクエストを読めるよう、Viewが読み残したボディを読み捨てる
+                        request.stream.drain()
+                    timer.mark("view")
+                except RequestError as e:
+                    # サイズ超過やタイムアウトなど、読み込めなかった理由をエラーレスポンスで返す
+                    if e.status_code == 408:
+                        deadlines.record_timeout(deadline.expired or deadline.phase or "body")
+                    response = self.error_response(e.status_code)
+                    self.send_response(client_socket, response, HTTPRequest(), timer=timer, deadline=deadline)
+                    timer.mark("send")
+                    timer.finish(request, response.status_code)
+                    access_log.log(address, request, response, started, head)
+                    break
+
+                keep_alive = self.should_keep_alive(request, response) and served < settings.KEEP_ALIVE_MAX_REQUESTS
+                self.send_response(client_socket, response, request, keep_alive, timer=timer, deadline=deadline)
+                deadline.cancel()
+                timer.mark("send")
+                timer.finish(request, response.status_code)
+                self.count_request()
+                access_log.log(address, request, response, started, head)
+                if not keep_alive:
+                    break
+        except (ConnectionError, TimeoutError) as e:
+            # クライアントが途中で切断したか、送信が進まないまま時間を過ぎたか、送信の期限を過ぎた
+            if deadline.expired == "write" or isinstance(e, TimeoutError):
+                deadlines.record_timeout("write")
+        except Exception:
+            logger.exception("worker", "Error while handling connection", remote_addr=address)
+
+        finally:
+            logger.debug("worker", "Closing connection", remote_addr=address)
+            deadline.cancel()
+            admission.release(address[0])
+            client_socket.close()
+
+    def count_request(self):
+        """
+        送信したレスポンスの数を数える
+        """
+        with self._lock:
+            self.requests_handled += 1
+
+    def get_read_chunk(self) -> bytearray:
+        """
+        受信用の領域をスレッドごとに1つだけ確保し、接続をまたいで使い回す
+        """
+        chunk = getattr(self._local, "read_chunk", None)
+        if chunk is None:
+            chunk = bytearray(settings.READ_CHUNK_SIZE)
+            self._local.read_chunk = chunk
+        return chunk
+
+    def get_event_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        スレッドからasync defのViewを実行するためのイベントループを、スレッドごとに1つだけ作成する
+        """
+        loop = getattr(self._local, "loop", None)
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            self._local.loop = loop
+        return loop
+
+    def should_keep_alive(self, request: HTTPRequest, response: HTTPResponse = None) -> bool:
+        """
+        Connectionヘッダーとプロトコルのバージョンから、接続を維持するかを判定
+        HTTP/1.1は既定で維持し、HTTP/1.0は明示された場合のみ維持する
+        チャンク転送を使えないHTTP/1.0でサイズの分からないボディを送る場合は、接続を閉じて終端を伝える
+        """
+        if response is not None and response.is_streaming and not self.use_chunked(request):
+            return False
+
+        tokens = [
+            token.strip().lower()
+            for token in request.get_header("Connection", "").split(",")
+        ]
+        if request.http_version == "HTTP/1.1":
+            return "close" not in tokens
+        return "keep-alive" in tokens
+
+    def resolve(self, request: HTTPRequest) -> Callable[[HTTPRequest], HTTPResponse]:
+        """
+        URL解決を行い、リクエストを処理するViewを返却する
+        """
+        return URLResolver().resolve(request)
+
+    def call_view(self, view: Callable[[HTTPRequest], HTTPResponse], request: HTTPRequest) -> HTTPResponse:
+        """
+        Viewを呼び出し、送信できる状態に整えたレスポンスを返却する
+        URLパターンにレスポンスキャッシュが指定されている場合は、キャッシュしたレスポンスを優先して返す
+        """
+        if request.response_cache is not None:
+            return request.response_cache.get_or_render(request, self.render_view, view)
+        return self.render_view(view, request)
+
+    def render_view(self, view: Callable[[HTTPRequest], HTTPResponse], request: HTTPRequest) -> HTTPResponse:
+        """
+        Viewを呼び出し、ボディの変換や圧縮を行ったレスポンスを返却する
+        async defのViewは、スレッドごとのイベントループで完了まで実行する
+        """
+        response = view(request)
+        if inspect.isawaitable(response):
+            response = self.get_event_loop().run_until_complete(response)
+        self.prepare_response(response, request)
+        return response
+
+    @staticmethod
+    def is_async_view(view: Callable) -> bool:
+        """
+        async defで定義されたViewかを判定
+        """
+        return inspect.iscoroutinefunction(view)
+
+    def prepare_response(self, response: HTTPResponse, request: HTTPRequest):
+        """
+        ボディをバイト列にしてContent-Typeを確定し、セッションを保存して、クライアントが対応していればボディを圧縮する
+        """
+        if isinstance(response.body, str):
+            # レスポンスボディが文字列の場合、バイト列に変換
+            response.body = response.body.encode()
+        elif isinstance(response.body, (list, tuple)):
+            # 文字列のリストは、要素ごとにバイト列に変換する
+            response.body = [
+                chunk.encode() if isinstance(chunk, str) else chunk
+                for chunk in response.body
+            ]
+
+        if response.content_type is None:
+            response.content_type = guess_content_type(request.path)
+
+        if request.loaded_session is not None:
+            # Viewがセッションを変更した場合は保存し、必要であればセッションIDのCookieを付ける
+            cookie = save_session(request.loaded_session)
+            if cookie is not None:
+                response.cookies.append(cookie)
+
+        if settings.COMPRESSION_ENABLED:
+            self.compress_response(response, request)
+
+    def compress_response(self, response: HTTPResponse, request: HTTPRequest):
+        """
+        Accept-Encodingに従ってボディを圧縮する
+        静的ファイルのように、View側で圧縮方式を決めたレスポンス(Vary: Accept-Encoding付き)はそのまま送る
+        """
+        if isinstance(response, FileResponse) or response.status_code != 200:
+            return
+        if response.is_streaming:
+            # 送信しながら生成するボディは、全体が揃わないため圧縮しない
+            return
+        if "Content-Encoding" in response.headers or "accept-encoding" in response.headers.get("Vary", "").lower():
+            return
+        if not is_compressible(response.content_type):
+            return
+
+        # 圧縮するかどうかに関わらず、Accept-Encodingによって内容が変わることをキャッシュに伝える
+        add_vary(response.headers)
+        if response.content_length < settings.COMPRESSION_MIN_SIZE:
+            return
+
+        encoding = negotiate_encoding(request.get_header("Accept-Encoding"))
+        if encoding is None:
+            return
+
+        body = response.body
+        if isinstance(body, list):
+            body = b"".join(body)
+        compressed = compress(body, encoding)
+        if len(compressed) < len(body):
+            response.body = compressed
+            response.headers["Content-Encoding"] = encoding
+
+    def send_response(
+            self,
+            client_socket: socket,
+            response: HTTPResponse,
+            request: HTTPRequest,
+            keep_alive: bool = False,
+            timer: RequestTimer = NULL_TIMER,
+            deadline: Optional[Deadline] = None,
+    ):
+        """
+        レスポンスヘッダーとボディを組み立ててクライアントへ送信する
+        deadlineを渡した場合は、長さの決まったボディは送信の全体に、生成しながら送るボディはチャンクごとの送信に
+        RESPONSE_TIMEOUT秒の期限を設ける (ボディを生成している間は期限を設けない)
+        """
+        # レスポンスヘッダーを生成
+        response_header = self.build_header(response, request, keep_alive)
+        timer.mark("header")
+
+        writer = ResponseWriter(client_socket, settings.WRITE_TIMEOUT)
+        if deadline is not None:
+            deadline.arm("write", settings.RESPONSE_TIMEOUT)
+
+        if request.method == "HEAD":
+            # HEADにはボディを送らない (Content-Lengthなどのヘッダーは、GETの場合と同じものを送る)
+            # 送らなかったボディは、keep-aliveの次のレスポンスの前に混ざらないよう、ここで捨てる
+            writer.write([response_header])
+            self.close_body(response)
+            return
+
+        if isinstance(response, FileResponse):
+            # ヘッダーを送信した後、ファイルの内容をsendfileでsocketへ直接書き出す
+            # sendfileが使えない環境では、socket.sendfileが通常の送信に切り替える
+            writer.write([response_header])
+            with open(response.path, "rb") as f:
+                client_socket.sendfile(f, response.offset, response.length)
+            return
+
+        if response.is_streaming:
+            # ヘッダーを先に送り、ボディは生成されたものから順に送信する
+            # 期限はチャンクを送る間だけ設け、次のチャンクを生成している間は解除する (SSEのような長い送信を打ち切らない)
+            writer.write([response_header])
+            chunked = self.use_chunked(request)
+            if deadline is not None:
+                deadline.cancel()
+            for data in self.iter_response(response):
+                if data:
+                    if deadline is not None:
+                        deadline.arm("write", settings.RESPONSE_TIMEOUT)
+                    # チャンクの前後の区切りも別のバッファとして渡し、データをコピーしない
+                    writer.write([b"%x\r\n" % len(data), data, b"\r\n"] if chunked else [data])
+                    if deadline is not None:
+                        deadline.cancel()
+            if chunked:
+                if deadline is not None:
+                    deadline.arm("write", settings.RESPONSE_TIMEOUT)
+                writer.write([b"0\r\n\r\n"])
+            return
+
+        # ヘッダーとボディは連結せず、別々のバッファのまま1回で送信する
+        if isinstance(response.body, list):
+            writer.write([response_header, *response.body])
+        else:
+            writer.write([response_header, response.body])
+
+    def iter_response(self, response: HTTPResponse) -> Iterator[bytes]:
+        """
+        ボディをバイト列のチャンクとして順に取り出す
+        非同期ジェネレータは、スレッドごとのイベントループで1チャンクずつ進める
+        """
+        body = response.body
+        if hasattr(body, "__aiter__"):
+            loop = self.get_event_loop()
+            iterator = body.__aiter__()
+            try:
+                while True:
+                    try:
+                        data = loop.run_until_complete(iterator.__anext__())
+                    except StopAsyncIteration:
+                        break
+                    yield self.to_bytes(data)
+            finally:
+                # 送信が途中で失敗した場合も、ジェネレータの後処理を実行する
+                if hasattr(iterator, "aclose"):
+                    loop.run_until_complete(iterator.aclose())
+            return
+
+        try:
+            for data in body:
+                yield self.to_bytes(data)
+        finally:
+            if hasattr(body, "close"):
+                body.close()
+
+    def close_body(self, response: HTTPResponse):
+        """
+        送信しないボディのジェネレータを閉じ、後処理を実行する
+        """
+        body = response.body
+        if hasattr(body, "aclose"):
+            self.get_event_loop().run_until_complete(body.aclose())
+        elif hasattr(body, "close"):
+            body.close()
+
+    @staticmethod
+    def to_bytes(data: Union[bytes, str]) -> bytes:
+        """
+        ボディのチャンクをバイト列に変換
+        """
+        return data.encode() if isinstance(data, str) else bytes(data)
+
+    @staticmethod
+    def encode_chunk(data: bytes) -> bytes:
+        """
+        Transfer-Encoding: chunkedの1チャンク分の形式にする
+        """
+        return b"%x\r\n" % len(data) + data + b"\r\n"
+
+    @staticmethod
+    def use_chunked(request: HTTPRequest) -> bool:
+        """
+        サイズの分からないボディをTransfer-Encoding: chunkedで送れるかを判定
+        チャンク転送はHTTP/1.1から使える
+        """
+        return request.http_version == "HTTP/1.1"
+
+    def send_error(self, client_socket: socket, status_code: int, headers: dict = None):
+        """
+        リクエストを読まずにエラーレスポンスを返す
+        過負荷時など、パースやViewの実行を避けたい場面で使う
+        """
+        response = self.error_response(status_code, headers)
+        self.send_response(client_socket, response, HTTPRequest())
+
+    def error_response(self, status_code: int, headers: dict = None) -> HTTPResponse:
+        """
+        ステータスコードに対応するエラーレスポンスを生成
+        """
+        reason = f"{status_code} {reason_phrase(status_code)}"
+        return HTTPResponse(
+            status_code=status_code,
+            headers=headers,
+            content_type="text/html; charset=utf-8",
+            body=f"<html><body><h1>{reason}</h1></body></html>".encode(),
+        )
+
+    def build_header(self, response: HTTPResponse, request: HTTPRequest, keep_alive: bool = False) -> bytearray:
+        """
+        HTTPレスポンスヘッダを、終端の空行まで含めたバイト列にする
+        """
+        if response.content_type is None:
+            response.content_type = guess_content_type(request.path)
+
+        content_length = response.content_length
+        return self.header_serializer.serialize(
+            response.status_code,
+            response.headers,
+            response.cookies,
+            content_length=content_length,
+            content_type=response.content_type,
+            chunked=content_length is None and self.use_chunked(request),
+            keep_alive=keep_alive,
+        )
+
+    def parse_http_request(self, request) -> HTTPRequest:
+        """
+        リクエストラインとヘッダーをパースし、HTTPRequestを返却する
+        ボディはパースの後、RequestReaderで読み込む
+        """
+        return parse_request(request)
@@ -0,0 +1,244 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Optional, TextIO, Tuple
+
+import settings
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVELS = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "ERROR": ERROR}
+LEVEL_NAMES = {number: name for name, number in LEVELS.items()}
+
+# 1件のログ
+# (時刻, レベル, 発生元, メッセージ, 付加情報, 例外)
+LogRecord = Tuple[float, int, str, str, dict, Optional[tuple]]
+
+
+class Logger:
+    """
+    サーバの動作ログを記録する
+    呼び出したスレッドはレコードをリングバッファに積むだけで、整形と書き込みはバックグラウンドのスレッドがまとめて行う
+    設定したレベル未満のログは、レコードを作らずにすぐ戻る
+    リングバッファが一杯の場合は、古いレコードから捨てる
+    """
+    level: int
+    log_format: str
+    path: Optional[str]
+
+    def __init__(
+            self,
+            level: str = "INFO",
+            log_format: str = "text",
+            path: Optional[str] = None,
+            buffer_size: int = 10000,
+            flush_interval: float = 0.5,
+    ):
+        self._records: Deque[LogRecord] = deque()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._file: Optional[TextIO] = None
+        self._atexit_registered = False
+        # 書き込み用のスレッドを起動したプロセス
+        self._pid: Optional[int] = None
+        # 書き込んだレコードの数と、リングバッファから溢れて捨てたレコードの数
+        self.written = 0
+        self.dropped = 0
+        self.configure(level, log_format, path, buffer_size, flush_interval)
+
+    def configure(
+            self,
+            level: str = "INFO",
+            log_format: str = "text",
+            path: Optional[str] = None,
+            buffer_size: int = 10000,
+            flush_interval: float = 0.5,
+    ):
+        """
+        出力の設定を変更する
+        書き込み用のスレッドが動いている場合は、バッファに残ったレコードを書き込んで止めてから変更する (次のログで起動し直す)
+        """
+        if level.upper() not in LEVELS:
+            raise ValueError(f"unknown log level: {level}")
+        if log_format not in ("text", "jsonl"):
+            raise ValueError(f"unknown log format: {log_format}")
+        self.close()
+        self.level = LEVELS[level.upper()]
+        self.log_format = log_format
+        # Noneの場合は標準エラー出力に書き込む
+        self.path = path
+        self.flush_interval = flush_interval
+        self._records = deque(self._records, maxlen=buffer_size)
+
+    def debug(self, source: str, message: str, **fields):
+        if self.level <= DEBUG:
+            self._log(DEBUG, source, message, fields)
+
+    def info(self, source: str, message: str, **fields):
+        if self.level <= INFO:
+            self._log(INFO, source, message, fields)
+
+    def warning(self, source: str, message: str, **fields):
+        if self.level <= WARNING:
+            self._log(WARNING, source, message, fields)
+
+    def error(self, source: str, message: str, **fields):
+        if self.level <= ERROR:
+            self._log(ERROR, source, message, fields)
+
+    def exception(self, source: str, message: str, **fields):
+        """
+        処理中の例外のトレースバックを付けて、ERRORとして記録する
+        トレースバックの整形は書き込み用のスレッドで行う
+        """
+        if self.level <= ERROR:
+            self._log(ERROR, source, message, fields, sys.exc_info())
+
+    def _log(self, level: int, source: str, message: str, fields: dict, exc_info: Optional[tuple] = None):
+        self.ensure_started()
+        if len(self._records) == self._records.maxlen:
+            self.dropped += 1
+        self._records.append((time.time(), level, source, message, fields, exc_info))
+        if level >= ERROR:
+            # エラーはすぐに書き出す
+            self._wakeup.set()
+
+    def ensure_started(self):
+        """
+        書き込み用のスレッドを起動する
+        fork後の子プロセスにはスレッドが引き継がれないため、動いていなければ起動し直す
+        """
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # fork前に積まれたレコードは親プロセスが書き込むため、子プロセスでは捨てる
+                if self._pid is not None:
+                    self._records.clear()
+                self._pid = os.getpid()
+            self._stopping = False
+            self._file = None
+            self._thread = threading.Thread(target=self._run, name="LogWriter", daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                # 終了時にバッファに残ったレコードを書き込む
+                atexit.register(self.close)
+                self._atexit_registered = True
+
+    def close(self):
+        """
+        バッファに残ったレコードを書き込んでからスレッドを止める
+        """
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._stopping = True
+        self._wakeup.set()
+        thread.join(timeout=5)
+
+    def stats(self) -> dict:
+        """
+        ログの状態を返却
+        """
+        return {
+            "pending": len(self._records),
+            "written": self.written,
+            "dropped": self.dropped,
+        }
+
+    def _run(self):
+        """
+        一定間隔、またはエラーが記録されるごとに、まとめて書き込む
+        """
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self._flush()
+            except OSError:
+                # ログを書き込めない場合は、サーバの処理を止めずにレコードを捨てる
+                pass
+            if self._stopping:
+                break
+        if self._file is not None and self.path is not None:
+            self._file.close()
+            self._file = None
+
+    def _flush(self):
+        """
+        バッファのレコードを取り出し、1回の書き込みで出力する
+        """
+        lines = []
+        while True:
+            try:
+                record = self._records.popleft()
+            except IndexError:
+                break
+            lines.append(self.format(record))
+        if not lines:
+            return
+
+        file = self._open()
+        file.write("".join(lines))
+        file.flush()
+        self.written += len(lines)
+
+    def format(self, record: LogRecord) -> str:
+        """
+        レコードを設定された形式の1行(例外がある場合はトレースバックを含む複数行)にする
+        """
+        timestamp, level, source, message, fields, exc_info = record
+        if self.log_format == "jsonl":
+            entry = {
+                "time": timestamp,
+                "level": LEVEL_NAMES[level],
+                "source": source,
+                "message": message,
+            }
+            entry.update(fields)
+            if exc_info is not None:
+                entry["traceback"] = "".join(traceback.format_exception(*exc_info))
+            return json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+
+        line = (
+            f"{time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(timestamp))} "
+            f"{LEVEL_NAMES[level]:<7} [{source}] {message}"
+        )
+        for key, value in fields.items():
+            line += f" {key}={value}"
+        line += "\n"
+        if exc_info is not None:
+            line += "".join(traceback.format_exception(*exc_info))
+        return line
+
+    def _open(self) -> TextIO:
+        """
+        出力先を開く
+        """
+        if self._file is None:
+            if self.path is None:
+                self._file = sys.stderr
+            else:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+        return self._file
+
+
+logger = Logger(
+    level=settings.LOG_LEVEL,
+    log_format=settings.LOG_FORMAT,
+    path=settings.LOG_PATH,
+    buffer_size=settings.LOG_BUFFER_SIZE,
+    flush_interval=settings.LOG_FLUSH_INTERVAL,
+)
@@ -0,0 +1,250 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import settings
+from common.http.request import HTTPRequest
+from common.server.admission import admission
+from common.server.deadline import PHASES, deadlines
+from common.views.response_cache import response_caches
+
+# methodラベルに使うメソッド。それ以外はOTHERにまとめ、任意のメソッドを送られても系列が増え続けないようにする
+METHOD_LABELS = frozenset(("GET", "HEAD", "POST", "PUT", "DELETE", "CONNECT", "OPTIONS", "TRACE", "PATCH"))
+
+
+class Histogram:
+    """
+    値を上限ごとのバケットに数えるヒストグラム
+    記録時は該当するバケットだけを数え、累積はテキストに書き出すときに計算する
+    """
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        # 最後の要素は、どの上限も超えた値(+Inf)の数
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[int]:
+        """
+        上限以下の値の数を、バケットごとに累積して返却する
+        """
+        total = 0
+        result = []
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+
+
+class RequestTimer:
+    """
+    1リクエストの処理時間を区間ごとに計る
+    markを呼ぶたびに、前回のmarkからの経過時間をその区間に足す
+    区間は read(受信), parse(パース), resolve(URL解決), view(Viewの実行), header(ヘッダーの生成), send(送信)
+    """
+    __slots__ = ("metrics", "started", "phases", "_last")
+
+    def __init__(self, metrics: "Metrics", started: Optional[float] = None):
+        now = time.perf_counter()
+        self.metrics = metrics
+        self.started = now if started is None else started
+        self.phases: Dict[str, float] = {}
+        self._last = self.started
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + (now - self._last)
+        self._last = now
+
+    def finish(self, request: Optional[HTTPRequest], status_code: int):
+        """
+        計測した時間をメトリクスに記録する
+        リクエストをパースできなかった場合、ルートとメソッドは"-"として集計する
+        """
+        if request is None:
+            route, method = "-", "-"
+        else:
+            route, method = request.route or "-", request.method
+        self.metrics.observe(route, method, status_code, self.phases, self._last - self.started)
+
+
+class NullTimer:
+    """
+    メトリクスが無効なときに使う、何も記録しないタイマー
+    """
+    __slots__ = ()
+
+    def mark(self, phase: str):
+        pass
+
+    def finish(self, request: Optional[HTTPRequest], status_code: int):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class Metrics:
+    """
+    ルートごとの処理時間のヒストグラムとリクエスト数を集計し、Prometheusのテキスト形式で書き出す
+    1リクエスト分の記録は、ロックを1回取るだけでまとめて行う
+    """
+    enabled: bool
+    buckets: Tuple[float, ...]
+
+    def __init__(self, enabled: bool, buckets: Sequence[float]):
+        self.enabled = enabled
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._phases: Dict[Tuple[str, str], Histogram] = {}
+        self._durations: Dict[str, Histogram] = {}
+        self._requests: Dict[Tuple[str, str, int], int] = {}
+        self._accept = Histogram(self.buckets)
+
+    def timer(self, started: Optional[float] = None):
+        """
+        1リクエスト分のタイマーを返却する。無効な場合は何も記録しないタイマーを返す
+        startedはtime.perf_counter()で計ったリクエストの受信開始時刻
+        """
+        if not self.enabled:
+            return NULL_TIMER
+        return RequestTimer(self, started)
+
+    def observe_accept(self, seconds: float):
+        """
+        接続を受け付けてから、処理を始めるまでの待ち時間を記録する
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._accept.observe(seconds)
+
+    def observe(self, route: str, method: str, status_code: int, phases: Dict[str, float], total: float):
+        """
+        1リクエスト分の区間ごとの時間と、全体の時間を記録する
+        """
+        with self._lock:
+            for phase, seconds in phases.items():
+                histogram = self._phases.get((route, phase))
+                if histogram is None:
+                    histogram = self._phases[(route, phase)] = Histogram(self.buckets)
+                histogram.observe(seconds)
+
+            histogram = self._durations.get(route)
+            if histogram is None:
+                histogram = self._durations[route] = Histogram(self.buckets)
+            histogram.observe(total)
+
+            key = (route, method if method in METHOD_LABELS or method == "-" else "OTHER", status_code)
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+    def clear(self):
+        """
+        集計をすべて破棄する
+        """
+        with self._lock:
+            self._phases.clear()
+            self._durations.clear()
+            self._requests.clear()
+            self._accept = Histogram(self.buckets)
+
+    def render(self) -> str:
+        """
+        Prometheusのテキスト形式(text/plain; version=0.0.4)で書き出す
+        """
+        with self._lock:
+            requests = sorted(self._requests.items())
+            durations = [(route, self._snapshot(h)) for route, h in sorted(self._durations.items())]
+            phases = [(key, self._snapshot(h)) for key, h in sorted(self._phases.items())]
+            accept = self._snapshot(self._accept)
+
+        lines = [
+            "# HELP http_requests_total Number of HTTP responses sent.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (route, method, status_code), count in requests:
+            labels = f'route="{escape_label(route)}",method="{escape_label(method)}",status="{status_code}"'
+            lines.append(f"http_requests_total{{{labels}}} {count}")
+
+        lines.append("# HELP http_request_duration_seconds Time from receiving a request to finishing its response.")
+        lines.append("# TYPE http_request_duration_seconds histogram")
+        for route, snapshot in durations:
+            self._render_histogram(lines, "http_request_duration_seconds", f'route="{escape_label(route)}"', snapshot)
+
+        lines.append("# HELP http_request_phase_seconds Time spent in each phase of handling a request.")
+        lines.append("# TYPE http_request_phase_seconds histogram")
+        for (route, phase), snapshot in phases:
+            labels = f'route="{escape_label(route)}",phase="{phase}"'
+            self._render_histogram(lines, "http_request_phase_seconds", labels, snapshot)
+
+        lines.append("# HELP http_connection_accept_wait_seconds Time from accepting a connection to starting to handle it.")
+        lines.append("# TYPE http_connection_accept_wait_seconds histogram")
+        self._render_histogram(lines, "http_connection_accept_wait_seconds", "", accept)
+
+        admission_stats = admission.stats()
+        lines.append("# HELP http_admission_rejections_total Connections and requests refused before reading them.")
+        lines.append("# TYPE http_admission_rejections_total counter")
+        for reason, key in (
+                ("rate", "rejected_rate"),
+                ("client_connections", "rejected_client_connections"),
+                ("connections", "rejected_connections"),
+        ):
+            lines.append(f'http_admission_rejections_total{{reason="{reason}"}} {admission_stats[key]}')
+        lines.append("# HELP http_admission_connections Connections currently admitted.")
+        lines.append("# TYPE http_admission_connections gauge")
+        lines.append(f"http_admission_connections {admission_stats['admitted_connections']}")
+
+        timeout_stats = deadlines.stats()
+        lines.append("# HELP http_timeouts_total Connections closed because a read or write phase ran out of time.")
+        lines.append("# TYPE http_timeouts_total counter")
+        for phase in PHASES:
+            lines.append(f'http_timeouts_total{{phase="{phase}"}} {timeout_stats["timeouts_" + phase]}')
+
+        caches = [(cache.route, cache.stats()) for cache in response_caches if cache.route]
+        lines.append("# HELP http_response_cache_requests_total Lookups of cached view responses by result.")
+        lines.append("# TYPE http_response_cache_requests_total counter")
+        for route, stats in caches:
+            for result, key in (("hit", "hits"), ("miss", "misses"), ("coalesced", "coalesced")):
+                labels = f'route="{escape_label(route)}",result="{result}"'
+                lines.append(f"http_response_cache_requests_total{{{labels}}} {stats[key]}")
+        lines.append("# HELP http_response_cache_evictions_total Cached view responses evicted to stay within the limits.")
+        lines.append("# TYPE http_response_cache_evictions_total counter")
+        for route, stats in caches:
+            lines.append(f'http_response_cache_evictions_total{{route="{escape_label(route)}"}} {stats["evictions"]}')
+        lines.append("# HELP http_response_cache_bytes Size of cached view responses.")
+        lines.append("# TYPE http_response_cache_bytes gauge")
+        for route, stats in caches:
+            lines.append(f'http_response_cache_bytes{{route="{escape_label(route)}"}} {stats["bytes"]}')
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _snapshot(histogram: Histogram) -> Tuple[List[int], float, int]:
+        return histogram.cumulative(), histogram.sum, histogram.count
+
+    def _render_histogram(self, lines: List[str], name: str, labels: str, snapshot: Tuple[List[int], float, int]):
+        cumulative, total, count = snapshot
+        prefix = f"{labels}," if labels else ""
+        for bound, value in zip(self.buckets, cumulative):
+            lines.append(f'{name}_bucket{{{prefix}le="{bound:g}"}} {value}')
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {cumulative[-1]}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {total:.9g}")
+        lines.append(f"{name}_count{suffix} {count}")
+
+
+def escape_label(value: str) -> str:
+    """
+    ラベルの値に使えない文字をエスケープする
+    """
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Metrics(settings.METRICS_ENABLED, settings.METRICS_BUCKETS)
@@ -0,0 +1,115 @@
+from typing import Dict, List, Tuple
+
+import settings
+from common.http.headers import Headers
+from common.http.request import HTTPRequest
+from common.server.reader import RequestError
+
+SUPPORTED_VERSIONS = (b"HTTP/1.1", b"HTTP/1.0")
+
+# メソッドに使える文字 (token, RFC 9110 5.6.2)
+TOKEN_CHARS = frozenset(b"!#$%&'*+-.^_`|~0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz")
+
+# よく使われるメソッドは、検証と文字列への変換を省く
+KNOWN_METHODS = {
+    method.encode(): method
+    for method in ("GET", "HEAD", "POST", "PUT", "DELETE", "PATCH", "OPTIONS")
+}
+
+# ヘッダー名の末尾に置けない空白 (SP, HTAB)
+WHITESPACE = b" \t"
+# 行の先頭が空白の場合は、前の行の折り返し(obs-fold)
+FOLDING_PREFIXES = (b" ", b"\t")
+
+
+def parse_request(head: bytes) -> HTTPRequest:
+    """
+    リクエストラインとヘッダー(終端の空行まで)をパースし、HTTPRequestを返却する
+    ヘッダーは行に分けて名前の索引を作るだけにし、値を文字列にするのは参照したときに行う
+    不正なリクエストや上限を超えたリクエストは、返すべきステータスコードを持つRequestErrorを送出する
+    """
+    line_end = head.find(b"\r\n")
+    if line_end < 0:
+        raise RequestError(400, "request line is not terminated")
+    if line_end > settings.MAX_REQUEST_LINE_SIZE:
+        raise RequestError(414, "request line too long")
+    method, target, http_version = parse_request_line(head[:line_end])
+
+    # 終端の空行(\r\n\r\n)の手前までがヘッダー
+    block = head[line_end + 2:len(head) - 4]
+    lines = block.split(b"\r\n") if block else []
+    if len(lines) > settings.MAX_HEADER_COUNT:
+        raise RequestError(431, "too many header fields")
+    headers = Headers(lines, index_headers(lines))
+
+    # Cookieとクエリ文字列は、Viewが参照したときにHTTPRequestがパースする
+    path, _, query_string = target.partition("?")
+    return HTTPRequest(
+        method=method,
+        path=path,
+        http_version=http_version,
+        headers=headers,
+        query_string=query_string,
+    )
+
+
+def parse_request_line(line: bytes) -> Tuple[str, str, str]:
+    """
+    リクエストラインを method, request-target, HTTPバージョン に分割する
+    """
+    parts = line.split(b" ")
+    if len(parts) != 3 or not parts[0] or not parts[1]:
+        raise RequestError(400, "malformed request line")
+    method, target, http_version = parts
+
+    if http_version not in SUPPORTED_VERSIONS:
+        if not http_version.startswith(b"HTTP/"):
+            raise RequestError(400, "malformed request line")
+        raise RequestError(505, "unsupported HTTP version")
+    if target[0] != 0x2F and target != b"*":  # "/"
+        raise RequestError(400, "invalid request target")
+
+    method_name = KNOWN_METHODS.get(method)
+    if method_name is None:
+        if not TOKEN_CHARS.issuperset(method):
+            raise RequestError(400, "invalid method")
+        method_name = method.decode("ascii")
+
+    # request-targetはASCIIだけで書かれる。それ以外のバイトを含む場合は1バイトを1文字として扱う
+    return method_name, target.decode("latin-1"), http_version.decode("ascii")
+
+
+def index_headers(lines: List[bytes]) -> Dict[bytes, bytes]:
+    """
+    ヘッダーの各行を検証し、小文字の名前から最初の値を引く索引を作る
+    ボディの長さが一意に決まらないリクエストは、リクエストスマグリングを防ぐため拒否する (RFC 9112 6.3)
+    - 値の異なるContent-Lengthが複数ある
+    - Transfer-EncodingとContent-Lengthの両方がある
+    - Transfer-Encodingが複数ある
+    転送符号化はchunkedだけに対応し、それ以外(gzip, chunkedのような連結も含む)は501とする (RFC 9112 6.1)
+    """
+    index: Dict[bytes, bytes] = {}
+    # 後ろの行から登録し、同じ名前の場合は前の行の値で上書きする
+    for line in reversed(lines):
+        name, colon, value = line.partition(b":")
+        if name[:1] in FOLDING_PREFIXES:
+            # 複数行に折り返したヘッダー(obs-fold)は受け付けない (RFC 9112 5.2)
+            raise RequestError(400, "obsolete line folding is not allowed")
+        if not colon or not name:
+            raise RequestError(400, "malformed header line")
+        if name[-1] in WHITESPACE:
+            # 名前とコロンの間の空白は、リクエストスマグリングを防ぐため拒否する (RFC 9112 5.1)
+            raise RequestError(400, "whitespace before colon in header")
+        name = name.lower()
+        if name == b"content-length" and name in index and index[name].strip() != value.strip():
+            raise RequestError(400, "conflicting Content-Length")
+        if name == b"transfer-encoding" and name in index:
+            raise RequestError(400, "multiple Transfer-Encoding")
+        index[name] = value
+    transfer_encoding = index.get(b"transfer-encoding")
+    if transfer_encoding is not None:
+        if b"content-length" in index:
+            raise RequestError(400, "both Transfer-Encoding and Content-Length")
+        if transfer_encoding.strip(WHITESPACE).lower() != b"chunked":
+            raise RequestError(501, "unsupported Transfer-Encoding")
+    return index
@@ -0,0 +1,104 @@
+import queue
+import socket
+import threading
+import time
+from typing import List, Tuple
+
+from common.server.handler import ConnectionHandler
+
+
+class WorkerPool:
+    """
+    固定数の常駐ワーカースレッドが、有界キューから受け付け済みのsocketを取り出して処理する
+    キューが満杯の場合はsubmitがFalseを返すので、呼び出し側で接続を拒否する
+    handlerはサーバが持つものを全スレッドで共有する
+    """
+    size: int
+    queue_size: int
+
+    def __init__(self, size: int, queue_size: int, handler: ConnectionHandler):
+        self.size = size
+        self.queue_size = queue_size
+        self.handler = handler
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._handled = 0
+        self._rejected = 0
+
+    def start(self):
+        """
+        ワーカースレッドを起動
+        """
+        for i in range(self.size):
+            thread = threading.Thread(target=self._run, name=f"PoolWorker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def shutdown(self):
+        """
+        キューに残った接続を処理し終えてから、ワーカースレッドを停止する
+        """
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+
+    def submit(self, client_socket: socket, address: Tuple[str, int]) -> bool:
+        """
+        接続をキューに積む。キューが満杯の場合はFalseを返す
+        """
+        try:
+            self._queue.put_nowait((client_socket, address, time.perf_counter()))
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            return False
+        return True
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        処理待ちの接続数
+        """
+        return self._queue.qsize()
+
+    @property
+    def busy_workers(self) -> int:
+        """
+        接続を処理中のワーカー数
+        """
+        return self._busy
+
+    def stats(self) -> dict:
+        """
+        プールの状態を返却
+        """
+        with self._lock:
+            return {
+                "size": self.size,
+                "queue_size": self.queue_size,
+                "queue_depth": self._queue.qsize(),
+                "busy_workers": self._busy,
+                "handled": self._handled,
+                "rejected": self._rejected,
+            }
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            client_socket, address, accepted_at = item
+            with self._lock:
+                self._busy += 1
+            try:
+                self.handler.handle(client_socket, address, accepted_at)
+            finally:
+                with self._lock:
+                    self._busy -= 1
+                    self._handled += 1
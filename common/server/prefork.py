@@ -0,0 +1,340 @@
+import importlib
+import json
+import os
+import selectors
+import signal
+import socket
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+import settings
+from common.server.logger import logger
+from common.server.rotation import needs_rotation, rotate
+
+
+class ChildProcess:
+    """
+    マスタープロセスから見た、ワーカープロセスの情報
+    """
+    pid: int
+    generation: int
+    started_at: float
+    stats_fd: int
+
+    def __init__(self, pid: int, generation: int, stats_fd: int):
+        self.pid = pid
+        self.generation = generation
+        self.started_at = time.monotonic()
+        self.stats_fd = stats_fd
+        # パイプから受け取った、改行で終わっていない統計情報
+        self.pending = b""
+
+
+class PreforkServer:
+    """
+    マスタープロセスが複数のワーカープロセスをforkし、同じポートでリクエストを処理させる
+    SO_REUSEPORTが使える場合は各ワーカーが自分のsocketで待ち受け、使えない場合はマスターが作ったsocketを引き継ぐ
+
+    マスターはアプリケーションのモジュールを読み込まないため、ワーカーはfork後に最新のコードと設定を読み込む
+    (マスターが読み込むのは設定とロガーだけで、ロガーはワーカーで設定を読み込み直した後に設定し直す)
+    全ワーカーが追記するアクセスログは、ワーカーどうしで競合しないようマスターだけがローテーションする
+    シグナル:
+        SIGHUP  新しいワーカーを起動してから古いワーカーを停止する (処理中の接続は最後まで処理する)
+        SIGUSR1 全ワーカーの統計情報を集計して表示する
+        SIGTERM/SIGINT すべてのワーカーを停止して終了する
+    """
+    engine: str
+    workers: int
+    reuse_port: bool
+
+    def __init__(self, engine: str = None, workers: int = None, reuse_port: bool = None):
+        if engine is None:
+            engine = settings.SERVER_ENGINE
+        if not workers:
+            workers = settings.PREFORK_WORKERS or os.cpu_count() or 1
+        if reuse_port is None:
+            reuse_port = settings.PREFORK_REUSE_PORT and hasattr(socket, "SO_REUSEPORT")
+
+        self.engine = engine
+        self.workers = workers
+        self.reuse_port = reuse_port
+
+        self.children: Dict[int, ChildProcess] = {}
+        self.child_stats: Dict[int, dict] = {}
+        self.generation = 0
+        self.listen_socket: Optional[socket.socket] = None
+        self.selector = selectors.DefaultSelector()
+
+        self._running = True
+        self._reload_requested = False
+        self._stats_requested = False
+
+    def serve(self):
+        """
+        ワーカープロセスを起動し、終了するまで監視する
+        """
+        if not hasattr(os, "fork"):
+            raise RuntimeError("prefork mode requires os.fork")
+
+        logger.info("master", "Starting Prefork Master", pid=os.getpid(), workers=self.workers, engine=self.engine)
+
+        if not self.reuse_port:
+            # ワーカーに引き継ぐsocket
+            self.listen_socket = create_listen_socket(reuse_port=False)
+
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+        signal.signal(signal.SIGUSR1, self._handle_stats)
+
+        try:
+            for _ in range(self.workers):
+                self.spawn()
+
+            while self._running:
+                self.read_stats(timeout=0.5)
+                self.reap()
+                self.rotate_access_log()
+
+                if self._reload_requested:
+                    self._reload_requested = False
+                    self.reload()
+                if self._stats_requested:
+                    self._stats_requested = False
+                    logger.info("master", "Stats", stats=json.dumps(self.aggregate_stats()))
+        finally:
+            self.stop_children()
+            logger.info("master", "Stopping Prefork Master")
+
+    def spawn(self):
+        """
+        現在の世代のワーカープロセスを1つ起動する
+        """
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # ワーカープロセス
+            os.close(read_fd)
+            exit_code = 0
+            try:
+                self.run_child(write_fd)
+            except BaseException:
+                logger.exception("worker", "Worker process failed", pid=os.getpid())
+                exit_code = 1
+            finally:
+                try:
+                    # マスターから引き継いだ後始末(atexitなど)を実行せずに終了するため、ログとセッションだけは書き出しておく
+                    close_child_resources()
+                finally:
+                    os._exit(exit_code)
+
+        os.close(write_fd)
+        os.set_blocking(read_fd, False)
+        child = ChildProcess(pid, self.generation, read_fd)
+        self.children[pid] = child
+        self.selector.register(read_fd, selectors.EVENT_READ, child)
+        logger.info("master", "Spawned worker", pid=pid, generation=self.generation)
+
+    def run_child(self, stats_fd: int):
+        """
+        ワーカープロセスでサーバを起動する
+        """
+        # 停止はマスターからのSIGTERMで行うため、端末からのCtrl+Cは無視する
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+        signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+        self.selector.close()
+        for child in self.children.values():
+            os.close(child.stats_fd)
+
+        # 設定の変更をreloadで反映できるよう、fork後に読み込み直す
+        # ロガー以外のモジュールはここで初めて読み込まれ、読み込み直した設定で作られる
+        importlib.reload(settings)
+        logger.configure(
+            level=settings.LOG_LEVEL,
+            log_format=settings.LOG_FORMAT,
+            path=settings.LOG_PATH,
+            buffer_size=settings.LOG_BUFFER_SIZE,
+            flush_interval=settings.LOG_FLUSH_INTERVAL,
+        )
+        # アクセスログはマスターがローテーションし、ワーカーは付け替えられたファイルを開き直すだけにする
+        from common.server.access_log import access_log
+        access_log.rotate_by_size = False
+        # セッションは他のワーカーで作成や変更されるため、SQLiteのストアは毎回ファイルで確かめる
+        from common.http.session import SQLiteSessionStore, session_store
+        if isinstance(session_store, SQLiteSessionStore):
+            session_store.shared = True
+
+        # 最初のリクエストの前に、URLパターン・テンプレート・静的ファイルの準備を済ませる
+        from common.server.boot import boot
+        server = boot(self.engine)()
+
+        server_socket = self.listen_socket
+        if server_socket is None:
+            server_socket = create_listen_socket(reuse_port=True)
+
+        reporter = threading.Thread(target=self.report_stats, args=(server, stats_fd), daemon=True)
+        reporter.start()
+        server.serve(server_socket)
+
+    def report_stats(self, server, stats_fd: int):
+        """
+        ワーカープロセスの統計情報を、定期的にパイプ経由でマスターへ送る
+        """
+        with os.fdopen(stats_fd, "wb", buffering=0) as pipe:
+            while True:
+                stats = dict(server.stats(), pid=os.getpid())
+                try:
+                    pipe.write(json.dumps(stats).encode() + b"\n")
+                except (BrokenPipeError, OSError):
+                    return
+                time.sleep(settings.PREFORK_STATS_INTERVAL)
+
+    def read_stats(self, timeout: float):
+        """
+        ワーカープロセスから届いた統計情報を読み込む
+        """
+        for key, _ in self.selector.select(timeout):
+            child: ChildProcess = key.data
+            try:
+                data = os.read(child.stats_fd, 65536)
+            except BlockingIOError:
+                continue
+            if not data:
+                self.selector.unregister(child.stats_fd)
+                continue
+
+            lines = (child.pending + data).split(b"\n")
+            child.pending = lines.pop()
+            if lines:
+                self.child_stats[child.pid] = json.loads(lines[-1])
+
+    def reap(self):
+        """
+        終了したワーカープロセスを回収し、現在の世代のワーカーであれば起動し直す
+        """
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            child = self.children.pop(pid, None)
+            self.child_stats.pop(pid, None)
+            if child is None:
+                continue
+            try:
+                self.selector.unregister(child.stats_fd)
+            except KeyError:
+                pass
+            os.close(child.stats_fd)
+
+            logger.info("master", "Worker exited", pid=pid, status=os.waitstatus_to_exitcode(status))
+            if self._running and child.generation == self.generation:
+                if time.monotonic() - child.started_at < 1:
+                    # 起動直後に異常終了を繰り返す場合に、forkし続けないよう少し待つ
+                    time.sleep(1)
+                self.spawn()
+
+    def rotate_access_log(self):
+        """
+        アクセスログがACCESS_LOG_MAX_BYTES以上になっていればローテーションする
+        """
+        if not settings.ACCESS_LOG_ENABLED or not needs_rotation(settings.ACCESS_LOG_PATH, settings.ACCESS_LOG_MAX_BYTES):
+            return
+        try:
+            rotate(settings.ACCESS_LOG_PATH, settings.ACCESS_LOG_BACKUP_COUNT)
+        except OSError as e:
+            logger.error("master", "Failed to rotate access log", error=e)
+
+    def reload(self):
+        """
+        新しい世代のワーカーを起動してから、古い世代のワーカーを停止する
+        古いワーカーは新しい接続の受け付けを止め、処理中の接続を終えてから終了する
+        """
+        logger.info("master", "Reloading workers")
+        old_children = [child for child in self.children.values() if child.generation == self.generation]
+        self.generation += 1
+        for _ in range(self.workers):
+            self.spawn()
+        for child in old_children:
+            self._kill(child.pid, signal.SIGTERM)
+
+    def stop_children(self):
+        """
+        すべてのワーカーを停止し、SHUTDOWN_TIMEOUT秒を過ぎても終了しないワーカーは強制終了する
+        """
+        self._running = False
+        for pid in list(self.children):
+            self._kill(pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + settings.SHUTDOWN_TIMEOUT
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.children):
+            self._kill(pid, signal.SIGKILL)
+        self.reap()
+
+    def aggregate_stats(self) -> dict:
+        """
+        全ワーカーの統計情報を合計し、ワーカーごとの値と合わせて返却する
+        """
+        total: Dict[str, float] = {}
+        for stats in self.child_stats.values():
+            for key, value in stats.items():
+                if key != "pid" and isinstance(value, (int, float)):
+                    total[key] = total.get(key, 0) + value
+        return {
+            "workers": len(self.children),
+            "total": total,
+            "per_worker": list(self.child_stats.values()),
+        }
+
+    def _kill(self, pid: int, signum: int):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _handle_stop(self, signum, frame):
+        self._running = False
+
+    def _handle_reload(self, signum, frame):
+        self._reload_requested = True
+
+    def _handle_stats(self, signum, frame):
+        self._stats_requested = True
+
+
+def close_child_resources():
+    """
+    ワーカープロセスで読み込んだセッションとアクセスログ、およびロガーのバッファを書き出す
+    読み込む前に失敗した場合は、読み込まれたものだけを書き出す
+    """
+    session = sys.modules.get("common.http.session")
+    if session is not None:
+        session.session_store.close()
+    access_log = sys.modules.get("common.server.access_log")
+    if access_log is not None:
+        access_log.access_log.close()
+    logger.close()
+
+
+def create_listen_socket(reuse_port: bool) -> socket.socket:
+    """
+    通信を待ち受けるためのsocketを生成
+    reuse_portを指定すると、複数のプロセスが同じポートで待ち受けられる(SO_REUSEPORT)
+    """
+    server_socket = socket.socket()
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+    server_socket.bind((settings.HOST, settings.PORT))
+    server_socket.listen(settings.PREFORK_BACKLOG)
+    return server_socket
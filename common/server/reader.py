@@ -0,0 +1,202 @@
+import socket
+import time
+from typing import Callable, Optional
+
+import settings
+from common.http.body import RequestBody, RequestError
+from common.http.headers import Headers
+from common.server.deadline import Deadline, deadlines
+
+
+class RequestReader:
+    """
+    socketからHTTPリクエストを1件ずつ読み出す
+    ヘッダーの終端まで読み込んだ後、Content-Lengthの分だけ(chunkedの場合は終端のチャンクまで)ボディを読み込む
+    読みすぎたデータはバッファに残し、パイプラインされた次のリクエストとして扱う
+    """
+
+    def __init__(self, client_socket: socket, chunk: Optional[bytearray] = None, deadline: Optional[Deadline] = None):
+        if chunk is None:
+            chunk = bytearray(settings.READ_CHUNK_SIZE)
+
+        self.client_socket = client_socket
+        self.buffer = bytearray()
+        self.head_started = 0.0
+        # 区間ごとの期限。期限を過ぎると受信側が閉じられ、recvが空で返る
+        self.deadline = deadline
+        # recv_intoで使い回す受信用の領域
+        self._chunk = memoryview(chunk)
+
+    def read_head(self, first: bool = False) -> bytes:
+        """
+        リクエストラインとヘッダーを、終端の空行まで含めて読み込む
+        次のリクエストを受け取る前にクライアントが切断した場合や、
+        1バイト目を待つ時間を過ぎた場合は、空のバイト列を返す
+        firstは、接続して最初のリクエストかどうか
+        """
+        # 1バイト目を待つ間は、接続直後であればFIRST_BYTE_TIMEOUT、keep-aliveの待機中であればKEEP_ALIVE_TIMEOUTを適用する
+        if not self.buffer:
+            self.client_socket.settimeout(settings.FIRST_BYTE_TIMEOUT if first else settings.KEEP_ALIVE_TIMEOUT)
+            try:
+                if not self._recv():
+                    return b""
+            except socket.timeout:
+                deadlines.record_timeout("first_byte" if first else "idle")
+                return b""
+        # リクエストの受信を始めた時刻 (メトリクスで受信にかかった時間を計る)
+        self.head_started = time.perf_counter()
+        self.client_socket.settimeout(settings.READ_TIMEOUT)
+        if self.deadline is not None:
+            self.deadline.arm("header", settings.HEADER_TIMEOUT)
+
+        header_end = self._find(b"\r\n\r\n", 0, settings.MAX_HEADER_SIZE)
+        if header_end < 0 or header_end + 4 > settings.MAX_HEADER_SIZE:
+            raise RequestError(431, "request header too large")
+
+        return self._take(header_end + 4)
+
+    def read_body(self, headers: Headers) -> bytes:
+        """
+        ヘッダーの内容に従ってボディをすべて読み込む
+        """
+        return self.open_body(headers, settings.MAX_BODY_SIZE).read()
+
+    def open_body(self, headers: Headers, limit: int) -> RequestBody:
+        """
+        ボディを必要な分だけsocketから読み込むRequestBodyを返却する
+        limitを超えるボディは413として扱う
+        """
+        if self.is_chunked(headers):
+            return RequestBody(self._chunked_reader(limit))
+
+        content_length = self.parse_content_length(headers)
+        if content_length > limit:
+            raise RequestError(413, "request body too large")
+        return RequestBody(self._fixed_reader(content_length))
+
+    @staticmethod
+    def parse_content_length(headers: Headers) -> int:
+        """
+        ヘッダーからContent-Lengthを取り出す。存在しない場合は0
+        """
+        value = headers.get_raw("Content-Length")
+        if value is None:
+            return 0
+        if not value.isdigit():
+            raise RequestError(400, "invalid Content-Length")
+        return int(value)
+
+    @staticmethod
+    def is_chunked(headers: Headers) -> bool:
+        """
+        ボディがchunked形式で送られてくるかを判定
+        Transfer-Encodingの値はパース時(index_headers)にchunkedだけであることを確認している
+        """
+        return headers.get_raw("Transfer-Encoding") is not None
+
+    def _fixed_reader(self, length: int) -> Callable[[int], bytes]:
+        remaining = length
+
+        def read_chunk(size: int) -> bytes:
+            nonlocal remaining
+            if remaining == 0:
+                return b""
+            if not self.buffer:
+                self._recv_or_fail()
+            data = self._take(min(size, remaining, len(self.buffer)))
+            remaining -= len(data)
+            return data
+
+        return read_chunk
+
+    def _chunked_reader(self, limit: int) -> Callable[[int], bytes]:
+        # 現在のチャンクの残りサイズ、これまでに読んだ合計サイズ、終端のチャンクを読んだか
+        remaining = 0
+        total = 0
+        done = False
+
+        def read_chunk(size: int) -> bytes:
+            nonlocal remaining, total, done
+            if done:
+                return b""
+
+            if remaining == 0:
+                size_line = self._read_line()
+                try:
+                    # チャンク拡張 (;name=value) は無視する
+                    chunk_size = int(size_line.split(b";", 1)[0].strip(), 16)
+                except ValueError:
+                    raise RequestError(400, "invalid chunk size")
+                if chunk_size == 0:
+                    # トレーラーは読み飛ばす
+                    while self._read_line():
+                        pass
+                    done = True
+                    return b""
+
+                total += chunk_size
+                if total > limit:
+                    raise RequestError(413, "request body too large")
+                remaining = chunk_size
+
+            if not self.buffer:
+                self._recv_or_fail()
+            data = self._take(min(size, remaining, len(self.buffer)))
+            remaining -= len(data)
+
+            if remaining == 0:
+                self._fill(2)
+                if self.buffer[:2] != b"\r\n":
+                    raise RequestError(400, "chunk is not terminated by CRLF")
+                del self.buffer[:2]
+            return data
+
+        return read_chunk
+
+    def _read_line(self) -> bytes:
+        line_end = self._find(b"\r\n", 0, settings.MAX_HEADER_SIZE)
+        if line_end < 0:
+            raise RequestError(400, "line too long")
+        line = self._take(line_end + 2)
+        return line[:-2]
+
+    def _find(self, sub: bytes, start: int, limit: int) -> int:
+        """
+        バッファからsubを探し、見つかるまで受信を続ける
+        limitバイトを超えても見つからない場合は-1を返す
+        """
+        while True:
+            index = self.buffer.find(sub, start)
+            if index >= 0:
+                return index
+            if len(self.buffer) > limit:
+                return -1
+            # 前回の検索で見つからなかった部分は、区切り文字を跨ぐ分だけ戻って再検索する
+            start = max(0, len(self.buffer) - len(sub) + 1)
+            self._recv_or_fail()
+
+    def _fill(self, size: int):
+        while len(self.buffer) < size:
+            self._recv_or_fail()
+
+    def _take(self, size: int) -> bytes:
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def _recv_or_fail(self):
+        try:
+            received = self._recv()
+        except socket.timeout:
+            raise RequestError(408, "timed out while reading request")
+        if not received:
+            if self.deadline is not None and self.deadline.expired:
+                raise RequestError(408, f"{self.deadline.expired} deadline exceeded")
+            raise ConnectionError("connection closed while reading request")
+
+    def _recv(self) -> bool:
+        size = self.client_socket.recv_into(self._chunk)
+        if size == 0:
+            return False
+        self.buffer += self._chunk[:size]
+        return True
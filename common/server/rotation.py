@@ -0,0 +1,28 @@
+import os
+
+
+def needs_rotation(path: str, max_bytes: int) -> bool:
+    """
+    ファイルがmax_bytes以上になったかを判定 (max_bytesが0の場合はローテーションしない)
+    """
+    if not max_bytes:
+        return False
+    try:
+        return os.stat(path).st_size >= max_bytes
+    except FileNotFoundError:
+        return False
+
+
+def rotate(path: str, backup_count: int):
+    """
+    access.log -> access.log.1 -> access.log.2 ... の順に名前を付け替える
+    書き込み中のプロセスは、パスが別のファイルを指すようになったことに気付いて新しいファイルを開き直す
+    """
+    if backup_count <= 0:
+        os.remove(path)
+        return
+    for index in range(backup_count - 1, 0, -1):
+        source = f"{path}.{index}"
+        if os.path.exists(source):
+            os.replace(source, f"{path}.{index + 1}")
+    os.replace(path, f"{path}.1")
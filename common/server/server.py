@@ -1,5 +1,13 @@
+import signal
 import socket
+import threading
 
+import settings
+from common.server.admission import admission
+from common.server.deadline import deadlines
+from common.server.handler import ConnectionHandler
+from common.server.logger import logger
+from common.server.pool import WorkerPool
 from common.server.worker import Worker
 
 class Server:
@@ -7,28 +15,112 @@ class Server:
     Webサーバ
     """
 
-    def serve(self):
+    def __init__(self, mode: str = None):
+        if mode is None:
+            mode = settings.SERVER_MODE
+
+        self.mode = mode
+        self.handler = ConnectionHandler()
+        self.server_socket = None
+        self._stopping = False
+        self.pool = None
+        if self.mode == "pool":
+            self.pool = WorkerPool(
+                size=settings.WORKER_POOL_SIZE,
+                queue_size=settings.WORKER_QUEUE_SIZE,
+                handler=self.handler,
+            )
+
+    def serve(self, server_socket: socket = None):
         """
         サーバを起動
+        server_socketを渡した場合は、新たにsocketを作らずにそれで待ち受ける
         """
 
-        print("=== Starting Web Server ===")
+        logger.info("server", "Starting Web Server", mode=self.mode)
 
         try:
             # サーバソケットの作成
-            server_socket = self.create_server_socket()
-            while True:
-                print("=== [Server] Waiting for connection from the client===")
-                (client_socket, address) = server_socket.accept()
-                print(f"=== [Server] Connected from remote_addr: {address} ===")
+            if server_socket is None:
+                server_socket = self.create_server_socket()
+            self.server_socket = server_socket
+
+            if threading.current_thread() is threading.main_thread():
+                # SIGTERMを受け取ったら、新しい接続の受け付けを止めて処理中の接続を終えてから終了する
+                signal.signal(signal.SIGTERM, lambda signum, frame: self.shutdown())
+
+            if self.pool is not None:
+                self.pool.start()
+
+            while not self._stopping:
+                try:
+                    (client_socket, address) = server_socket.accept()
+                except OSError:
+                    if self._stopping:
+                        # shutdownでsocketが閉じられた
+                        break
+                    raise
+                logger.debug("server", "Connected", remote_addr=address)
+
+                # クライアントごとの頻度や接続数の上限を超えていれば、リクエストを読まずに断る
+                rejection = admission.admit(address[0])
+                if rejection is not None:
+                    self.reject(client_socket, *rejection)
+                    continue
+
+                if self.pool is not None:
+                    # ワーカープールに処理を依頼し、キューが満杯なら503を返して接続を閉じる
+                    if not self.pool.submit(client_socket, address):
+                        admission.release(address[0])
+                        self.reject(client_socket)
+                    continue
 
                 # WorkerThreadを生成してリクエストを処理する
-                worker_thread = Worker(client_socket, address)
+                worker_thread = Worker(client_socket, address, self.handler)
                 worker_thread.start()
 
         finally:
             # サーバを終了する
-            print("=== Stopping Web Server ===")
+            if self._stopping and self.pool is not None:
+                # キューに残っている接続を処理し終えるまで待つ
+                self.pool.shutdown()
+            logger.info("server", "Stopping Web Server")
+
+    def shutdown(self):
+        """
+        新しい接続の受け付けを止める。受け付け済みの接続は最後まで処理する
+        """
+        self._stopping = True
+        if self.server_socket is not None:
+            self.server_socket.close()
+
+    def stats(self) -> dict:
+        """
+        サーバの状態を返却
+        """
+        stats = {"requests": self.handler.requests_handled}
+        stats.update(admission.stats())
+        stats.update(deadlines.stats())
+        if self.pool is not None:
+            stats.update(self.pool.stats())
+        return stats
+
+    def reject(self, client_socket: socket, status_code: int = 503, retry_after: int = 1):
+        """
+        過負荷や流量の制限のため、リクエストを読まずにエラーを返して接続を閉じる
+        """
+        try:
+            self.handler.send_error(client_socket, status_code, headers={"Retry-After": str(retry_after)})
+            # 未読のリクエストを残したまま閉じるとRSTが送られ、クライアントがレスポンスを読めないことがある
+            # 送信済みのレスポンスの後にFINを送り、届いている分だけ待たずに読み捨ててから閉じる
+            client_socket.shutdown(socket.SHUT_WR)
+            client_socket.setblocking(False)
+            while client_socket.recv(settings.READ_CHUNK_SIZE):
+                pass
+        except OSError:
+            pass
+        finally:
+            client_socket.close()
 
     def create_server_socket(self) -> socket:
         """
@@ -37,8 +129,8 @@ class Server:
         server_socket = socket.socket()
         server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
-        # socketをlocalhost:8080にバインド
-        server_socket.bind(("localhost", 8080))
+        # socketを設定されたホストとポートにバインド
+        server_socket.bind((settings.HOST, settings.PORT))
         server_socket.listen(10)
 
-        return server_socket
\ No newline at end of file
+        return server_socket
@@ -0,0 +1,62 @@
+import os
+import socket
+from typing import Iterable, List, Union
+
+# sendmsgに1回で渡せるバッファの数の上限
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+if IOV_MAX <= 0:
+    IOV_MAX = 1024
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class ResponseWriter:
+    """
+    ヘッダーとボディのように分かれたバッファを、連結せずにsocketへ書き込む
+    sendmsgで複数のバッファを1回のシステムコールで送り、一部しか送れなかった場合は残りをmemoryviewで切り出して送り直す
+    """
+    client_socket: socket.socket
+    timeout: float
+
+    def __init__(self, client_socket: socket.socket, timeout: float):
+        self.client_socket = client_socket
+        # 送信が進まないまま、この秒数を過ぎたらsocket.timeoutを送出する
+        self.timeout = timeout
+
+    def write(self, buffers: Iterable[Buffer]) -> int:
+        """
+        バッファをすべて送信し、送信したバイト数を返却する
+        """
+        views = [memoryview(buffer) for buffer in buffers if len(buffer)]
+        if not views:
+            return 0
+
+        self.client_socket.settimeout(self.timeout)
+        if not hasattr(self.client_socket, "sendmsg"):
+            # sendmsgを使えない環境では、バッファごとに送信する
+            for view in views:
+                self.client_socket.sendall(view)
+            return sum(view.nbytes for view in views)
+
+        return self._sendmsg_all(views)
+
+    def _sendmsg_all(self, views: List[memoryview]) -> int:
+        """
+        sendmsgを、すべてのバッファを送り終えるまで繰り返す
+        """
+        total = 0
+        index = 0
+        while index < len(views):
+            sent = self.client_socket.sendmsg(views[index:index + IOV_MAX])
+            total += sent
+
+            # 送り終えたバッファを飛ばし、途中まで送ったバッファは残りの部分だけにする
+            while index < len(views) and sent >= views[index].nbytes:
+                sent -= views[index].nbytes
+                index += 1
+            if sent:
+                views[index] = views[index][sent:]
+        return total
@@ -2,4 +2,193 @@ import os
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
-TEMPLATES_DIR = os.path.join(BASE_DIR, "common/templates")
\ No newline at end of file
+TEMPLATES_DIR = os.path.join(BASE_DIR, "common/templates")
+# テンプレートのファイルが更新されたら読み込み直す (開発時のみTrueにする)
+TEMPLATE_AUTO_RELOAD = False
+# テンプレートに埋め込む値をHTMLエスケープする
+TEMPLATE_AUTOESCAPE = True
+
+# 待ち受けるホストとポート
+HOST = "localhost"
+PORT = 8080
+
+# URL解決の結果をキャッシュするpathの数 (パスパラメータを含まないpathのみ)
+URL_RESOLVE_CACHE_SIZE = 1024
+
+# 起動するサーバエンジン ("threaded": Server, "asyncio": AsyncServer)
+SERVER_ENGINE = "threaded"
+
+# SIGTERMを受け取ってから、処理中の接続が終わるのを待つ秒数
+SHUTDOWN_TIMEOUT = 10
+
+# マルチプロセス (prefork) モード
+# ワーカープロセスの数 (0の場合はCPUのコア数)
+PREFORK_WORKERS = 0
+# SO_REUSEPORTで各ワーカーが自分のsocketで待ち受ける (Falseの場合はマスターのsocketを引き継ぐ)
+PREFORK_REUSE_PORT = True
+# listenのバックログ
+PREFORK_BACKLOG = 128
+# ワーカーがマスターへ統計情報を送る間隔 (秒)
+PREFORK_STATS_INTERVAL = 1.0
+
+# 接続の処理方式 ("pool": 常駐ワーカープール, "thread": 接続ごとにスレッドを生成)
+SERVER_MODE = "pool"
+# ワーカープールのスレッド数と、処理待ち接続のキュー長
+WORKER_POOL_SIZE = 16
+WORKER_QUEUE_SIZE = 128
+
+# 接続の受け付け制御 (リクエストを読む前に、クライアントのIPアドレスごとに制限する)
+# preforkモードでは、ワーカープロセスごとに制限する
+ADMISSION_ENABLED = True
+# 1クライアントが1秒あたりに送れるリクエストの数と、一度に送れるリクエストの数 (トークンバケット)
+ADMISSION_RATE = 100.0
+ADMISSION_BURST = 200
+# 1クライアントの同時接続数の上限 (超えた場合は429)
+ADMISSION_MAX_CONNECTIONS_PER_CLIENT = 64
+# サーバ全体の同時接続数の上限 (超えた場合は503)
+ADMISSION_MAX_CONNECTIONS = 1024
+# 状態を保持するクライアントの数の上限
+ADMISSION_MAX_CLIENTS = 10000
+
+# HTTP/1.1の持続的接続 (keep-alive)
+# 次のリクエストを待つ秒数
+KEEP_ALIVE_TIMEOUT = 5
+# 1接続で処理するリクエストの上限
+KEEP_ALIVE_MAX_REQUESTS = 100
+
+# リクエストの読み込み
+# recv_intoで1回に受信するサイズ (bytes)
+READ_CHUNK_SIZE = 64 * 1024
+# リクエストラインとヘッダーの合計サイズの上限 (bytes)
+MAX_HEADER_SIZE = 8 * 1024
+# リクエストラインのサイズの上限 (bytes)。超えた場合は414を返す
+MAX_REQUEST_LINE_SIZE = 4 * 1024
+# ヘッダーのフィールド数の上限。超えた場合は431を返す
+MAX_HEADER_COUNT = 100
+# ボディサイズの上限 (bytes)
+MAX_BODY_SIZE = 10 * 1024 * 1024
+# リクエストの途中で、次のデータが届くまで待つ秒数
+READ_TIMEOUT = 10
+# レスポンスの送信が進まないまま、クライアントの受信を待つ秒数
+WRITE_TIMEOUT = 10
+
+# 区間ごとの期限 (秒)。少しずつ送り続けるクライアントも、期限を過ぎたら打ち切る
+# 接続してから、最初のリクエストの1バイト目が届くまで (keep-aliveで次のリクエストを待つ間はKEEP_ALIVE_TIMEOUT)
+FIRST_BYTE_TIMEOUT = 10
+# リクエストの1バイト目から、ヘッダーを読み終えるまで
+HEADER_TIMEOUT = 10
+# ボディを読み終えるまで (threadedエンジンでは、streaming_bodyを指定したViewには適用せず、READ_TIMEOUTのみを適用する。
+# asyncioエンジンは、そのようなViewのボディも一時ファイルへ退避し終えるまでに適用する)
+BODY_TIMEOUT = 60
+# 1つのレスポンスを送り終えるまで (生成しながら送るボディには、チャンクごとの送信に適用する)
+RESPONSE_TIMEOUT = 120
+
+# リクエストボディのストリーミング (streaming_bodyを指定したView)
+# request.streamから1回に読み出すサイズ (bytes)
+BODY_CHUNK_SIZE = 64 * 1024
+# ストリーミングで受け付けるボディサイズの上限 (bytes)
+MAX_STREAMING_BODY_SIZE = 1024 * 1024 * 1024
+# このサイズを超えたボディは、メモリではなく一時ファイルに保持する (bytes)
+REQUEST_BODY_SPOOL_SIZE = 1024 * 1024
+
+# フォーム (request.form, request.files)
+# multipart/form-dataのファイルは、このサイズを超えるとメモリではなく一時ファイルに書き出す (bytes)
+MULTIPART_SPOOL_SIZE = 256 * 1024
+# multipart/form-dataの各パートのヘッダーサイズの上限 (bytes)
+MULTIPART_MAX_HEADER_SIZE = 8 * 1024
+# ファイル以外のフィールド1つ(urlencodedでは "name=value" の1組)のサイズの上限 (bytes)。超えた場合は413を返す
+# フィールドの値の合計はMAX_BODY_SIZEまでとする
+FORM_MAX_FIELD_SIZE = 1024 * 1024
+# フィールドの数(multipart/form-dataではファイルを含むパートの数)の上限。超えた場合は413を返す
+FORM_MAX_FIELDS = 1000
+
+# asyncioエンジンの設定
+# 同期Viewを実行するスレッド数
+ASYNC_EXECUTOR_WORKERS = 32
+# listenのバックログ
+ASYNC_BACKLOG = 4096
+# 1接続あたりの読み込みバッファの上限 (bytes)
+ASYNC_STREAM_LIMIT = 64 * 1024
+
+# 静的ファイルのキャッシュ
+# キャッシュするファイル内容の合計サイズの上限 (bytes)
+STATIC_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# このサイズを超えるファイルは内容をキャッシュせず、sendfileで送信する (bytes)
+STATIC_CACHE_MAX_FILE_SIZE = 1024 * 1024
+# 同じファイルの更新をstatで確認する間隔 (秒)
+STATIC_CACHE_CHECK_INTERVAL = 1.0
+# 静的ファイルのレスポンスに付与するCache-Control
+STATIC_CACHE_CONTROL = "public, max-age=60"
+
+# Viewのレスポンスのキャッシュ (URLパターンごとにcache=ResponseCache(...)で有効にする)
+# 1つのURLパターンでキャッシュするレスポンスの数と、合計サイズの上限 (bytes)
+RESPONSE_CACHE_MAX_ENTRIES = 1024
+RESPONSE_CACHE_MAX_BYTES = 8 * 1024 * 1024
+# 同じキーのレスポンスを他のスレッドが生成している間、完了を待つ時間の上限 (秒)
+RESPONSE_CACHE_WAIT_TIMEOUT = 5.0
+
+# レスポンスの圧縮 (Content-Encoding)
+COMPRESSION_ENABLED = True
+# このサイズ未満のボディは圧縮しない (bytes)
+COMPRESSION_MIN_SIZE = 256
+# gzip/deflateの圧縮レベル (1-9)
+COMPRESSION_LEVEL = 6
+
+# セッション (request.session)
+# セッションIDを送るCookieの名前
+SESSION_COOKIE_NAME = "sessionid"
+# HTTPSでのみCookieを送らせる
+SESSION_COOKIE_SECURE = False
+# 最後に参照してから、この秒数が経ったセッションは破棄する
+SESSION_TTL = 30 * 60
+# セッションの保存先 ("memory": メモリのみ, "sqlite": SQLiteのファイルにも保存し、再起動後も引き継ぐ)
+# preforkではワーカープロセスごとにメモリが分かれるため、"sqlite"を使う
+# (作成と削除はすぐにファイルへ書き込まれ、他のワーカーからも読める。既存のセッションの変更が他のワーカーから
+#  読めるようになるのは、SESSION_FLUSH_INTERVAL秒以内にファイルへ書き出された後)
+SESSION_BACKEND = "memory"
+# メモリ上のストアを分割する数 (シャードごとにロックを持つ)
+SESSION_SHARDS = 16
+# メモリ上に保持するセッションの合計サイズの上限 (超えた分は最後に参照したのが古いものから捨てる) (bytes)
+SESSION_MAX_BYTES = 64 * 1024 * 1024
+# sqliteの場合のファイルと、変更をまとめて書き込む間隔 (秒)
+SESSION_DB_PATH = os.path.join(BASE_DIR, "data", "sessions.sqlite3")
+SESSION_FLUSH_INTERVAL = 1.0
+
+# サーバの動作ログ
+# 記録するログのレベル ("DEBUG", "INFO", "WARNING", "ERROR")
+# DEBUGでは接続ごとのログも記録する。INFO以上では、リクエストの処理中には何も記録しない
+LOG_LEVEL = "INFO"
+# ログの形式 ("text": 1行のテキスト, "jsonl": 1行1JSON)
+LOG_FORMAT = "text"
+# 書き込み先のファイル (Noneの場合は標準エラー出力)
+LOG_PATH = None
+# 書き込み待ちのレコードを保持するリングバッファの大きさ (溢れた場合は古いものから捨てる)
+LOG_BUFFER_SIZE = 10000
+# この秒数ごとにまとめて書き込む (ERRORはすぐに書き込む)
+LOG_FLUSH_INTERVAL = 0.5
+
+# アクセスログ
+ACCESS_LOG_ENABLED = True
+ACCESS_LOG_PATH = os.path.join(BASE_DIR, "logs", "access.log")
+# ログの形式 ("common": Common Log Format, "combined": Combined Log Format, "jsonl": 1行1JSON)
+ACCESS_LOG_FORMAT = "combined"
+# 記録するリクエストの割合 (0.0-1.0)
+ACCESS_LOG_SAMPLE_RATE = 1.0
+# jsonlの場合、受信したリクエストヘッダーもそのまま記録する
+ACCESS_LOG_CAPTURE_HEAD = False
+# この件数のレコードがたまるか、この秒数が経つごとにまとめて書き込む
+ACCESS_LOG_BATCH_SIZE = 256
+ACCESS_LOG_FLUSH_INTERVAL = 1.0
+# 書き込み待ちのレコードの上限 (超えた分は捨てる)
+ACCESS_LOG_MAX_PENDING = 10000
+# ファイルがこのサイズを超えたら切り替え、古いファイルをこの数だけ残す
+ACCESS_LOG_MAX_BYTES = 10 * 1024 * 1024
+ACCESS_LOG_BACKUP_COUNT = 5
+
+# メトリクス (/metricsでPrometheusのテキスト形式で公開する)
+METRICS_ENABLED = True
+# 処理時間のヒストグラムのバケットの上限 (秒)
+METRICS_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
@@ -1,10 +1,36 @@
+import argparse
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from multithreadwebserver import MultiThreadWebServer
-from common.server.server import Server
+import settings
 if __name__ == "__main__":
-    # MultiThreadWebServer().serve()
-    Server().serve()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--engine",
+        choices=["threaded", "asyncio"],
+        default=settings.SERVER_ENGINE,
+        help="起動するサーバエンジン",
+    )
+    parser.add_argument(
+        "--prefork",
+        action="store_true",
+        help="複数のワーカープロセスで起動する",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.PREFORK_WORKERS,
+        help="--preforkで起動するワーカープロセスの数 (0の場合はCPUのコア数)",
+    )
+    args = parser.parse_args()
+
+    if args.prefork:
+        # マスターはアプリケーションのモジュールを読み込まず、各ワーカーがfork後に起動の準備を行う
+        from common.server.prefork import PreforkServer
+        PreforkServer(engine=args.engine, workers=args.workers).serve()
+    else:
+        # 起動するサーバが使うモジュールだけを読み込み、最初のリクエストの前に準備を済ませる
+        from common.server.boot import boot
+        boot(args.engine)().serve()
@@ -0,0 +1,323 @@
+import ast
+import builtins
+import html
+import os
+import re
+import threading
+import types
+from typing import Callable, Dict, List, Tuple
+
+# {{ 式 }}、{% 文 %}、{# コメント #} を区切る
+TOKEN_RE = re.compile(r"(\{\{.*?\}\}|\{%.*?%\}|\{#.*?#\})", re.DOTALL)
+# 末尾の「|名前」。|の後に空白がある場合は、既知のフィルター名のときだけフィルターとみなす (それ以外はビット演算のor)
+FILTER_RE = re.compile(r"\|(\s*)([A-Za-z_]\w*)\s*$")
+INCLUDE_RE = re.compile(r"""^include\s+(["'])(.+?)\1$""")
+
+# TemplateLoader.preloadで読み込むテンプレートファイルの拡張子
+TEMPLATE_EXTENSIONS = (".html",)
+
+
+class TemplateSyntaxError(Exception):
+    """
+    テンプレートの構文に誤りがある場合に送出する
+    """
+
+    def __init__(self, message: str, template_name: str, line: int):
+        super().__init__(f"{message} ({template_name}, line {line})")
+        self.template_name = template_name
+        self.line = line
+
+
+def escape(value) -> str:
+    """
+    HTMLとして安全な文字列に変換する
+    """
+    return html.escape(str(value), quote=True)
+
+
+# {{ 式|フィルター }} で使えるフィルター
+FILTERS: Dict[str, Callable] = {
+    "escape": escape,
+    "upper": lambda value: str(value).upper(),
+    "lower": lambda value: str(value).lower(),
+    "length": len,
+}
+
+
+class _Renamer(ast.NodeTransformer):
+    """
+    式の中の変数名を、namesに従って置き換える
+    """
+
+    def __init__(self, names: Dict[str, str]):
+        self.names = names
+
+    def visit_Name(self, node: ast.Name) -> ast.Name:
+        if node.id in self.names:
+            node.id = self.names[node.id]
+        return node
+
+
+class Template:
+    """
+    テンプレートを1度だけPythonの関数にコンパイルし、描画はその関数を呼び出すだけで行う
+    描画結果は文字列のチャンクのリストに書き出すため、1つの大きな文字列を組み立てずに送信できる
+
+    構文:
+        {{ 式 }}                       値を埋め込む (autoescapeが有効な場合はエスケープする)
+        {{ 式|safe }}                  エスケープせずに埋め込む
+        {% if 式 %}...{% elif 式 %}...{% else %}...{% endif %}
+        {% for 変数 in 式 %}...{% endfor %}
+        {% include "テンプレート名" %}
+        {# コメント #}
+    """
+    name: str
+    source: str
+    autoescape: bool
+
+    def __init__(self, source: str, name: str = "<string>", loader: "TemplateLoader" = None, autoescape: bool = True):
+        self.name = name
+        self.source = source
+        self.loader = loader
+        self.autoescape = autoescape
+        self.python_source = self.generate(source)
+
+        namespace = {}
+        exec(compile(self.python_source, f"<template {name}>", "exec"), namespace)
+        self._code = namespace["_render"].__code__
+
+    def render(self, context: dict) -> str:
+        """
+        テンプレートを描画し、文字列を返却する
+        """
+        return "".join(self.render_chunks(context))
+
+    def render_chunks(self, context: dict) -> List[str]:
+        """
+        テンプレートを描画し、文字列のチャンクのリストを返却する
+        """
+        out: List[str] = []
+        self.render_into(out, context)
+        return out
+
+    def render_into(self, out: List[str], context: dict):
+        """
+        描画結果をoutに追加する
+        """
+        namespace = dict(context)
+        namespace["__builtins__"] = builtins
+        namespace["_ctx"] = namespace
+        namespace["_escape"] = escape if self.autoescape else str
+        namespace["_str"] = str
+        namespace["_filters"] = FILTERS
+        namespace["_include"] = self._include
+        types.FunctionType(self._code, namespace)(out)
+
+    def _include(self, template_name: str, out: List[str], context: dict):
+        if self.loader is None:
+            raise TemplateSyntaxError(f"cannot include '{template_name}' without a loader", self.name, 0)
+        self.loader.get_template(template_name).render_into(out, context)
+
+    def generate(self, source: str) -> str:
+        """
+        テンプレートを、描画を行うPythonの関数のソースコードに変換する
+        コンテキストの変数は関数のグローバル変数として参照する
+        forの変数はブロックごとに別名のローカル変数にし、コンテキストの同名の変数を隠すのはブロックの中だけにする
+        """
+        lines = ["def _render(_out):", "    _append = _out.append"]
+        indent = 1
+        # 開いているブロック: (種類, 開始行, ブロックの外での変数名の置き換え)
+        blocks: List[Tuple[str, int, Dict[str, str]]] = []
+        # テンプレートの変数名 -> 生成するコードでのローカル変数名
+        names: Dict[str, str] = {}
+        line = 1
+
+        def emit(code: str):
+            lines.append("    " * indent + code)
+
+        for token in TOKEN_RE.split(source):
+            if token.startswith("{#") and token.endswith("#}"):
+                pass
+            elif token.startswith("{{") and token.endswith("}}"):
+                emit(f"_append({self._expression(token[2:-2].strip(), line, names)})")
+            elif token.startswith("{%") and token.endswith("%}"):
+                statement = token[2:-2].strip()
+                keyword = statement.split(None, 1)[0] if statement else ""
+
+                if keyword == "if":
+                    self._check_syntax(f"{statement}: pass", "exec", line)
+                    emit(f"if {self._rename(statement[2:].strip(), names)}:")
+                    blocks.append((keyword, line, names))
+                    indent += 1
+                elif keyword == "for":
+                    self._check_syntax(f"{statement}: pass", "exec", line)
+                    loop = ast.parse(f"{statement}: pass").body[0]
+                    iterable = ast.unparse(_Renamer(names).visit(loop.iter))
+                    blocks.append((keyword, line, names))
+                    names = dict(names)
+                    for node in ast.walk(loop.target):
+                        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+                            names[node.id] = f"_v{len(blocks)}_{node.id}"
+                    emit(f"for {ast.unparse(_Renamer(names).visit(loop.target))} in {iterable}:")
+                    indent += 1
+                elif keyword in ("elif", "else"):
+                    if not blocks or blocks[-1][0] != "if":
+                        raise TemplateSyntaxError(f"unexpected '{keyword}'", self.name, line)
+                    self._check_syntax(f"if True: pass\n{statement}: pass", "exec", line)
+                    indent -= 1
+                    if keyword == "elif":
+                        emit(f"elif {self._rename(statement[4:].strip(), names)}:")
+                    else:
+                        emit("else:")
+                    indent += 1
+                elif keyword in ("endif", "endfor"):
+                    if not blocks or blocks[-1][0] != keyword[3:]:
+                        raise TemplateSyntaxError(f"unexpected '{keyword}'", self.name, line)
+                    names = blocks.pop()[2]
+                    indent -= 1
+                elif keyword == "include":
+                    match = INCLUDE_RE.match(statement)
+                    if match is None:
+                        raise TemplateSyntaxError("include requires a quoted template name", self.name, line)
+                    # forの変数は、元の名前でコンテキストに加えて渡す
+                    variables = "".join(f", {name!r}: {local}" for name, local in names.items())
+                    emit(f"_include({match.group(2)!r}, _out, {{**_ctx{variables}}})")
+                else:
+                    raise TemplateSyntaxError(f"unknown statement '{statement}'", self.name, line)
+            elif token:
+                emit(f"_append({token!r})")
+
+            # ブロックが空の場合に備えて、何もしない文を置いておく
+            if lines[-1].endswith(":"):
+                emit("pass")
+            line += token.count("\n")
+
+        if blocks:
+            kind, start, _ = blocks[-1]
+            raise TemplateSyntaxError(f"'{kind}' is not closed", self.name, start)
+
+        return "\n".join(lines)
+
+    def _check_syntax(self, code: str, mode: str, line: int):
+        """
+        式や文がPythonとして正しいかを、テンプレートの行番号付きで検証する
+        """
+        try:
+            compile(code, f"<template {self.name}>", mode)
+        except SyntaxError as e:
+            raise TemplateSyntaxError(f"invalid syntax: {e.msg}", self.name, line)
+
+    @staticmethod
+    def _rename(expression: str, names: Dict[str, str]) -> str:
+        """
+        式の中のforの変数を、生成するコードでのローカル変数名に置き換える
+        """
+        if not names:
+            return expression
+        return ast.unparse(_Renamer(names).visit(ast.parse(expression, mode="eval")))
+
+    def _expression(self, expression: str, line: int, names: Dict[str, str]) -> str:
+        """
+        {{ }}の中身を、文字列を返すPythonの式に変換する
+        """
+        filters = []
+        while True:
+            match = FILTER_RE.search(expression)
+            if match is None:
+                break
+            space, name = match.groups()
+            if space and name not in FILTERS and name != "safe":
+                # 「a | b」はビット演算のorとして扱う
+                break
+            filters.insert(0, name)
+            expression = expression[:match.start()].rstrip()
+
+        self._check_syntax(expression, "eval", line)
+        code = f"({self._rename(expression, names)})"
+        safe = False
+        for name in filters:
+            if name == "safe":
+                safe = True
+                continue
+            if name not in FILTERS:
+                raise TemplateSyntaxError(f"unknown filter '{name}'", self.name, line)
+            if name == "escape":
+                safe = True
+            code = f"_filters[{name!r}]({code})"
+
+        return f"_str({code})" if safe else f"_escape({code})"
+
+
+class TemplateLoader:
+    """
+    テンプレートをディレクトリから読み込み、コンパイル済みの状態でキャッシュする
+    auto_reloadが有効な場合は、ファイルのmtimeが変わったテンプレートを読み込み直す
+    """
+    directory: str
+    auto_reload: bool
+    autoescape: bool
+
+    def __init__(self, directory: str, auto_reload: bool = False, autoescape: bool = True):
+        self.directory = directory
+        self.auto_reload = auto_reload
+        self.autoescape = autoescape
+        # テンプレート名 -> (コンパイル済みのテンプレート, 読み込んだ時点のmtime)
+        self._cache: Dict[str, Tuple[Template, int]] = {}
+        self._lock = threading.Lock()
+
+    def get_template(self, template_name: str) -> Template:
+        """
+        コンパイル済みのテンプレートを返却する
+        """
+        cached = self._cache.get(template_name)
+        if cached is not None and not self.auto_reload:
+            return cached[0]
+
+        template_path = self.get_path(template_name)
+        mtime = os.stat(template_path).st_mtime_ns
+        if cached is not None and cached[1] == mtime:
+            return cached[0]
+
+        with open(template_path, "r", encoding="utf-8") as f:
+            template = Template(f.read(), name=template_name, loader=self, autoescape=self.autoescape)
+        with self._lock:
+            self._cache[template_name] = (template, mtime)
+        return template
+
+    def get_path(self, template_name: str) -> str:
+        """
+        テンプレート名からファイルのパスを返却する
+        ディレクトリの外を指すテンプレート名は受け付けない
+        """
+        template_path = os.path.normpath(os.path.join(self.directory, template_name))
+        if not template_path.startswith(os.path.join(self.directory, "")):
+            raise FileNotFoundError(template_name)
+        return template_path
+
+    def preload(self) -> List[str]:
+        """
+        ディレクトリ内のすべてのテンプレートを読み込み、コンパイルしてキャッシュする
+        読み込んだテンプレート名の一覧を返却する
+        """
+        names = []
+        for current, _, files in os.walk(self.directory):
+            for file_name in sorted(files):
+                if not file_name.endswith(TEMPLATE_EXTENSIONS):
+                    continue
+                template_name = os.path.relpath(os.path.join(current, file_name), self.directory)
+                self.get_template(template_name.replace(os.sep, "/"))
+                names.append(template_name)
+        return names
+
+    def clear(self):
+        """
+        キャッシュをすべて破棄する
+        """
+        with self._lock:
+            self._cache.clear()
+
+    def cached_templates(self) -> List[str]:
+        """
+        キャッシュ済みのテンプレート名の一覧
+        """
+        return list(self._cache)
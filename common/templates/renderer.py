@@ -1,14 +1,29 @@
-import os
+from typing import List
 
 import settings
+from common.templates.engine import TemplateLoader
+
+# NOTE: テンプレートファイルの置き場は、設定値で変更できるようにしておく
+loader = TemplateLoader(
+    settings.TEMPLATES_DIR,
+    auto_reload=settings.TEMPLATE_AUTO_RELOAD,
+    autoescape=settings.TEMPLATE_AUTOESCAPE,
+)
 
 def render(
         template_name: str,
         context: dict
-):
-    # NOTE: テンプレートファイルの置き場は、設定値で変更できるようにしておく
-    template_path = os.path.join(settings.TEMPLATES_DIR, template_name)
-    with open(template_path, "r", encoding="utf-8") as f:
-        template = f.read()
-    
-    return template.format(**context)
\ No newline at end of file
+) -> str:
+    """
+    コンパイル済みのテンプレートを描画し、文字列を返却する
+    """
+    return loader.get_template(template_name).render(context)
+
+def render_chunks(
+        template_name: str,
+        context: dict
+) -> List[str]:
+    """
+    コンパイル済みのテンプレートを描画し、1つの文字列に連結する前のチャンクのリストを返却する
+    """
+    return loader.get_template(template_name).render_chunks(context)
@@ -1,28 +1,95 @@
+import inspect
 import re
 from re import Match
-from typing import Callable, Optional
+from typing import Callable, Iterable, List, Optional, Tuple, Union
 
+from common.http.body import is_streaming_body
 from common.http.request import HTTPRequest
 from common.http.response import HTTPResponse
+from common.views.response_cache import ResponseCache
+
+# パスパラメータの型ごとの、値の検証とPythonの値への変換
+# '<int:id>'のように指定し、型を省略した'<user_id>'はstrとして扱う
+CONVERTERS = {
+    "str": (lambda value: value != "", str),
+    # str.isdigitだけでは"²"のようなUnicodeの数字も通り、intで変換できないため、CONVERTER_REGEXESと同じくASCIIの数字に限る
+    "int": (lambda value: value.isascii() and value.isdigit(), int),
+}
+
+# 変換前の値を正規表現で表したもの (URLPattern.matchで使う)
+CONVERTER_REGEXES = {
+    "str": r"[^/]+",
+    "int": r"[0-9]+",
+}
+
+# パスパラメータのセグメント: (パラメータ名, 型)
+ParamSegment = Tuple[str, str]
+
 
 class URLPattern:
     pattern: str
     view: Callable[[HTTPRequest], HTTPResponse]
+    methods: Optional[frozenset]
+    segments: List[Union[str, ParamSegment]]
+    cache: Optional[ResponseCache]
 
     def __init__(
             self,
             pattern: str,
-            view: Callable[[HTTPRequest], HTTPResponse]
+            view: Callable[[HTTPRequest], HTTPResponse],
+            methods: Optional[Iterable[str]] = None,
+            cache: Optional[ResponseCache] = None,
     ):
         self.pattern = pattern
         self.view = view
-    
+        # Noneの場合は、すべてのメソッドを受け付ける
+        # GETを受け付ける場合は、HEADも受け付ける (405のAllowヘッダーにも含まれる)
+        self.methods = None
+        if methods is not None:
+            self.methods = frozenset(method.upper() for method in methods)
+            if "GET" in self.methods:
+                self.methods |= {"HEAD"}
+        # 指定した場合は、Viewのレスポンスをキャッシュする
+        # キャッシュはスレッドで実行するViewの結果に対して行うため、async defとstreaming_bodyのViewには使えない
+        if cache is not None:
+            if inspect.iscoroutinefunction(view) or is_streaming_body(view):
+                raise ValueError(f"response cache is not supported for the view of URL pattern '{pattern}'")
+            cache.route = pattern
+        self.cache = cache
+        self.segments = self.parse_segments(pattern)
+
+        # '/user/<user_id>/profile' -> '/user/(?P<user_id>[^/]+)/profile'
+        self._regex = re.compile("/".join(
+            segment if isinstance(segment, str) else f"(?P<{segment[0]}>{CONVERTER_REGEXES[segment[1]]})"
+            for segment in self.segments
+        ))
+
+    @staticmethod
+    def parse_segments(pattern: str) -> List[Union[str, ParamSegment]]:
+        """
+        URLパターンを/で区切り、固定の文字列と(パラメータ名, 型)のリストに変換する
+        """
+        segments = []
+        for segment in pattern.split("/"):
+            if segment.startswith("<") and segment.endswith(">"):
+                converter, _, name = segment[1:-1].rpartition(":")
+                converter = converter or "str"
+                if converter not in CONVERTERS:
+                    raise ValueError(f"unknown converter '{converter}' in URL pattern '{pattern}'")
+                segments.append((name, converter))
+            else:
+                segments.append(segment)
+        return segments
+
+    def allows(self, method: str) -> bool:
+        """
+        メソッドを受け付けるかを判定
+        """
+        return self.methods is None or method in self.methods
 
     def match(self, path: str) -> Optional[Match]:
         """
-        pathがURLパターンにマッチするかを判定
+        pathがURLパターンに完全に一致するかを判定
         マッチした場合、Matchオブジェクトを返却し、マッチしない場合、Noneを返却
         """
-        # '/user/<user_id>/profile' -> '/user/(?P<user_id>[^/]+)/profile'
-        re_pattern = re.sub(r"<(.+?)>", r"(?P<\1>[^/]+)", self.pattern)
-        return re.match(re_pattern, path)
\ No newline at end of file
+        return self._regex.fullmatch(path)
@@ -1,21 +1,33 @@
 from typing import Callable, Optional
 
+import settings
 from common.http.request import HTTPRequest
 from common.http.response import HTTPResponse
 from common.views.static import static
+from common.urls.router import URLRouter, method_not_allowed
 from common.urls.urls import url_patterns
 
+# URLパターンは起動時に1度だけコンパイルする
+router = URLRouter(url_patterns, cache_size=settings.URL_RESOLVE_CACHE_SIZE)
+
 class URLResolver:
     def resolve(self, request: HTTPRequest) -> Optional[Callable[[HTTPRequest], HTTPResponse]]:
         """
         URL解決を行う。pathにマッチするURLパターンが存在する場合、対応するViewを返却する。
-        存在しない場合、Noneを返す
+        pathには一致するがメソッドが許可されていない場合は、405を返すViewを返却する。
+        存在しない場合、静的ファイルを返すViewを返す
         """
-        for url_pattern in url_patterns:
-            match = url_pattern.match(request.path)
-            if match:
-                request.params.update(match.groupdict())
-                return url_pattern.view
-            
+        url_pattern, params, allowed = router.match(request.method, request.path)
+        if url_pattern is not None:
+            if params:
+                request.params.update(params)
+            request.route = url_pattern.pattern
+            request.response_cache = url_pattern.cache
+            return url_pattern.view
+        if allowed is not None:
+            request.route = "method_not_allowed"
+            return method_not_allowed(allowed)
+
         # pathがstaticの場合、静的ファイルからレスポンスを生成
-        return static
\ No newline at end of file
+        request.route = "static"
+        return static
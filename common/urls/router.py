@@ -0,0 +1,144 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+from common.http.request import HTTPRequest
+from common.http.response import HTTPResponse
+from common.urls.pattern import CONVERTERS, URLPattern
+
+
+class RouteNode:
+    """
+    URLのセグメントごとの木構造のノード
+    固定のセグメントは辞書で、パスパラメータは型ごとのワイルドカードとして子ノードを持つ
+    """
+    __slots__ = ("children", "param_children", "url_patterns")
+
+    def __init__(self):
+        self.children: Dict[str, "RouteNode"] = {}
+        self.param_children: List[Tuple[str, str, "RouteNode"]] = []
+        # このノードで終わるURLパターン
+        self.url_patterns: List[URLPattern] = []
+
+    def child(self, segment) -> "RouteNode":
+        """
+        セグメントに対応する子ノードを返却する。存在しない場合は作成する
+        """
+        if isinstance(segment, str):
+            return self.children.setdefault(segment, RouteNode())
+
+        name, converter = segment
+        for param_name, param_converter, node in self.param_children:
+            if param_name == name and param_converter == converter:
+                return node
+        node = RouteNode()
+        self.param_children.append((name, converter, node))
+        return node
+
+
+class URLRouter:
+    """
+    起動時にURLパターンをセグメントの木構造へコンパイルし、リクエストごとの正規表現の生成や線形探索を避ける
+    パスパラメータを含まないパスの解決結果は、キャッシュして次回から辞書の参照だけで返す
+    """
+    cache_size: int
+
+    def __init__(self, url_patterns: List[URLPattern], cache_size: int = 1024):
+        self.root = RouteNode()
+        self.cache_size = cache_size
+        self.url_patterns: List[URLPattern] = []
+        self._cache: Dict[Tuple[str, str], Tuple[Optional[URLPattern], Optional[frozenset]]] = {}
+
+        for url_pattern in url_patterns:
+            self.add(url_pattern)
+
+    def add(self, url_pattern: URLPattern):
+        """
+        URLパターンを木構造に追加する
+        """
+        node = self.root
+        # URLパターンは/で始まるため、先頭の空のセグメントは読み飛ばす
+        for segment in url_pattern.segments[1:]:
+            node = node.child(segment)
+        node.url_patterns.append(url_pattern)
+        self.url_patterns.append(url_pattern)
+        self._cache.clear()
+
+    def preload(self) -> int:
+        """
+        パスパラメータを含まないURLパターンを、受け付けるメソッドごとに解決してキャッシュに載せる
+        キャッシュに載せた数を返却する
+        """
+        count = 0
+        for url_pattern in self.url_patterns:
+            if url_pattern.methods is None or any(not isinstance(s, str) for s in url_pattern.segments):
+                continue
+            for method in url_pattern.methods:
+                if len(self._cache) >= self.cache_size:
+                    return count
+                self.match(method, url_pattern.pattern)
+                count += 1
+        return count
+
+    def match(self, method: str, path: str) -> Tuple[Optional[URLPattern], dict, Optional[frozenset]]:
+        """
+        メソッドとpathに一致するURLパターンと、パスパラメータを返却する
+        pathには一致するがメソッドを受け付けない場合は、URLパターンの代わりに受け付けるメソッドの一覧を返す
+        いずれにも一致しない場合は(None, {}, None)を返す
+        """
+        cached = self._cache.get((method, path))
+        if cached is not None:
+            url_pattern, allowed = cached
+            return url_pattern, {}, allowed
+
+        params = {}
+        node = self._find(self.root, path.split("/")[1:], 0, params)
+        url_pattern, allowed = None, None
+        if node is not None:
+            url_pattern = next((p for p in node.url_patterns if p.allows(method)), None)
+            if url_pattern is None:
+                allowed = frozenset().union(*(p.methods for p in node.url_patterns))
+
+        if not params:
+            if len(self._cache) >= self.cache_size:
+                # 上限に達したら作り直し、よく使われるpathだけを再びキャッシュする
+                self._cache.clear()
+            self._cache[(method, path)] = (url_pattern, allowed)
+        return url_pattern, params, allowed
+
+    def _find(self, node: RouteNode, segments: List[str], index: int, params: dict) -> Optional[RouteNode]:
+        if index == len(segments):
+            return node if node.url_patterns else None
+
+        segment = segments[index]
+
+        # 固定のセグメントを優先し、一致しなければパスパラメータを試す
+        child = node.children.get(segment)
+        if child is not None:
+            found = self._find(child, segments, index + 1, params)
+            if found is not None:
+                return found
+
+        for name, converter, child in node.param_children:
+            is_valid, convert = CONVERTERS[converter]
+            if not is_valid(segment):
+                continue
+            found = self._find(child, segments, index + 1, params)
+            if found is not None:
+                params[name] = convert(segment)
+                return found
+
+        return None
+
+
+def method_not_allowed(allowed: frozenset) -> Callable[[HTTPRequest], HTTPResponse]:
+    """
+    405 Method Not Allowedを返すViewを生成
+    """
+    def view(request: HTTPRequest) -> HTTPResponse:
+        return HTTPResponse(
+            status_code=405,
+            headers={"Allow": ", ".join(sorted(allowed))},
+            content_type="text/html; charset=utf-8",
+            body=b"<html><body><h1>405 Method Not Allowed</h1></body></html>",
+        )
+
+    return view
@@ -1,5 +1,7 @@
 import common.http.views as views
 from common.urls.pattern import URLPattern
+from common.views.metrics import metrics
+from common.views.response_cache import ResponseCache
 
 URL_VIEW = {
     "/now": views.now,
@@ -8,12 +10,18 @@ URL_VIEW = {
     "/user/<user_id>/profile": views.user_profile,
 }
 
+# パスパラメータは'<name>'(str)または'<int:name>'の形式で指定する
+# methodsを省略したURLパターンは、すべてのメソッドを受け付ける
+# cacheを指定したURLパターンは、Viewのレスポンスをttl秒の間キャッシュする
+# (vary_headers/vary_cookiesに指定したヘッダーとCookieの値ごとに、別のレスポンスとして保存する)
 url_patterns = [
-    URLPattern("/now", views.now),
+    URLPattern("/now", views.now, methods=["GET"], cache=ResponseCache(ttl=1.0)),
     URLPattern("/show_request", views.show_request),
-    URLPattern("/parameters", views.parameters),
-    URLPattern("/user/<user_id>/profile", views.user_profile),
-    URLPattern("/set_cookie", views.set_cookie),
-    URLPattern("/login", views.login),
-    URLPattern("/welcome", views.welcome)
+    URLPattern("/parameters", views.parameters, methods=["POST"]),
+    URLPattern("/user/<user_id>/profile", views.user_profile, methods=["GET"], cache=ResponseCache(ttl=10.0)),
+    URLPattern("/set_cookie", views.set_cookie, methods=["GET"]),
+    URLPattern("/login", views.login, methods=["GET", "POST"]),
+    URLPattern("/welcome", views.welcome, methods=["GET"]),
+    URLPattern("/events", views.events, methods=["GET"]),
+    URLPattern("/metrics", metrics, methods=["GET"]),
 ]
\ No newline at end of file
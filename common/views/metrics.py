@@ -0,0 +1,14 @@
+from common.http.request import HTTPRequest
+from common.http.response import HTTPResponse
+from common.server.metrics import metrics as server_metrics
+
+
+def metrics(request: HTTPRequest) -> HTTPResponse:
+    """
+    ルートごとの処理時間とリクエスト数を、Prometheusのテキスト形式で返す
+    """
+    return HTTPResponse(
+        headers={"Cache-Control": "no-store"},
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+        body=server_metrics.render(),
+    )
@@ -0,0 +1,217 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import settings
+from common.http.compression import negotiate_encoding
+from common.http.request import HTTPRequest
+from common.http.response import FileResponse, HTTPResponse
+
+# キャッシュするメソッド
+CACHEABLE_METHODS = frozenset(("GET", "HEAD"))
+# Cache-Controlにこれらを含むレスポンスはキャッシュしない
+UNCACHEABLE_DIRECTIVES = ("no-store", "private")
+
+# (メソッド, パス, クエリ文字列, 圧縮方式, ヘッダーの値, Cookieの値)
+CacheKey = Tuple[str, str, str, Optional[str], Tuple[Optional[str], ...], Tuple[Optional[str], ...]]
+
+# 作成したレスポンスキャッシュ (メトリクスで集計する)
+response_caches: List["ResponseCache"] = []
+
+
+class CachedResponse:
+    """
+    送信できる状態に整えたレスポンスの内容
+    ヒットするたびに新しいHTTPResponseを作り、キャッシュした内容がリクエストの処理中に書き換えられないようにする
+    """
+    __slots__ = ("status_code", "headers", "content_type", "body", "size", "expires_at")
+
+    def __init__(self, response: HTTPResponse, expires_at: float):
+        self.status_code = response.status_code
+        self.headers = dict(response.headers)
+        self.content_type = response.content_type
+        body = response.body
+        self.body: Union[bytes, Tuple[bytes, ...]] = tuple(body) if isinstance(body, list) else bytes(body)
+        self.size = response.content_length + sum(len(k) + len(str(v)) for k, v in self.headers.items())
+        self.expires_at = expires_at
+
+    def to_response(self) -> HTTPResponse:
+        body = list(self.body) if isinstance(self.body, tuple) else self.body
+        return HTTPResponse(
+            status_code=self.status_code,
+            headers=dict(self.headers),
+            content_type=self.content_type,
+            body=body,
+        )
+
+
+class ResponseCache:
+    """
+    1つのURLパターンのViewのレスポンスを、TTLと合計サイズの上限付きでLRU方式でキャッシュする
+    キーはメソッド、パス(パスパラメータを含む)、クエリ文字列、選択したヘッダーとCookieの値、および圧縮方式
+    キャッシュにないキーを同時に要求された場合は1つのスレッドだけがViewを呼び出し、他のスレッドはその結果を待つ
+    GET/HEADに対する200のレスポンスのうち、Cookieを設定せず、セッションにも触れなかったものだけをキャッシュする
+    """
+    ttl: float
+    vary_headers: Tuple[str, ...]
+    vary_cookies: Tuple[str, ...]
+    max_entries: int
+    max_bytes: int
+    route: str
+
+    def __init__(
+            self,
+            ttl: float,
+            vary_headers: Iterable[str] = (),
+            vary_cookies: Iterable[str] = (),
+            max_entries: Optional[int] = None,
+            max_bytes: Optional[int] = None,
+    ):
+        if ttl <= 0:
+            raise ValueError("ttl must be positive")
+        self.ttl = ttl
+        self.vary_headers = tuple(vary_headers)
+        self.vary_cookies = tuple(vary_cookies)
+        self.max_entries = settings.RESPONSE_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = settings.RESPONSE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        # URLPatternに渡したときに、そのURLパターンが設定される (メトリクスのラベルに使う)
+        self.route = ""
+
+        self._entries: "OrderedDict[CacheKey, CachedResponse]" = OrderedDict()
+        # Viewを呼び出し中のキーと、完了を待つためのイベント
+        self._inflight: Dict[CacheKey, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+        response_caches.append(self)
+
+    def key(self, request: HTTPRequest) -> Optional[CacheKey]:
+        """
+        リクエストのキャッシュのキーを返却する。キャッシュしないメソッドの場合はNone
+        """
+        if request.method not in CACHEABLE_METHODS:
+            return None
+        encoding = None
+        if settings.COMPRESSION_ENABLED:
+            # 圧縮したボディをそのままキャッシュするため、Accept-Encodingの値ではなく選ばれる方式で区別する
+            encoding = negotiate_encoding(request.get_header("Accept-Encoding"))
+        headers = tuple(request.get_header(name) for name in self.vary_headers)
+        cookies = tuple(request.cookies.get(name) for name in self.vary_cookies) if self.vary_cookies else ()
+        return request.method, request.path, request.query_string, encoding, headers, cookies
+
+    def get_or_render(
+            self,
+            request: HTTPRequest,
+            render: Callable[[Callable, HTTPRequest], HTTPResponse],
+            view: Callable[[HTTPRequest], HTTPResponse],
+    ) -> HTTPResponse:
+        """
+        キャッシュしたレスポンスを返却する
+        キャッシュにない場合はrender(view, request)でレスポンスを生成し、キャッシュできるものであれば保存する
+        """
+        key = self.key(request)
+        if key is None:
+            return render(view, request)
+
+        with self._lock:
+            cached = self._lookup_locked(key)
+            if cached is not None:
+                self._hits += 1
+                return cached.to_response()
+            waiter = self._inflight.get(key)
+            if waiter is None:
+                # 最初に要求したスレッドがViewを呼び出す
+                waiter = self._inflight[key] = threading.Event()
+                self._misses += 1
+                leader = True
+            else:
+                self._coalesced += 1
+                leader = False
+
+        if not leader:
+            # 他のスレッドの生成を待ち、その結果を使う
+            # 時間内に終わらない場合や、キャッシュできないレスポンスだった場合は自分で生成する
+            if waiter.wait(settings.RESPONSE_CACHE_WAIT_TIMEOUT):
+                with self._lock:
+                    cached = self._lookup_locked(key)
+                if cached is not None:
+                    return cached.to_response()
+            return render(view, request)
+
+        try:
+            response = render(view, request)
+            if self.is_cacheable(request, response):
+                self._store(key, CachedResponse(response, time.monotonic() + self.ttl))
+            return response
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            waiter.set()
+
+    @staticmethod
+    def is_cacheable(request: HTTPRequest, response: HTTPResponse) -> bool:
+        """
+        レスポンスを他のリクエストにも返してよいかを判定
+        """
+        if response.status_code != 200 or isinstance(response, FileResponse) or response.is_streaming:
+            return False
+        if response.cookies or request.loaded_session is not None:
+            # クライアントごとに異なる内容
+            return False
+        cache_control = response.headers.get("Cache-Control", "").lower()
+        return not any(directive in cache_control for directive in UNCACHEABLE_DIRECTIVES)
+
+    def clear(self):
+        """
+        キャッシュをすべて破棄する
+        """
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> dict:
+        """
+        キャッシュの状態を返却
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "coalesced": self._coalesced,
+                "evictions": self._evictions,
+            }
+
+    def _lookup_locked(self, key: CacheKey) -> Optional[CachedResponse]:
+        cached = self._entries.get(key)
+        if cached is None:
+            return None
+        if cached.expires_at <= time.monotonic():
+            self._remove_locked(key)
+            return None
+        self._entries.move_to_end(key)
+        return cached
+
+    def _store(self, key: CacheKey, cached: CachedResponse):
+        if cached.size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove_locked(key)
+            self._entries[key] = cached
+            self._total_bytes += cached.size
+            # 上限を超えた分だけ、最も長く使われていないレスポンスから追い出す
+            while self._total_bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted.size
+                self._evictions += 1
+
+    def _remove_locked(self, key: CacheKey):
+        cached = self._entries.pop(key, None)
+        if cached is not None:
+            self._total_bytes -= cached.size
@@ -1,33 +1,91 @@
 import os
-import traceback
+from email.utils import parsedate_to_datetime
+from typing import Optional, Tuple
 
 import settings
+from common.http.compression import add_vary, is_compressible, negotiate_encoding
 from common.http.request import HTTPRequest
-from common.http.response import HTTPResponse
+from common.http.response import FileResponse, HTTPResponse
+from common.server.logger import logger
+from common.views.static_cache import StaticFile, static_file_cache
 
 
 def static(request: HTTPRequest) -> HTTPResponse:
     """
     静的ファイルからレスポンスを取得
+    小さいファイルはメモリ上のキャッシュから返し、大きいファイルは送信時にsendfileでsocketへ書き出す
+    HTMLやCSSなどは、Accept-Encodingに応じて圧縮済みの内容(大きいファイルは事前に用意した.gz)を返す
+    If-None-Match/If-Modified-Sinceが一致する場合は304 Not Modified、
+    Rangeヘッダーが指定された場合は、その範囲だけを206 Partial Contentで返す
     """
     try:
         static_root = getattr(settings, "STATIC_ROOT")
 
         # pathの先頭の/を削除し、相対パスに変換
         relative_path = request.path.lstrip("/")
-        static_file_path = os.path.join(static_root, relative_path)
+        static_file_path = os.path.normpath(os.path.join(static_root, relative_path))
 
-        with open(static_file_path, "rb") as f:
-            response_body = f.read()
+        # STATIC_ROOTの外にあるファイルは返さない
+        if not static_file_path.startswith(os.path.join(static_root, "")):
+            raise FileNotFoundError(static_file_path)
 
-        content_type = None
-        return HTTPResponse(
-            status_code=200,
-            content_type=content_type,
-            body=response_body,
-        )
+        static_file = static_file_cache.get(static_file_path)
+        if static_file is None:
+            raise FileNotFoundError(static_file_path)
+
+        headers = {
+            "Accept-Ranges": "bytes",
+            "Last-Modified": static_file.last_modified,
+            "Cache-Control": settings.STATIC_CACHE_CONTROL,
+        }
+
+        range_header = request.get_header("Range")
+        if_range = request.get_header("If-Range")
+        if if_range is not None and if_range != static_file.etag and if_range != static_file.last_modified:
+            # If-Rangeが現在のファイルと一致しない場合は、ファイル全体を返す
+            range_header = None
+
+        content_type = static_file.content_type
+        encoding = None
+        if settings.COMPRESSION_ENABLED and is_compressible(content_type):
+            add_vary(headers)
+            # Rangeは圧縮していない内容に対して適用する
+            if range_header is None:
+                encoding = select_encoding(request, static_file)
+        headers["ETag"] = static_file.etag_for(encoding)
+
+        if is_not_modified(request, static_file, headers["ETag"]):
+            return HTTPResponse(
+                status_code=304,
+                headers=headers,
+            )
+
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+            return compressed_response(static_file, encoding, content_type, headers)
+
+        byte_range = None
+        if range_header is not None:
+            # 解釈できない、または複数範囲の指定は無視してファイル全体を返す
+            byte_range = parse_range(range_header, static_file.size)
+
+        if byte_range is None:
+            return file_response(static_file, 0, static_file.size, 200, headers)
+
+        start, end = byte_range
+        if start >= static_file.size:
+            headers["Content-Range"] = f"bytes */{static_file.size}"
+            return HTTPResponse(
+                status_code=416,
+                headers=headers,
+                content_type="text/html; charset=utf-8",
+                body=b"<html><body><h1>416 Range Not Satisfiable</h1></body></html>",
+            )
+
+        headers["Content-Range"] = f"bytes {start}-{end}/{static_file.size}"
+        return file_response(static_file, start, end - start + 1, 206, headers)
     except FileNotFoundError:
-        traceback.print_exc()
+        logger.debug("static", "File not found", path=request.path)
 
         response_body = b"<html><body><h1>404 Not Found</h1></body></html>"
         content_type = "text/html;"
@@ -35,4 +93,134 @@ def static(request: HTTPRequest) -> HTTPResponse:
             status_code=404,
             content_type=content_type,
             body=response_body,
-        )
\ No newline at end of file
+        )
+
+
+def select_encoding(request: HTTPRequest, static_file: StaticFile) -> Optional[str]:
+    """
+    静的ファイルを圧縮して返す場合の圧縮方式を選ぶ。圧縮しない場合はNone
+    キャッシュ済みのファイルはその場で圧縮し、キャッシュしていない大きなファイルは.gzがある場合のみ圧縮して返す
+    """
+    accept_encoding = request.get_header("Accept-Encoding")
+    if static_file.content is None:
+        if negotiate_encoding(accept_encoding, available=["gzip"]) is None:
+            return None
+        if static_file_cache.get(static_file.path + ".gz") is None:
+            return None
+        return "gzip"
+
+    if static_file.size < settings.COMPRESSION_MIN_SIZE:
+        return None
+    encoding = negotiate_encoding(accept_encoding)
+    if encoding is None:
+        return None
+    # 圧縮しても小さくならない場合は、そのまま返す
+    if len(static_file_cache.get_variant(static_file, encoding)) >= static_file.size:
+        return None
+    return encoding
+
+
+def compressed_response(static_file: StaticFile, encoding: str, content_type: str, headers: dict) -> HTTPResponse:
+    """
+    select_encodingで選んだ圧縮方式の内容を返すレスポンスを生成
+    """
+    if static_file.content is None:
+        # 事前に用意された.gzをsendfileで送信する
+        return FileResponse(
+            static_file.path + ".gz",
+            status_code=200,
+            headers=headers,
+            content_type=content_type,
+        )
+
+    return HTTPResponse(
+        status_code=200,
+        headers=headers,
+        content_type=content_type,
+        body=static_file_cache.get_variant(static_file, encoding),
+    )
+
+
+def file_response(
+        static_file: StaticFile,
+        offset: int,
+        length: int,
+        status_code: int,
+        headers: dict,
+) -> HTTPResponse:
+    """
+    キャッシュ済みの内容があればそれをボディとし、なければsendfileで送信するレスポンスを生成
+    """
+    if static_file.content is not None:
+        body = static_file.content
+        if offset != 0 or length != static_file.size:
+            body = body[offset:offset + length]
+        return HTTPResponse(
+            status_code=status_code,
+            headers=headers,
+            body=body,
+        )
+
+    return FileResponse(
+        static_file.path,
+        offset=offset,
+        length=length,
+        status_code=status_code,
+        headers=headers,
+    )
+
+
+def is_not_modified(request: HTTPRequest, static_file: StaticFile, etag: str) -> bool:
+    """
+    条件付きリクエストに対して、304 Not Modifiedを返せるかを判定
+    If-None-Matchが指定されている場合は、If-Modified-Sinceより優先する
+    """
+    if_none_match = request.get_header("If-None-Match")
+    if if_none_match is not None:
+        etags = [item.strip() for item in if_none_match.split(",")]
+        # 弱いETag (W/"...") も同じものとして比較する
+        return "*" in etags or etag in [item.removeprefix("W/") for item in etags]
+
+    if_modified_since = request.get_header("If-Modified-Since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # Last-Modifiedは秒単位のため、秒未満を切り捨てて比較する
+        return int(static_file.mtime) <= since
+
+    return False
+
+
+def parse_range(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Rangeヘッダー(bytes=start-end, bytes=start-, bytes=-suffix)を解釈し、
+    先頭と末尾のバイト位置(末尾を含む)を返却する
+    解釈できない場合や、複数の範囲が指定された場合はNoneを返す
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first == "":
+            # 末尾からsuffix bytes
+            suffix = int(last)
+            if suffix <= 0:
+                return None
+            return max(0, file_size - suffix), file_size - 1
+
+        start = int(first)
+        end = int(last) if last else None
+    except ValueError:
+        return None
+
+    if end is None:
+        return start, file_size - 1
+    if end < start:
+        return None
+    return start, min(end, file_size - 1)
@@ -0,0 +1,213 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+from stat import S_ISREG
+from typing import Dict, Optional, Tuple
+
+import settings
+from common.http.compression import COMPRESSORS, compress, is_compressible
+from common.http.mime import guess_content_type
+
+
+class StaticFile:
+    """
+    静的ファイルのメタデータと、キャッシュしている場合はその内容
+    """
+    path: str
+    size: int
+    mtime: float
+    mtime_ns: int
+    etag: str
+    last_modified: str
+    content_type: str
+    content: Optional[bytes]
+    variants: Dict[str, bytes]
+    checked_at: float
+
+    def __init__(self, path: str, stat: os.stat_result, content: Optional[bytes] = None):
+        self.path = path
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.mtime_ns = stat.st_mtime_ns
+        self.etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.content_type = guess_content_type(path)
+        self.content = content
+        # 圧縮方式ごとに圧縮済みの内容
+        self.variants = {}
+        self.checked_at = time.monotonic()
+
+    def etag_for(self, encoding: Optional[str]) -> str:
+        """
+        圧縮方式ごとに異なるETagを返却する
+        """
+        if encoding is None:
+            return self.etag
+        return f'{self.etag[:-1]}-{encoding}"'
+
+    def is_modified(self, stat: os.stat_result) -> bool:
+        """
+        キャッシュした時点から、ファイルが更新されたかを判定
+        """
+        return stat.st_mtime_ns != self.mtime_ns or stat.st_size != self.size
+
+
+class StaticFileCache:
+    """
+    静的ファイルの内容を、合計サイズの上限付きでLRU方式でキャッシュする
+    ファイルの更新はmtimeで検知するが、statは同じファイルにつき
+    STATIC_CACHE_CHECK_INTERVAL秒に1回だけ行い、それまではディスクに触れずに返す
+    STATIC_CACHE_MAX_FILE_SIZEを超えるファイルは内容を保持せず、メタデータのみをキャッシュする
+    """
+    max_bytes: int
+    max_file_size: int
+    check_interval: float
+
+    def __init__(self, max_bytes: int, max_file_size: int, check_interval: float):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.check_interval = check_interval
+
+        self._entries: "OrderedDict[str, StaticFile]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, path: str) -> Optional[StaticFile]:
+        """
+        pathのファイルを返却する。ファイルが存在しない場合はNone
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and time.monotonic() - entry.checked_at < self.check_interval:
+                self._entries.move_to_end(path)
+                self._hits += 1
+                return entry
+
+        try:
+            stat = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            stat = None
+        if stat is None or not S_ISREG(stat.st_mode):
+            # ファイルが削除されたか、ディレクトリなどの通常ファイル以外
+            self._remove(path)
+            return None
+
+        if entry is not None and not entry.is_modified(stat):
+            with self._lock:
+                entry.checked_at = time.monotonic()
+                if path in self._entries:
+                    self._entries.move_to_end(path)
+                self._hits += 1
+            return entry
+
+        content = None
+        if stat.st_size <= self.max_file_size:
+            with open(path, "rb") as f:
+                content = f.read()
+        entry = StaticFile(path, stat, content)
+
+        with self._lock:
+            self._misses += 1
+            self._remove_locked(path)
+            self._entries[path] = entry
+            self._total_bytes += self._entry_bytes(entry)
+            self._evict_locked()
+
+        return entry
+
+    def get_variant(self, entry: StaticFile, encoding: str) -> bytes:
+        """
+        キャッシュ済みの内容を圧縮したものを返却する
+        圧縮は方式ごとに1回だけ行い、結果はキャッシュの合計サイズに含める
+        """
+        variant = entry.variants.get(encoding)
+        if variant is not None:
+            return variant
+
+        variant = compress(entry.content, encoding)
+        with self._lock:
+            if encoding not in entry.variants and self._entries.get(entry.path) is entry:
+                entry.variants[encoding] = variant
+                self._total_bytes += len(variant)
+                self._evict_locked()
+        return variant
+
+    def preload(self, root: str) -> Tuple[int, int]:
+        """
+        root以下のファイルのメタデータ(サイズ、mtime、MIMEタイプ、ETag)と内容をキャッシュに載せ、
+        圧縮の対象になるファイルは、対応するすべての圧縮方式で圧縮しておく
+        合計サイズの上限に達したら、それ以降のファイルは最初のリクエストで読み込む
+        載せたファイルの数と、キャッシュの合計サイズを返却する
+        """
+        count = 0
+        for current, _, files in os.walk(root):
+            for file_name in sorted(files):
+                with self._lock:
+                    if self._total_bytes >= self.max_bytes:
+                        return count, self._total_bytes
+                entry = self.get(os.path.join(current, file_name))
+                if entry is None:
+                    continue
+                count += 1
+                if (
+                        settings.COMPRESSION_ENABLED
+                        and entry.content is not None
+                        and entry.size >= settings.COMPRESSION_MIN_SIZE
+                        and is_compressible(entry.content_type)
+                ):
+                    for encoding in COMPRESSORS:
+                        self.get_variant(entry, encoding)
+        with self._lock:
+            return count, self._total_bytes
+
+    def clear(self):
+        """
+        キャッシュをすべて破棄する
+        """
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> dict:
+        """
+        キャッシュの状態を返却
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+    def _remove(self, path: str):
+        with self._lock:
+            self._remove_locked(path)
+
+    def _remove_locked(self, path: str):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._total_bytes -= self._entry_bytes(entry)
+
+    def _evict_locked(self):
+        # 上限を超えた分だけ、最も長く使われていないファイルから追い出す
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._total_bytes -= self._entry_bytes(evicted)
+
+    @staticmethod
+    def _entry_bytes(entry: StaticFile) -> int:
+        size = len(entry.content) if entry.content is not None else 0
+        return size + sum(len(variant) for variant in entry.variants.values())
+
+
+static_file_cache = StaticFileCache(
+    max_bytes=settings.STATIC_CACHE_MAX_BYTES,
+    max_file_size=settings.STATIC_CACHE_MAX_FILE_SIZE,
+    check_interval=settings.STATIC_CACHE_CHECK_INTERVAL,
+)
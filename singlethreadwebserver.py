@@ -122,7 +122,7 @@ class SingleThreadWebServer:
             "Server: DemoServer\r\n"
             f"Content-Length: {content_length}\r\n"
             "Connection: close\r\n"
-            f"Content-Type: {self.MIME_TYPES.get(extension, "application/octet-stream")}\r\n"
+            f"Content-Type: {self.MIME_TYPES.get(extension, 'application/octet-stream')}\r\n"
         )
         return header
     
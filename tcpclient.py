@@ -4,6 +4,23 @@ class TCPClient:
     """
     TCP通信を行うクライアントを表すクラス
     """
+    host: str
+    port: int
+
+    def __init__(self, host: str = "localhost", port: int = 80):
+        self.host = host
+        self.port = port
+
+    def connect(self, timeout: float = None) -> socket.socket:
+        """
+        サーバに接続したsocketを返却
+        """
+        client_socket = socket.socket()
+        client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        client_socket.settimeout(timeout)
+        client_socket.connect((self.host, self.port))
+        return client_socket
+
     def request(self):
         """
         サーバへリクエストを送信
@@ -12,13 +29,9 @@ class TCPClient:
         print("=== Starting TCP Client ===")
 
         try:
-            # socketを作成
-            client_socket = socket.socket()
-            client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-
             # サーバに接続
             print("=== Connecting to the server ===")
-            client_socket.connect(("localhost", 80))
+            client_socket = self.connect()
             print("=== Connected to the server ===")
 
             # リクエストデータをファイルから読み込む
@@ -0,0 +1,57 @@
+import os
+import sys
+import unittest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+sys.path.append(os.path.join(BASE_DIR, "common"))
+
+import settings
+from common.http.body import RequestBody, RequestError, parse_multipart, parse_urlencoded
+
+
+def multipart(*values: bytes) -> RequestBody:
+    body = b"".join(
+        b'--B\r\nContent-Disposition: form-data; name="field"\r\n\r\n' + value + b"\r\n"
+        for value in values
+    )
+    return RequestBody.from_bytes(body + b"--B--\r\n")
+
+
+class FormLimitTest(unittest.TestCase):
+    """
+    フォームのフィールドをメモリに持つ量に上限があることを確認する
+    """
+
+    def assert_too_large(self, parse):
+        with self.assertRaises(RequestError) as cm:
+            parse()
+        self.assertEqual(cm.exception.status_code, 413)
+
+    def test_urlencoded(self):
+        body = RequestBody.from_bytes(b"a=1&b=" + b"x" * 100000 + b"&a=2")
+        self.assertEqual(parse_urlencoded(body), {"a": ["1", "2"], "b": ["x" * 100000]})
+
+    def test_urlencoded_field_too_large(self):
+        body = RequestBody.from_bytes(b"a=" + b"x" * settings.FORM_MAX_FIELD_SIZE)
+        self.assert_too_large(lambda: parse_urlencoded(body))
+
+    def test_urlencoded_too_many_fields(self):
+        body = RequestBody.from_bytes(b"&".join([b"a=1"] * (settings.FORM_MAX_FIELDS + 1)))
+        self.assert_too_large(lambda: parse_urlencoded(body))
+
+    def test_multipart(self):
+        fields, files = parse_multipart(multipart(b"1", b"x" * 100000), b"B")
+        self.assertEqual(fields, {"field": ["1", "x" * 100000]})
+
+    def test_multipart_field_too_large(self):
+        body = multipart(b"x" * (settings.FORM_MAX_FIELD_SIZE + 1))
+        self.assert_too_large(lambda: parse_multipart(body, b"B"))
+
+    def test_multipart_too_many_parts(self):
+        body = multipart(*[b"1"] * (settings.FORM_MAX_FIELDS + 1))
+        self.assert_too_large(lambda: parse_multipart(body, b"B"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import socket
+import sys
+import threading
+import unittest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+sys.path.append(os.path.join(BASE_DIR, "common"))
+
+from common.server.async_server import AsyncServer
+from common.server.server import Server
+
+
+def start(server) -> int:
+    """
+    空いているポートでサーバをバックグラウンドで起動し、ポート番号を返却する
+    """
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.bind(("127.0.0.1", 0))
+    server_socket.listen(16)
+    threading.Thread(target=server.serve, args=(server_socket,), daemon=True).start()
+    return server_socket.getsockname()[1]
+
+
+def request(port: int, data: bytes) -> bytes:
+    """
+    リクエストをそのまま送信し、サーバが接続を閉じるまでのレスポンスを返却する
+    """
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as client_socket:
+        client_socket.sendall(data)
+        received = b""
+        while True:
+            chunk = client_socket.recv(65536)
+            if not chunk:
+                return received
+            received += chunk
+
+
+class PipelinedHeadTest(unittest.TestCase):
+    """
+    HEADのレスポンスにボディが含まれず、keep-aliveで続くレスポンスが崩れないことを確認する
+    """
+    PIPELINE = (
+        b"HEAD /index.css HTTP/1.1\r\nHost: localhost\r\n\r\n"
+        b"GET /now HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n"
+    )
+
+    def assert_head_then_get(self, port: int):
+        received = request(port, self.PIPELINE)
+        head_response, _, rest = received.partition(b"\r\n\r\n")
+        self.assertTrue(head_response.startswith(b"HTTP/1.1 200"), head_response)
+        self.assertIn(b"Content-Length:", head_response)
+        # HEADのヘッダーの直後に、次のレスポンスのステータスラインが続く
+        self.assertTrue(rest.startswith(b"HTTP/1.1 200"), rest[:80])
+
+    def test_threaded(self):
+        self.assert_head_then_get(start(Server()))
+
+    def test_asyncio(self):
+        self.assert_head_then_get(start(AsyncServer()))
+
+
+if __name__ == "__main__":
+    unittest.main()
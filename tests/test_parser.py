@@ -0,0 +1,54 @@
+import os
+import sys
+import unittest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+sys.path.append(os.path.join(BASE_DIR, "common"))
+
+from common.server.parser import parse_request
+from common.server.reader import RequestError
+
+
+def head(*header_lines: bytes) -> bytes:
+    return b"POST / HTTP/1.1\r\n" + b"".join(line + b"\r\n" for line in header_lines) + b"\r\n"
+
+
+class BodyLengthTest(unittest.TestCase):
+    """
+    ボディの長さが一意に決まらないリクエストを拒否することを確認する
+    """
+
+    def assert_rejected(self, data: bytes):
+        with self.assertRaises(RequestError) as cm:
+            parse_request(data)
+        self.assertEqual(cm.exception.status_code, 400)
+
+    def test_conflicting_content_length(self):
+        self.assert_rejected(head(b"Content-Length: 5", b"Content-Length: 6"))
+
+    def test_identical_content_length(self):
+        request = parse_request(head(b"Content-Length: 5", b"Content-Length: 5"))
+        self.assertEqual(request.headers.get_raw("Content-Length"), b"5")
+
+    def test_transfer_encoding_with_content_length(self):
+        self.assert_rejected(head(b"Transfer-Encoding: chunked", b"Content-Length: 5"))
+        self.assert_rejected(head(b"Content-Length: 5", b"Transfer-Encoding: chunked"))
+
+    def test_multiple_transfer_encoding(self):
+        self.assert_rejected(head(b"Transfer-Encoding: chunked", b"Transfer-Encoding: chunked"))
+        self.assert_rejected(head(b"Transfer-Encoding: gzip", b"Transfer-Encoding: chunked"))
+
+    def test_unsupported_transfer_encoding(self):
+        for value in (b"gzip", b"identity", b"gzip, chunked", b"chunked, gzip", b"chunked, chunked"):
+            with self.subTest(value=value), self.assertRaises(RequestError) as cm:
+                parse_request(head(b"Transfer-Encoding: " + value))
+            self.assertEqual(cm.exception.status_code, 501)
+
+    def test_chunked(self):
+        request = parse_request(head(b"Transfer-Encoding: Chunked"))
+        self.assertEqual(request.headers.get_raw("Transfer-Encoding"), b"Chunked")
+
+
+if __name__ == "__main__":
+    unittest.main()
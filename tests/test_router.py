@@ -0,0 +1,29 @@
+import os
+import sys
+import unittest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+sys.path.append(os.path.join(BASE_DIR, "common"))
+
+from common.urls.pattern import URLPattern
+from common.urls.router import URLRouter
+
+
+class IntConverterTest(unittest.TestCase):
+    """
+    木構造のルーターと正規表現のURLPattern.matchが、同じpathを受け付けることを確認する
+    """
+
+    def test_ascii_digits_only(self):
+        url_pattern = URLPattern("/item/<int:item_id>", lambda request: None)
+        router = URLRouter([url_pattern])
+        for path in ("/item/12", "/item/²", "/item/①", "/item/٣"):
+            with self.subTest(path=path):
+                matched, params, _ = router.match("GET", path)
+                self.assertEqual(matched is not None, url_pattern.match(path) is not None)
+        self.assertEqual(router.match("GET", "/item/12")[1], {"item_id": 12})
+
+
+if __name__ == "__main__":
+    unittest.main()
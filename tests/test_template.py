@@ -0,0 +1,27 @@
+import os
+import sys
+import unittest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+sys.path.append(os.path.join(BASE_DIR, "common"))
+
+from common.templates.engine import Template, TemplateSyntaxError
+
+
+class TemplateTest(unittest.TestCase):
+
+    def test_loop_variable_does_not_hide_context_outside_loop(self):
+        template = Template("{% for i in xs %}[{{ i }}]{% endfor %}{{ i }}")
+        self.assertEqual(template.render({"xs": [], "i": "g"}), "g")
+        self.assertEqual(template.render({"xs": [1, 2], "i": "g"}), "[1][2]g")
+
+    def test_bitwise_or_is_not_a_filter(self):
+        self.assertEqual(Template("{{ a | b }}").render({"a": 1, "b": 2}), "3")
+        self.assertEqual(Template("{{ a | upper }}").render({"a": "x"}), "X")
+        with self.assertRaises(TemplateSyntaxError):
+            Template("{{ a|b }}")
+
+
+if __name__ == "__main__":
+    unittest.main()
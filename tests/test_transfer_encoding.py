@@ -0,0 +1,37 @@
+import os
+import sys
+import unittest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+sys.path.append(os.path.join(BASE_DIR, "common"))
+
+from common.server.async_server import AsyncServer
+from common.server.server import Server
+from test_head import request, start
+
+
+class UnknownTransferEncodingTest(unittest.TestCase):
+    """
+    chunkedで終わらないTransfer-Encodingのボディを、次のリクエストとして扱わないことを確認する
+    """
+    PIPELINE = (
+        b"POST /parameters HTTP/1.1\r\nHost: localhost\r\nTransfer-Encoding: gzip\r\n\r\n"
+        b"GET /now HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n"
+    )
+
+    def assert_rejected(self, port: int):
+        received = request(port, self.PIPELINE)
+        self.assertTrue(received.startswith(b"HTTP/1.1 501"), received[:80])
+        # ボディとして送ったGETには応答せず、接続を閉じる
+        self.assertEqual(received.count(b"HTTP/1.1 "), 1, received)
+
+    def test_threaded(self):
+        self.assert_rejected(start(Server()))
+
+    def test_asyncio(self):
+        self.assert_rejected(start(AsyncServer()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,6 @@
 import os
 import socket
+import time
 from datetime import datetime
 import traceback
 from typing import Tuple
@@ -7,6 +8,7 @@ from threading import Thread
 
 from common.http.request import HTTPRequest
 from common.http.response import HTTPResponse
+from common.server.access_log import access_log
 from common.urls.urls import URL_VIEW
 
 class WorkerThread(Thread):
@@ -41,16 +43,21 @@ class WorkerThread(Thread):
         try:
 
             request_bytes = self.client_socket.recv(4096)
-
-            # クライアントから送られてきたデータをファイルに書き出す
-            with open("server_recv.txt", "wb") as f:
-                f.write(request_bytes)
+            started = time.monotonic()
 
             request = self.parse_http_request(request_bytes)
 
             if request.path in URL_VIEW:
                 view = URL_VIEW[request.path]
                 response = view(request)
+                # 文字列やチャンクのリストで返されたボディを、送信できるバイト列にする
+                if isinstance(response.body, str):
+                    response.body = response.body.encode()
+                elif isinstance(response.body, (list, tuple)):
+                    response.body = b"".join(
+                        chunk.encode() if isinstance(chunk, str) else chunk
+                        for chunk in response.body
+                    )
 
             # pathがnow, show_request, parameter以外の場合、静的ファイルからレスポンスを生成
             else:
@@ -77,6 +84,8 @@ class WorkerThread(Thread):
             response_bytes = (response_header + "\r\n").encode() + response.body
             
             self.client_socket.send(response_bytes)
+            # 受信したリクエストは、ファイルへ直接書き出さずにアクセスログへ渡す
+            access_log.log(self.address, request, response, started, request_bytes)
         except Exception as e:
             print(f"=== [Worker] Error: {e} ===")
             traceback.print_exc()